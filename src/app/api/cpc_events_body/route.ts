@@ -0,0 +1,48 @@
+import { NextRequest, NextResponse } from "next/server";
+import { createClient } from "@supabase/supabase-js";
+
+const supabase = createClient(
+  process.env.NEXT_PUBLIC_SUPABASE_URL!,
+  process.env.NEXT_PUBLIC_SUPABASE_ANON_KEY!
+);
+
+/**
+ * GET /api/cpc_events_body?source_hash=HASH
+ *  - body do evento, buscado sob demanda em bulletin_bodies
+ *    (cpc_events guarda só o source_hash)
+ */
+export async function GET(req: NextRequest) {
+  const sourceHash = req.nextUrl.searchParams.get("source_hash");
+  if (!sourceHash) {
+    return NextResponse.json(
+      { success: false, error: "source_hash obrigatório" },
+      { status: 400 }
+    );
+  }
+
+  try {
+    const { data, error } = await supabase
+      .from("bulletin_bodies")
+      .select("body_text")
+      .eq("source_hash", sourceHash)
+      .maybeSingle();
+
+    if (error) {
+      console.error("❌ Erro ao buscar body:", error.message);
+      return NextResponse.json({ success: false, error: error.message }, { status: 500 });
+    }
+    if (!data) {
+      return NextResponse.json({ success: false, error: "body não encontrado" }, { status: 404 });
+    }
+
+    return NextResponse.json(
+      { success: true, source_hash: sourceHash, body_text: data.body_text },
+      // conteúdo endereçado por hash: nunca muda para a mesma chave
+      { headers: { "Cache-Control": "public, max-age=31536000, immutable" } }
+    );
+  } catch (err: unknown) {
+    const errorMessage = err instanceof Error ? err.message : String(err);
+    console.error("🔥 Erro inesperado no /cpc_events_body:", errorMessage);
+    return NextResponse.json({ success: false, error: errorMessage }, { status: 500 });
+  }
+}
@@ -26,8 +26,10 @@ export async function POST(req: Request) {
     const supabaseUrl = process.env.SUPABASE_URL;
     const serviceKey = process.env.SUPABASE_SERVICE_KEY;
     const githubToken = process.env.GITHUB_TOKEN;
+    // parser_worker.py rodando: a linha ready é atendida sem workflow
+    const daemon = process.env.PARSER_DAEMON === "1";
 
-    if (!supabaseUrl || !serviceKey || !githubToken) {
+    if (!supabaseUrl || !serviceKey || (!githubToken && !daemon)) {
       return NextResponse.json(
         {
           success: false,
@@ -55,6 +57,9 @@ export async function POST(req: Request) {
           parser_profile,
           parser_status: "ready",
           parser_parsed_at: null,
+          // faixa prioritária: passa na frente do backlog (parser_queue)
+          parser_priority: 2,
+          parser_requested_at: new Date().toISOString(),
           parser_error: null,
         }),
       },
@@ -68,6 +73,10 @@ export async function POST(req: Request) {
       );
     }
 
+    if (daemon) {
+      return NextResponse.json({ success: true, queued: true });
+    }
+
     // 2) Descobre o ID do workflow no GitHub
     const wfResp = await fetch(
       `https://api.github.com/repos/${GITHUB_REPO}/actions/workflows/${WORKFLOW_FILE}`,
@@ -1,7 +1,22 @@
 import { NextResponse } from "next/server";
 
-export async function POST() {
+// Arquivos a depurar: ?file=<nome> (repetível) ou corpo { files: [...] }.
+// Sem nenhum, o workflow reprocessa o bucket inteiro.
+async function requestedFiles(req: Request): Promise<string[]> {
+  const names = new URL(req.url).searchParams.getAll("file");
+  if (req.headers.get("content-type")?.includes("application/json")) {
+    const body = await req.json().catch(() => null);
+    if (Array.isArray(body?.files)) {
+      names.push(...body.files.filter((n: unknown): n is string => typeof n === "string"));
+    }
+  }
+  // um nome por linha no input files do depurar.yml
+  return Array.from(new Set(names.map((n) => n.trim()).filter((n) => n && !n.includes("\n"))));
+}
+
+export async function POST(req: Request) {
   try {
+    const files = await requestedFiles(req);
     const res = await fetch(
       "https://api.github.com/repos/hrosag/jumineresearch/actions/workflows/depurar.yml/dispatches",
       {
@@ -10,7 +25,9 @@ export async function POST() {
           Authorization: `Bearer ${process.env.GITHUB_TOKEN}`,
           "Content-Type": "application/json",
         },
-        body: JSON.stringify({ ref: "main" }),
+        body: JSON.stringify(
+          files.length ? { ref: "main", inputs: { files: files.join("\n") } } : { ref: "main" }
+        ),
       }
     );
 
@@ -19,7 +36,7 @@ export async function POST() {
       return NextResponse.json({ success: false, error: txt }, { status: 500 });
     }
 
-    return NextResponse.json({ success: true });
+    return NextResponse.json({ success: true, files });
   } catch (err) {
     return NextResponse.json(
       { success: false, error: String(err) },
@@ -10,6 +10,14 @@ const supabase =
     ? createClient(supabaseUrl, supabaseAnonKey)
     : null;
 
+// .txt.gz / .zip: robot_depurar descomprime em stream na ingestão
+function contentTypeFor(name: string): string {
+  const lower = name.toLowerCase();
+  if (lower.endsWith(".gz")) return "application/gzip";
+  if (lower.endsWith(".zip")) return "application/zip";
+  return "text/plain";
+}
+
 export async function POST(req: Request) {
   if (!supabase) {
     return NextResponse.json(
@@ -56,7 +64,7 @@ export async function POST(req: Request) {
         .from("uploads")
         .upload(uniqueName, buffer, {
           cacheControl: "3600",
-          contentType: file.type || "text/plain",
+          contentType: file.type || contentTypeFor(sanitizedName),
           upsert: false,
         });
 
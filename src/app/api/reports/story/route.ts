@@ -1,7 +1,7 @@
 // src/app/api/reports/story/route.ts
 import { NextRequest, NextResponse } from 'next/server'
 import { createClient } from '@supabase/supabase-js'
-import JSZip from 'jszip'
+import { ZipStreamWriter } from './zipStream'
 
 // -----------------------------------------------------------------------------
 // Conexão com o Supabase
@@ -11,10 +11,203 @@ const supabase = createClient(
   process.env.NEXT_PUBLIC_SUPABASE_ANON_KEY!
 )
 
+// zlib (deflate) no ZipStreamWriter
+export const runtime = 'nodejs'
+
+// linhas por página do Supabase / empresas por filtro `in` (limite de URL)
+const PAGE_SIZE = 1000
+const COMPANIES_PER_QUERY = 100
+// ids por filtro `in` ao buscar bodies das timelines (limite de URL)
+const IDS_PER_QUERY = 200
+
+type StoryRow = {
+  company: string
+  bulletin_date: string | null
+  bulletin_type: string | null
+  body_text: string | null
+}
+
+function storyText(rows: StoryRow[]): string {
+  return rows
+    .map(r => `${r.bulletin_date} — ${r.bulletin_type}\n${r.body_text}\n`)
+    .join('\n--------------------------------\n')
+}
+
+function storyFilename(company: string, rows: StoryRow[]): string {
+  const safe = company.replace(/[^a-z0-9]/gi, '_')
+  const lastDate = rows[rows.length - 1].bulletin_date ?? 'unknown'
+  return `${safe}__story_until_${lastDate}.txt`
+}
+
+type TimelineBulletin = {
+  id: number
+  bulletin_date: string | null
+  bulletin_type: string | null
+}
+
+type Timeline = {
+  company: string
+  bulletins: TimelineBulletin[]
+}
+
+/**
+ * Timelines pré-computadas (company_timelines) dos nomes pedidos: a ordem
+ * dos bulletins já vem pronta, sem agregar all_data por empresa.
+ */
+async function fetchTimelines(companies: string[]): Promise<Map<string, Timeline> | Error> {
+  const { data, error } = await supabase.rpc('company_timelines_for', { p_companies: companies })
+  if (error) return new Error(error.message)
+  const out = new Map<string, Timeline>()
+  for (const t of (data ?? []) as Timeline[]) if (t.bulletins?.length) out.set(t.company, t)
+  return out
+}
+
+/** body_text por id (chave primária), paginado (cap de linhas do PostgREST). */
+async function fetchBodies(ids: number[]): Promise<Map<number, string | null> | Error> {
+  const bodies = new Map<number, string | null>()
+  for (let from = 0; ; from += PAGE_SIZE) {
+    const { data, error } = await supabase
+      .from('all_data')
+      .select('id, body_text')
+      .in('id', ids)
+      .order('id', { ascending: true })
+      .range(from, from + PAGE_SIZE - 1)
+    if (error) return new Error(error.message)
+    for (const r of data ?? []) bodies.set(r.id, r.body_text)
+    if (!data || data.length < PAGE_SIZE) break
+  }
+  return bodies
+}
+
+/**
+ * Linhas da história de todas as timelines do grupo, na ordem das
+ * timelines: os ids de todas entram nos mesmos lotes `in('id', ...)`, e
+ * cada lote vira uma página (cada empresa continua contígua).
+ */
+async function* timelineStoryRows(timelines: Timeline[]): AsyncGenerator<StoryRow[] | Error> {
+  const refs = timelines.flatMap(t => t.bulletins.map(b => ({ company: t.company, b })))
+  for (let i = 0; i < refs.length; i += IDS_PER_QUERY) {
+    const chunk = refs.slice(i, i + IDS_PER_QUERY)
+    const bodies = await fetchBodies([...new Set(chunk.map(r => r.b.id))])
+    if (bodies instanceof Error) {
+      yield bodies
+      return
+    }
+    const rows = chunk
+      .filter(r => bodies.has(r.b.id))
+      .map(({ company, b }) => ({
+        company,
+        bulletin_date: b.bulletin_date,
+        bulletin_type: b.bulletin_type,
+        body_text: bodies.get(b.id) ?? null
+      }))
+    if (rows.length) yield rows
+  }
+}
+
+/**
+ * Empresas ainda sem timeline (job não rodou desde a ingestão): filtro
+ * `in` direto em all_data, paginado e ordenado por empresa/data.
+ */
+async function* fetchAllDataRows(group: string[]): AsyncGenerator<StoryRow[] | Error> {
+  for (let from = 0; ; from += PAGE_SIZE) {
+    const { data, error } = await supabase
+      .from('all_data')
+      .select('company, bulletin_date, bulletin_type, body_text')
+      .in('company', group)
+      .order('company', { ascending: true })
+      .order('bulletin_date', { ascending: true })
+      .order('id', { ascending: true })
+      .range(from, from + PAGE_SIZE - 1)
+
+    if (error) {
+      yield new Error(error.message)
+      return
+    }
+    if (data?.length) yield data as StoryRow[]
+    if (!data || data.length < PAGE_SIZE) break
+  }
+}
+
+/**
+ * Todas as empresas pedidas, em grupos: as que têm timeline saem da linha
+ * pronta, as demais do all_data. Cada empresa chega contígua. Erro de
+ * consulta é devolvido como valor (Error) para o chamador decidir o status.
+ */
+async function* fetchStoryRows(companies: string[]): AsyncGenerator<StoryRow[] | Error> {
+  for (let i = 0; i < companies.length; i += COMPANIES_PER_QUERY) {
+    const group = companies.slice(i, i + COMPANIES_PER_QUERY)
+    const timelines = await fetchTimelines(group)
+    if (timelines instanceof Error) {
+      yield timelines
+      return
+    }
+    const found = group.flatMap(c => timelines.get(c) ?? [])
+    for await (const page of timelineStoryRows(found)) {
+      yield page
+      if (page instanceof Error) return
+    }
+    const missing = group.filter(c => !timelines.has(c))
+    if (missing.length) {
+      for await (const page of fetchAllDataRows(missing)) {
+        yield page
+        if (page instanceof Error) return
+      }
+    }
+  }
+}
+
+/**
+ * Agrupa as linhas numa passada e emite uma entrada do ZIP por empresa
+ * assim que a próxima empresa começa (só a empresa corrente em memória).
+ */
+function streamStoriesZip(
+  first: IteratorResult<StoryRow[] | Error>,
+  pages: AsyncGenerator<StoryRow[] | Error>
+): ReadableStream<Uint8Array> {
+  const zip = new ZipStreamWriter()
+
+  async function* chunks(): AsyncGenerator<Uint8Array> {
+    let current: string | null = null
+    let rows: StoryRow[] = []
+
+    for (let page = first; !page.done; page = await pages.next()) {
+      if (page.value instanceof Error) throw page.value
+      for (const r of page.value) {
+        if (r.company !== current) {
+          if (current !== null && rows.length) yield zip.entry(storyFilename(current, rows), storyText(rows))
+          current = r.company
+          rows = []
+        }
+        rows.push(r)
+      }
+    }
+    if (current !== null && rows.length) yield zip.entry(storyFilename(current, rows), storyText(rows))
+    yield zip.finish()
+  }
+
+  const it = chunks()
+  return new ReadableStream<Uint8Array>({
+    async pull(controller) {
+      try {
+        const { value, done } = await it.next()
+        if (done) controller.close()
+        else controller.enqueue(value)
+      } catch (err) {
+        controller.error(err)
+      }
+    },
+    async cancel() {
+      await it.return(undefined)
+      await pages.return(undefined)
+    }
+  })
+}
+
 /**
  * GET /api/reports/story
  *  - ?company=EMPRESA          → retorna um único .txt
- *  - ?multi=EMP1,EMP2,EMP3     → retorna um .zip com vários .txt
+ *  - ?multi=EMP1,EMP2,EMP3     → retorna um .zip com vários .txt (em stream)
  */
 export async function GET(req: NextRequest) {
   const { searchParams } = req.nextUrl
@@ -25,27 +218,17 @@ export async function GET(req: NextRequest) {
   // MODO SINGLE: apenas 1 empresa -> gera 1 TXT
   // ---------------------------------------------------------------------------
   if (company) {
-    const { data, error } = await supabase
-      .from('all_data')
-      .select('bulletin_date, bulletin_type, body_text')
-      .eq('company', company)
-      .order('bulletin_date', { ascending: true })
-
-    if (error) return new NextResponse(error.message, { status: 500 })
-    if (!data?.length) return new NextResponse('No bulletins found', { status: 404 })
-
-    const story = data
-      .map(r => `${r.bulletin_date} — ${r.bulletin_type}\n${r.body_text}\n`)
-      .join('\n--------------------------------\n')
-
-    const safe = company.replace(/[^a-z0-9]/gi, '_')
-    const lastDate = data[data.length - 1].bulletin_date ?? 'unknown'
-    const filename = `${safe}__story_until_${lastDate}.txt`
+    let story: StoryRow[] = []
+    for await (const page of fetchStoryRows([company])) {
+      if (page instanceof Error) return new NextResponse(page.message, { status: 500 })
+      story = story.concat(page)
+    }
+    if (!story.length) return new NextResponse('No bulletins found', { status: 404 })
 
-    return new NextResponse(story, {
+    return new NextResponse(storyText(story), {
       headers: {
         'Content-Type': 'text/plain; charset=utf-8',
-        'Content-Disposition': `attachment; filename="${filename}"`
+        'Content-Disposition': `attachment; filename="${storyFilename(company, story)}"`
       }
     })
   }
@@ -54,35 +237,15 @@ export async function GET(req: NextRequest) {
   // MODO MULTI: várias empresas -> gera 1 ZIP com vários TXT
   // ---------------------------------------------------------------------------
   if (multi) {
-    const companies = multi.split(',').map(s => s.trim()).filter(Boolean)
+    const companies = [...new Set(multi.split(',').map(s => s.trim()).filter(Boolean))]
     if (!companies.length) return new NextResponse('No companies', { status: 400 })
 
-    const zip = new JSZip()
-
-    for (const comp of companies) {
-      const { data, error } = await supabase
-        .from('all_data')
-        .select('bulletin_date, bulletin_type, body_text')
-        .eq('company', comp)
-        .order('bulletin_date', { ascending: true })
-
-      // Se der erro ou não houver boletins, pula esta empresa
-      if (error || !data?.length) continue
-
-      const story = data
-        .map(r => `${r.bulletin_date} — ${r.bulletin_type}\n${r.body_text}\n`)
-        .join('\n--------------------------------\n')
-
-      const safe = comp.replace(/[^a-z0-9]/gi, '_')
-      const lastDate = data[data.length - 1].bulletin_date ?? 'unknown'
-      zip.file(`${safe}__story_until_${lastDate}.txt`, story)
-    }
-
-    // ✅ Gera um ArrayBuffer e devolve como Blob (compatível com Edge Runtime)
-    const content = await zip.generateAsync({ type: 'arraybuffer' })
-    const blob = new Blob([content], { type: 'application/zip' })
+    // primeira página antes de abrir o stream: erro de consulta ainda vira 500
+    const pages = fetchStoryRows(companies)
+    const first = await pages.next()
+    if (first.value instanceof Error) return new NextResponse(first.value.message, { status: 500 })
 
-    return new NextResponse(blob, {
+    return new NextResponse(streamStoriesZip(first, pages), {
       headers: {
         'Content-Type': 'application/zip',
         'Content-Disposition': 'attachment; filename="stories.zip"'
@@ -0,0 +1,117 @@
+// src/app/api/reports/story/zipStream.ts
+import { deflateRawSync } from 'zlib'
+
+// -----------------------------------------------------------------------------
+// ZIP incremental: cada entrada é emitida (header + dados deflate) assim que
+// fica pronta, e o diretório central vai no final. Só a entrada corrente
+// fica em memória — nada de montar o ZIP inteiro antes de responder.
+// Sem ZIP64 (limite de 65535 entradas / 4 GB, folgado para stories).
+// -----------------------------------------------------------------------------
+
+const CRC_TABLE = (() => {
+  const t = new Uint32Array(256)
+  for (let n = 0; n < 256; n++) {
+    let c = n
+    for (let k = 0; k < 8; k++) c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1
+    t[n] = c >>> 0
+  }
+  return t
+})()
+
+function crc32(data: Uint8Array): number {
+  let c = 0xffffffff
+  for (let i = 0; i < data.length; i++) c = CRC_TABLE[(c ^ data[i]) & 0xff] ^ (c >>> 8)
+  return (c ^ 0xffffffff) >>> 0
+}
+
+function dosDateTime(d: Date): { time: number; date: number } {
+  return {
+    time: (d.getHours() << 11) | (d.getMinutes() << 5) | (d.getSeconds() >> 1),
+    date: ((d.getFullYear() - 1980) << 9) | ((d.getMonth() + 1) << 5) | d.getDate(),
+  }
+}
+
+type CentralEntry = {
+  name: Uint8Array
+  crc: number
+  compressedSize: number
+  size: number
+  offset: number
+}
+
+export class ZipStreamWriter {
+  private entries: CentralEntry[] = []
+  private offset = 0
+  private readonly encoder = new TextEncoder()
+  private readonly stamp = dosDateTime(new Date())
+
+  /** Header local + dados comprimidos de uma entrada. */
+  entry(filename: string, content: string): Uint8Array {
+    const name = this.encoder.encode(filename)
+    const raw = this.encoder.encode(content)
+    const data = new Uint8Array(deflateRawSync(raw))
+    const crc = crc32(raw)
+
+    const header = new DataView(new ArrayBuffer(30))
+    header.setUint32(0, 0x04034b50, true)
+    header.setUint16(4, 20, true) // versão mínima
+    header.setUint16(6, 0x0800, true) // nomes em UTF-8
+    header.setUint16(8, 8, true) // deflate
+    header.setUint16(10, this.stamp.time, true)
+    header.setUint16(12, this.stamp.date, true)
+    header.setUint32(14, crc, true)
+    header.setUint32(18, data.length, true)
+    header.setUint32(22, raw.length, true)
+    header.setUint16(26, name.length, true)
+    header.setUint16(28, 0, true)
+
+    const out = new Uint8Array(30 + name.length + data.length)
+    out.set(new Uint8Array(header.buffer), 0)
+    out.set(name, 30)
+    out.set(data, 30 + name.length)
+
+    this.entries.push({ name, crc, compressedSize: data.length, size: raw.length, offset: this.offset })
+    this.offset += out.length
+    return out
+  }
+
+  /** Diretório central + fim do arquivo (chamar uma vez, depois da última entrada). */
+  finish(): Uint8Array {
+    const parts: Uint8Array[] = []
+    let cdSize = 0
+    for (const e of this.entries) {
+      const h = new DataView(new ArrayBuffer(46))
+      h.setUint32(0, 0x02014b50, true)
+      h.setUint16(4, 20, true)
+      h.setUint16(6, 20, true)
+      h.setUint16(8, 0x0800, true)
+      h.setUint16(10, 8, true)
+      h.setUint16(12, this.stamp.time, true)
+      h.setUint16(14, this.stamp.date, true)
+      h.setUint32(16, e.crc, true)
+      h.setUint32(20, e.compressedSize, true)
+      h.setUint32(24, e.size, true)
+      h.setUint16(28, e.name.length, true)
+      // extra, comentário, disco, atributos: zero
+      h.setUint32(42, e.offset, true)
+      parts.push(new Uint8Array(h.buffer), e.name)
+      cdSize += 46 + e.name.length
+    }
+
+    const end = new DataView(new ArrayBuffer(22))
+    end.setUint32(0, 0x06054b50, true)
+    end.setUint16(8, this.entries.length, true)
+    end.setUint16(10, this.entries.length, true)
+    end.setUint32(12, cdSize, true)
+    end.setUint32(16, this.offset, true)
+    parts.push(new Uint8Array(end.buffer))
+
+    const out = new Uint8Array(cdSize + 22)
+    let pos = 0
+    for (const p of parts) {
+      out.set(p, pos)
+      pos += p.length
+    }
+    return out
+  }
+}
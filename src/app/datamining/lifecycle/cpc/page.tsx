@@ -571,17 +571,52 @@ useEffect(() => {
       setLoadingAnchors(true);
       setErrorMsg(null);
       try {
-        const { data, error } = await supabase
-          .from("vw_bulletins_with_canonical")
-          .select(
-            "company, ticker, bulletin_date, canonical_type, bulletin_type, canonical_class",
-          )
-          .ilike("canonical_type", `%${CPC_CANONICAL}%`);
-        if (error) throw error;
+        // âncora pré-computada (company_timelines.cpc_anchor_*), paginada;
+        // sem timelines ainda (job não rodou), agrega direto da view
+        type AnchorRow = {
+          cpc_anchor_company: string | null;
+          cpc_anchor_ticker: string | null;
+          cpc_anchor_date: string | null;
+        };
+        const ANCHOR_PAGE = 1000;
+        const anchorRows: AnchorRow[] = [];
+        for (let from = 0; ; from += ANCHOR_PAGE) {
+          const { data, error: tlError } = await supabase
+            .from("company_timelines")
+            .select("cpc_anchor_company, cpc_anchor_ticker, cpc_anchor_date")
+            .not("cpc_anchor_id", "is", null)
+            .order("company_norm", { ascending: true })
+            .range(from, from + ANCHOR_PAGE - 1);
+          if (tlError) throw tlError;
+          anchorRows.push(...((data || []) as AnchorRow[]));
+          if (!data || data.length < ANCHOR_PAGE) break;
+        }
+        let cpcRows: Row[] = anchorRows.map((a) => ({
+          company: a.cpc_anchor_company,
+          ticker: a.cpc_anchor_ticker,
+          bulletin_date: a.cpc_anchor_date,
+          canonical_type: CPC_CANONICAL,
+        }) as Row);
+        if (!anchorRows.length) {
+          const { count, error: countError } = await supabase
+            .from("company_timelines")
+            .select("company_norm", { count: "exact", head: true });
+          if (countError) throw countError;
+          if (!count) {
+            const { data, error } = await supabase
+              .from("vw_bulletins_with_canonical")
+              .select(
+                "company, ticker, bulletin_date, canonical_type, bulletin_type, canonical_class",
+              )
+              .ilike("canonical_type", `%${CPC_CANONICAL}%`);
+            if (error) throw error;
+            cpcRows = (data || []) as Row[];
+          }
+        }
 
         const map = new Map<string, string>();
         const companies = new Set<string>();
-        for (const r of (data || []) as Row[]) {
+        for (const r of cpcRows) {
           const key = keyCT(r.company, r.ticker);
           const d = r.bulletin_date || "";
           if (!d) continue;
@@ -46,6 +46,21 @@ export default function UploadButton({ onUploadComplete }: UploadButtonProps) {
         return;
       }
 
+      // ingestão só dos arquivos recém-enviados (nomes com prefixo UUID)
+      const names: string[] = (result.files ?? []).map((f: { name: string }) => f.name);
+      if (names.length) {
+        const depurar = await fetch("/api/dbadmin/depurar", {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ files: names }),
+        });
+        const dispatched = await depurar.json().catch(() => null);
+        if (!depurar.ok || !dispatched?.success) {
+          console.error("Erro ao disparar depuração:", dispatched?.error);
+          setErrorMessage("Arquivos enviados, mas a depuração não foi disparada.");
+        }
+      }
+
       setSelectedFiles([]);
       if (onUploadComplete) {
         await onUploadComplete();
@@ -62,11 +77,11 @@ export default function UploadButton({ onUploadComplete }: UploadButtonProps) {
   return (
     <div className="mb-6">
       <label className="mt-6 px-6 py-3 bg-yellow-400 text-black rounded-lg hover:bg-yellow-500 cursor-pointer inline-block">
-        Selecionar arquivos .txt
+        Selecionar arquivos .txt / .txt.gz / .zip
         <input
           type="file"
           multiple
-          accept=".txt"
+          accept=".txt,.gz,.zip"
           onChange={handleFileChange}
           className="hidden"
         />
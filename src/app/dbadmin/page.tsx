@@ -92,20 +92,20 @@ export default function DBAdminDashboard() {
   };
 
   // ----- depurar arquivos selecionados -----
+  // um disparo só para a seleção: o workflow ingere apenas esses arquivos
   const handleDepurar = async (names: string[]) => {
     if (!names.length) return;
     try {
-      for (const name of names) {
-        const res = await fetch(
-          `/api/dbadmin/depurar?file=${encodeURIComponent(name)}`,
-          { method: "POST" }
-        );
-        const data = await res.json();
-        if (!data.success) {
-          console.error("Erro ao depurar", name, data.error);
-        } else {
-          console.log("Arquivo depurado:", name);
-        }
+      const res = await fetch(`/api/dbadmin/depurar`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ files: names }),
+      });
+      const data = await res.json();
+      if (!data.success) {
+        console.error("Erro ao depurar", names, data.error);
+      } else {
+        console.log("Depuração disparada:", names);
       }
     } catch (err) {
       console.error("Erro no handleDepurar:", err);
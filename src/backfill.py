@@ -0,0 +1,260 @@
+import os
+import re
+import sys
+import json
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import sb_http
+
+import robot_depurar
+import parser_queue
+import parser_worker
+import cpc_name_index
+
+# ======================================================
+# Backfill histórico por janela de datas
+#
+#   python src/backfill.py --from 2008-01-01 --to 2010-12-31 [--chunk-days 30]
+#       [--workers 4] [--skip-ingest] [--skip-parse] [--restart]
+#
+# Só os arquivos do bucket com data no nome (n20080130.txt ou .txt.gz)
+# dentro da janela; .zip com vários dias fica de fora. Em chunks de --chunk-days, em ordem:
+# 1) ingestão: download + blocos em paralelo (--workers threads), upsert
+#    em all_data; o próximo chunk já vai baixando enquanto este parseia;
+# 2) parsers: RPC backfill_mark_ready põe na fila as linhas do chunk
+#    (parser_profile gravado; vazio, o canonical_parser_profile) e cada profile em lote roda com o
+#    batch_spec() do parser — cpc_birth primeiro, depois os eventos —
+#    reivindicando só linhas da janela do chunk (parser_queue.date_window).
+#
+# Progresso em BACKFILL_DIR/backfill-<from>-<to>.json: etapas concluídas
+# de cada chunk são puladas num rerun (--restart ignora o arquivo).
+# Linhas/s, blocos/s e ETA são impressos a cada arquivo e a cada chunk.
+# ======================================================
+
+BACKFILL_DIR = os.environ.get("BACKFILL_DIR") or ".backfill"
+UPSERT_BATCH = int(os.environ.get("BACKFILL_UPSERT_BATCH") or 500)
+FILE_DATE_RE = re.compile(r"n(\d{8})\.txt(?:\.gz)?$", re.IGNORECASE)
+
+
+def arg(name: str, default: Optional[str] = None) -> Optional[str]:
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def parse_day(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def file_date(name: str) -> Optional[date]:
+    m = FILE_DATE_RE.search(name)
+    if not m:
+        return None
+    try:
+        return datetime.strptime(m.group(1), "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def fmt_eta(seconds: float) -> str:
+    seconds = int(max(0, seconds))
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m{s:02d}s"
+
+
+def plan_chunks(files: List[Dict[str, Any]], start: date, end: date, chunk_days: int) -> List[Dict[str, Any]]:
+    """Chunks consecutivos de chunk_days, só os que têm arquivo, em ordem de data."""
+    dated = sorted(
+        (d, f["name"]) for f in files
+        if (d := file_date(f["name"])) is not None and start <= d <= end
+    )
+    chunks: List[Dict[str, Any]] = []
+    for d, name in dated:
+        offset = (d - start).days // chunk_days
+        c_from = start + timedelta(days=offset * chunk_days)
+        c_to = min(end, c_from + timedelta(days=chunk_days - 1))
+        if not chunks or chunks[-1]["from"] != c_from.isoformat():
+            chunks.append({"from": c_from.isoformat(), "to": c_to.isoformat(), "files": []})
+        chunks[-1]["files"].append(name)
+    return chunks
+
+
+class Progress:
+    """Estado persistido do backfill (gravação atômica a cada etapa)."""
+
+    def __init__(self, path: str, restart: bool) -> None:
+        self.path = path
+        self.state: Dict[str, Any] = {"chunks": {}}
+        if not restart and os.path.exists(path):
+            with open(path, encoding="utf-8") as fh:
+                self.state = json.load(fh)
+
+    def chunk(self, key: str) -> Dict[str, Any]:
+        return self.state["chunks"].setdefault(key, {})
+
+    def done(self, key: str, stage: str) -> bool:
+        return bool(self.chunk(key).get(stage))
+
+    def mark(self, key: str, stage: str, **info: Any) -> None:
+        entry = self.chunk(key)
+        entry[stage] = datetime.now(timezone.utc).isoformat()
+        entry.update(info)
+        self.save()
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+
+class Meter:
+    """Vazão e ETA do run (arquivos, ou chunks sem ingestão, no ritmo médio até aqui)."""
+
+    def __init__(self, total_files: int, total_chunks: int) -> None:
+        self.total_files = total_files
+        self.total_chunks = total_chunks
+        self.chunks = 0
+        self.files = 0
+        self.blocks = 0
+        self.parsed = 0
+        self.t0 = time.monotonic()
+
+    def line(self) -> str:
+        elapsed = max(time.monotonic() - self.t0, 1e-6)
+        if self.files:
+            eta = (self.total_files - self.files) * elapsed / self.files
+        elif self.chunks:
+            eta = (self.total_chunks - self.chunks) * elapsed / self.chunks
+        else:
+            eta = 0
+        return (
+            f"chunk {self.chunks}/{self.total_chunks}, {self.files}/{self.total_files} arquivos, {self.blocks} blocos "
+            f"({self.blocks / elapsed:.1f} blocos/s), {self.parsed} parseados "
+            f"({self.parsed / elapsed:.1f} linhas/s), ETA {fmt_eta(eta)}"
+        )
+
+
+def submit_chunk(pool: ThreadPoolExecutor, chunk: Dict[str, Any]) -> List[Future]:
+    return [pool.submit(robot_depurar.ingest_file, name) for name in chunk["files"]]
+
+
+def ingest_chunk(chunk: Dict[str, Any], futures: List[Future], meter: Meter) -> int:
+    blocks = 0
+    pending: List[Dict[str, Any]] = []
+    for name, fut in zip(chunk["files"], futures):
+        rows = fut.result()
+        pending.extend(rows)
+        blocks += len(rows)
+        meter.files += 1
+        meter.blocks += len(rows)
+        print(f"  📂 {name}: {len(rows)} blocos | {meter.line()}")
+        while len(pending) >= UPSERT_BATCH:
+            if not robot_depurar.upsert_rows(pending[:UPSERT_BATCH]):
+                raise RuntimeError(f"Upsert falhou no chunk {chunk['from']}..{chunk['to']}")
+            pending = pending[UPSERT_BATCH:]
+    if pending and not robot_depurar.upsert_rows(pending):
+        raise RuntimeError(f"Upsert falhou no chunk {chunk['from']}..{chunk['to']}")
+    return blocks
+
+
+def parse_chunk(
+    chunk: Dict[str, Any],
+    registry: Dict[str, Dict[str, Any]],
+    resumed: set,
+    meter: Meter,
+) -> Dict[str, List[int]]:
+    profiles = list(registry)
+    marked = parser_queue.rpc(
+        "backfill_mark_ready",
+        {"p_from": chunk["from"], "p_to": chunk["to"], "p_profiles": profiles},
+    )
+    print("  🗂️ Na fila: " + (", ".join(f"{m['profile']}={m['marked']}" for m in marked or []) or "nada"))
+    if not marked and chunk.get("files"):
+        print(f"  ⚠️ Nenhuma linha marcada em {chunk['from']}..{chunk['to']} apesar de {len(chunk['files'])} arquivos.")
+
+    birth_profile = parser_worker.BIRTH_MODULE.PARSER_PROFILE_ENV
+    result: Dict[str, List[int]] = {}
+    for profile in profiles:
+        with parser_queue.date_window(chunk["from"], chunk["to"]):
+            done, error = parser_queue.run_batches(**registry[profile], resume=profile not in resumed)
+        resumed.add(profile)
+        result[profile] = [done, error]
+        meter.parsed += done
+        if profile == birth_profile and done:
+            # eventos do mesmo chunk precisam achar as empresas recém-gravadas
+            cpc_name_index.load_index(refresh=True)
+    return result
+
+
+def main() -> None:
+    start_raw, end_raw = arg("--from"), arg("--to")
+    if not start_raw or not end_raw:
+        raise RuntimeError("Informe --from YYYY-MM-DD e --to YYYY-MM-DD.")
+    start, end = parse_day(start_raw), parse_day(end_raw)
+    if end < start:
+        raise RuntimeError(f"Janela inválida: {start} > {end}")
+    chunk_days = int(arg("--chunk-days") or os.environ.get("BACKFILL_CHUNK_DAYS") or 30)
+    workers = int(arg("--workers") or os.environ.get("BACKFILL_WORKERS") or 4)
+    skip_ingest = "--skip-ingest" in sys.argv
+    skip_parse = "--skip-parse" in sys.argv
+
+    progress = Progress(
+        os.path.join(BACKFILL_DIR, f"backfill-{start}-{end}.json"),
+        restart="--restart" in sys.argv,
+    )
+
+    robot_depurar.load_canonical_map()
+    chunks = plan_chunks(robot_depurar.list_bulletin_files(), start, end, chunk_days)
+    total_files = sum(len(c["files"]) for c in chunks)
+    print(f"🚀 Backfill {start}..{end}: {len(chunks)} chunks de {chunk_days} dias, {total_files} arquivos.")
+    if not chunks:
+        return
+
+    todo = [c for c in chunks if not skip_ingest and not progress.done(c["from"], "ingested")]
+    meter = Meter(sum(len(c["files"]) for c in todo), len(chunks))
+    registry = parser_worker.build_registry() if not skip_parse else {}
+    resumed: set = set()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        # prefetch de um chunk: download do próximo enquanto este parseia
+        prefetched: Dict[str, List[Future]] = {}
+        if todo:
+            prefetched[todo[0]["from"]] = submit_chunk(pool, todo[0])
+
+        for n, chunk in enumerate(chunks, start=1):
+            key = chunk["from"]
+            print(f"📦 Chunk {n}/{len(chunks)} {chunk['from']}..{chunk['to']} ({len(chunk['files'])} arquivos)")
+
+            if key in prefetched:
+                futures = prefetched.pop(key)
+                pos = todo.index(chunk)
+                if pos + 1 < len(todo):
+                    nxt = todo[pos + 1]
+                    prefetched[nxt["from"]] = submit_chunk(pool, nxt)
+                blocks = ingest_chunk(chunk, futures, meter)
+                progress.mark(key, "ingested", to=chunk["to"], files=len(chunk["files"]), blocks=blocks)
+            elif not skip_ingest:
+                print("  ⏭️ Ingestão já concluída (progresso salvo).")
+
+            if not skip_parse and progress.done(key, "parsed"):
+                print("  ⏭️ Parsers já concluídos (progresso salvo).")
+            elif not skip_parse:
+                t0 = time.monotonic()
+                result = parse_chunk(chunk, registry, resumed, meter)
+                progress.mark(key, "parsed", parse_result=result)
+                print(f"  ✅ Parsers em {time.monotonic() - t0:.1f}s")
+            meter.chunks += 1
+            print(f"  📈 {meter.line()}")
+
+    print(f"🏁 Backfill concluído: {meter.line()}")
+    sb_http.print_metrics("backfill")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import re
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# ======================================================
+# Classificador canônico de BULLETIN TYPE (ingestão)
+#
+# Aho-Corasick sobre os padrões do mapa canônico: uma única passada pelo
+# texto de bulletin_type encontra todos os tipos presentes. O resultado
+# (canonical_type / canonical_class / canonical_types / parser profile)
+# é gravado em all_data pelo robot_depurar, para que os parsers filtrem
+# por igualdade indexada em vez de ilike sobre a view.
+# ======================================================
+
+# (padrão em bulletin_type, canonical_type, parser_profile)
+# Mesmas regras de suggestedParserProfile em datamining/lifecycle/cpc.
+DEFAULT_CANONICAL_MAP: List[Tuple[str, str, Optional[str]]] = [
+    ("NEW LISTING-CPC-SHARES", "NEW LISTING-CPC-SHARES", "cpc_birth"),
+    ("NEW LISTING-SHARES", "NEW LISTING-SHARES", None),
+    ("HALT", "HALT", "events_halt_v1"),
+    ("RESUME TRADING", "RESUME TRADING", "events_resume_trading_v1"),
+    ("CPC-FILING STATEMENT", "CPC-FILING STATEMENT", "cpc_filing_statement_v1"),
+    ("CPC-INFORMATION CIRCULAR", "CPC-INFORMATION CIRCULAR", "cpc_events_information_circular_v1"),
+]
+
+CLASS_UNICO = "Unico"
+CLASS_MISTO = "Misto"
+
+
+def normalize_type(text: str | None) -> str:
+    """Caixa alta, espaços colapsados e hífens sem espaço ('CPC - SHARES' -> 'CPC-SHARES')."""
+    t = (text or "").upper()
+    t = re.sub(r"\s*[-–—]\s*", "-", t)
+    return re.sub(r"\s+", " ", t).strip()
+
+
+class CanonicalClassifier:
+    def __init__(self, entries: Sequence[Tuple[str, str, Optional[str]]]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self._patterns: List[str] = []
+        self._targets: List[Tuple[str, Optional[str]]] = []
+
+        for pattern, canonical_type, profile in entries:
+            p = normalize_type(pattern)
+            if not p:
+                continue
+            self._add(p, len(self._patterns))
+            self._patterns.append(p)
+            self._targets.append((canonical_type, profile))
+        self._build()
+
+    def _add(self, pattern: str, idx: int) -> None:
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(idx)
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _matches(self, text: str) -> List[Tuple[int, int, int]]:
+        """(início, fim, padrão) de cada ocorrência delimitada por não-alfanuméricos."""
+        found: List[Tuple[int, int, int]] = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for idx in self._out[node]:
+                start = i - len(self._patterns[idx]) + 1
+                end = i + 1
+                if start > 0 and text[start - 1].isalnum():
+                    continue
+                if end < len(text) and text[end].isalnum():
+                    continue
+                found.append((start, end, idx))
+        return found
+
+    def classify(self, bulletin_type: str | None) -> Dict[str, object]:
+        """
+        Devolve canonical_type, canonical_class, canonical_types e
+        canonical_parser_profile. Ocorrências sobrepostas: vence a mais
+        longa à esquerda (um padrão contido em outro maior não conta).
+        """
+        text = normalize_type(bulletin_type)
+        hits = sorted(self._matches(text), key=lambda m: (m[0], -(m[1] - m[0])))
+
+        types: List[str] = []
+        profiles: List[Optional[str]] = []
+        pos = 0
+        for start, end, idx in hits:
+            if start < pos:
+                continue
+            pos = end
+            canonical_type, profile = self._targets[idx]
+            if canonical_type not in types:
+                types.append(canonical_type)
+                profiles.append(profile)
+
+        if not types:
+            return {
+                "canonical_type": None,
+                "canonical_class": None,
+                "canonical_types": [],
+                "canonical_parser_profile": None,
+            }
+        single = len(types) == 1
+        return {
+            "canonical_type": ", ".join(types),
+            "canonical_class": CLASS_UNICO if single else CLASS_MISTO,
+            "canonical_types": types,
+            # parser automático só para boletins de um único tipo
+            "canonical_parser_profile": profiles[0] if single else None,
+        }
+
+
+def load_classifier(rows: Sequence[Dict[str, object]] | None = None) -> CanonicalClassifier:
+    """
+    Monta o classificador a partir das linhas de bulletin_canonical_map
+    (pattern, canonical_type, parser_profile). Sem linhas, usa o mapa padrão.
+    """
+    entries: List[Tuple[str, str, Optional[str]]] = [
+        (str(r["pattern"]), str(r["canonical_type"]), r.get("parser_profile"))  # type: ignore[misc]
+        for r in rows or []
+        if r.get("pattern") and r.get("canonical_type")
+    ]
+    return CanonicalClassifier(entries or DEFAULT_CANONICAL_MAP)
@@ -0,0 +1,67 @@
+import re
+from typing import Any, Dict, Mapping, Pattern
+
+# ======================================================
+# Índice "Label: valor" de um bulletin
+#
+# Extraído uma vez na ingestão (robot_depurar.parse_one_block) e gravado
+# em all_data.body_labels (jsonb). Cada chave guarda a captura exata do
+# regex que o parser rodaria sobre o body (mesmo padrão, mesma 1ª
+# ocorrência), então ler do índice ou do body dá o mesmo resultado.
+# Linhas sem índice da versão atual (ingeridas antes) continuam pelo
+# regex sobre body_text.
+# ======================================================
+
+# muda quando LABEL_PATTERNS muda: índices de outra versão são ignorados
+LABELS_VERSION = 2
+VERSION_KEY = "_version"
+
+# chave -> regex do parser (grupo 1 é o valor); sem match, a chave não entra
+LABEL_PATTERNS: Dict[str, Pattern[str]] = {
+    "COMMENCE DATE": re.compile(r"(?mi)^\s*Commence Date:(.*)$"),
+    "CORPORATE JURISDICTION": re.compile(r"Corporate Jurisdiction\s*[:\-–—]\s*(.+)", re.IGNORECASE),
+    "CAPITALIZATION": re.compile(r"Capitalization\s*[:\-–—]\s*(.+)", re.IGNORECASE),
+    "ESCROWED SHARES": re.compile(r"Escrowed Shares\s*[:\-–—]\s*(.+)", re.IGNORECASE),
+    "TRANSFER AGENT": re.compile(r"(?mi)^\s*Transfer Agent:\s*(.+)$"),
+    "TRADING SYMBOL": re.compile(r"(?mi)^\s*Trading Symbol:\s*([A-Z0-9\.\-]+)"),
+    "CUSIP NUMBER": re.compile(r"(?mi)^\s*CUSIP Number:\s*([A-Z0-9 ]+)"),
+    "SPONSORING MEMBER": re.compile(r"(?mi)^\s*Sponsoring Member:\s*(.+)$"),
+    "AGENT": re.compile(r"(?mi)^\s*Agent:\s*(.+)$"),
+    "AGENT'S OPTIONS NONE": re.compile(r"Agent's Options:\s*(none)", re.IGNORECASE),
+    "AGENT'S OPTIONS": re.compile(r"Agent's Options:\s*(.+?)(?:\n\n|$)", re.IGNORECASE | re.DOTALL),
+}
+
+
+def label_key(label: str) -> str:
+    """Chave do índice: caixa alta, espaços colapsados, apóstrofo reto."""
+    k = label.replace("’", "'").upper()
+    return re.sub(r"\s+", " ", k).strip()
+
+
+def extract_labels(body: str | None) -> Dict[str, Any]:
+    """Captura de cada padrão de LABEL_PATTERNS sobre o body (1ª ocorrência)."""
+    text = body or ""
+    labels: Dict[str, Any] = {VERSION_KEY: LABELS_VERSION}
+    for key, pattern in LABEL_PATTERNS.items():
+        m = pattern.search(text)
+        if m:
+            labels[key] = m.group(1)
+    return labels
+
+
+def has_index(labels: Mapping[str, Any] | None) -> bool:
+    """Índice presente e da versão atual."""
+    return bool(labels) and labels.get(VERSION_KEY) == LABELS_VERSION  # type: ignore[union-attr]
+
+
+def label_value(labels: Mapping[str, Any] | None, label: str, body: str) -> str | None:
+    """
+    Grupo 1 do padrão do rótulo: do índice quando existe, senão do regex
+    sobre o body. None quando o padrão não casa.
+    """
+    key = label_key(label)
+    if has_index(labels):
+        value = labels.get(key)  # type: ignore[union-attr]
+        return value if isinstance(value, str) else None
+    m = LABEL_PATTERNS[key].search(body)
+    return m.group(1) if m else None
@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import sb_http
+
+# ======================================================
+# Materialização incremental de company_timelines
+#
+# - Lê o watermark do último run (timeline_job_state).
+# - RPC timeline_touched_companies: empresas com linhas novas/alteradas em
+#   all_data, cpc_birth ou cpc_events desde o watermark (menos uma folga).
+# - RPC refresh_company_timelines em lotes: recalcula só essas empresas.
+# - Avança o watermark para o início deste run.
+#
+# --full recalcula todas as empresas (primeira carga / recuperação).
+# ======================================================
+
+SUPABASE_URL = os.environ["SUPABASE_URL"]
+SUPABASE_KEY = (
+    os.environ.get("SUPABASE_SERVICE_KEY")
+    or os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+)
+if not SUPABASE_KEY:
+    raise RuntimeError(
+        "Missing env: SUPABASE_SERVICE_KEY or SUPABASE_SERVICE_ROLE_KEY"
+    )
+
+JOB_NAME = "company_timelines"
+STATE_TABLE = "timeline_job_state"
+
+# empresas por chamada de refresh_company_timelines
+REFRESH_CHUNK = int(os.environ.get("TIMELINE_REFRESH_CHUNK") or 200)
+# folga sobre o watermark: transações que começaram antes do run anterior
+# e comitaram depois dele (updated_at = início da transação)
+OVERLAP_SECONDS = int(os.environ.get("TIMELINE_OVERLAP_SECONDS") or 300)
+
+
+def sb_headers() -> Dict[str, str]:
+    return {
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+def rpc(name: str, payload: Dict[str, Any]) -> Any:
+    url = f"{SUPABASE_URL}/rest/v1/rpc/{name}"
+    resp = sb_http.post(url, headers=sb_headers(), data=json.dumps(payload), timeout=300)
+    if not resp.ok:
+        print(f"Erro no RPC {name}:", resp.status_code, resp.text)
+        resp.raise_for_status()
+    return resp.json() if resp.text else None
+
+
+def read_watermark() -> Optional[str]:
+    url = f"{SUPABASE_URL}/rest/v1/{STATE_TABLE}"
+    params = {"select": "watermark", "job": f"eq.{JOB_NAME}"}
+    resp = sb_http.get(url, headers=sb_headers(), params=params, timeout=60)
+    resp.raise_for_status()
+    data = resp.json()
+    return data[0].get("watermark") if data else None
+
+
+def save_watermark(watermark: str) -> None:
+    url = f"{SUPABASE_URL}/rest/v1/{STATE_TABLE}"
+    headers = {**sb_headers(), "Prefer": "resolution=merge-duplicates,return=minimal"}
+    payload = {"job": JOB_NAME, "watermark": watermark, "updated_at": watermark}
+    resp = sb_http.post(url, headers=headers, params={"on_conflict": "job"}, data=json.dumps(payload), timeout=60)
+    if not resp.ok:
+        print("Erro ao salvar watermark:", resp.status_code, resp.text)
+        resp.raise_for_status()
+
+
+def since_from(watermark: Optional[str]) -> Optional[str]:
+    if not watermark:
+        return None
+    wm = datetime.fromisoformat(watermark.replace("Z", "+00:00"))
+    return (wm - timedelta(seconds=OVERLAP_SECONDS)).isoformat()
+
+
+def touched_companies(since: Optional[str]) -> List[str]:
+    data = rpc("timeline_touched_companies", {"p_since": since})
+    # setof text volta como lista de strings
+    return sorted({c for c in data or [] if c})
+
+
+def main() -> None:
+    full = "--full" in sys.argv
+    started_at = datetime.now(timezone.utc).isoformat()
+    t0 = time.monotonic()
+
+    watermark = None if full else read_watermark()
+    since = since_from(watermark)
+    print(f"Timelines: {'carga completa' if since is None else f'alterações desde {since}'}")
+
+    companies = touched_companies(since)
+    print(f"{len(companies)} empresas a recalcular.")
+
+    refreshed = 0
+    for start in range(0, len(companies), REFRESH_CHUNK):
+        part = companies[start:start + REFRESH_CHUNK]
+        refreshed += int(rpc("refresh_company_timelines", {"p_companies": part}) or 0)
+        print(f"  {min(start + REFRESH_CHUNK, len(companies))}/{len(companies)} empresas processadas")
+
+    # só avança depois de tudo gravado: falha no meio reprocessa no próximo run
+    save_watermark(started_at)
+    print(
+        f"Concluído. empresas={len(companies)} timelines={refreshed} "
+        f"tempo={time.monotonic() - t0:.1f}s watermark={started_at}"
+    )
+    sb_http.print_metrics(JOB_NAME)
+
+
+if __name__ == "__main__":
+    main()
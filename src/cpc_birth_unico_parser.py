@@ -1,10 +1,17 @@
 import os
+import sys
 import re
-import json
 from datetime import datetime
 from typing import Iterable, List, Dict, Any
 
-import requests
+import sb_http
+
+from bulletin_labels import LABEL_PATTERNS, label_key, label_value
+import cpc_link_resolver
+from cpc_records import BIRTH_FIELDS, CpcBirthRow, stream_rows
+import parse_cache
+import parser_dryrun
+import parser_queue
 
 # 1) Constantes / config
 SUPABASE_URL = os.environ["SUPABASE_URL"]
@@ -14,45 +21,13 @@ TABLE_NAME = "cpc_birth"
 
 COMPOSITE_KEY = os.environ.get("COMPOSITE_KEY")
 PARSER_PROFILE_ENV = os.environ.get("PARSER_PROFILE") or "cpc_birth"
+# versão do parse (cpc_birth não grava parse_version; usada pelo parse_cache)
+PARSE_VERSION = "cpc_birth_unico_v1"
+
+# body_text é buscado depois, só para os registros que passam no prepare
+META_COLUMNS = "id,company,ticker,composite_key,canonical_type,canonical_class,bulletin_date,tier,parser_profile,parser_status"
 
-FIELDS = [
-    "company_name",
-    "ticker",
-    "composite_key",
-    "canonical_type",
-    "bulletin_date",
-    "tier",
-    "prospectus_date",
-    "prospectus_date_iso",
-    "effective_date",
-    "effective_date_iso",
-    "gross_proceeds",
-    "gross_proceeds_value",
-    "gross_proceeds_class",
-    "gross_proceeds_class_volume",
-    "gross_proceeds_volume_value",
-    "gross_proceeds_value_per_share",
-    "commence_date",
-    "commence_date_iso",
-    "corporate_jurisdiction",
-    "capitalization",
-    "capitalization_volume",
-    "capitalization_volume_value",
-    "capitalization_class",
-    "escrowed_shares",
-    "escrowed_shares_value",
-    "escrowed_shares_class",
-    "transfer_agent",
-    "trading_symbol",
-    "cusip_number",
-    "sponsoring_member",
-    "agent",
-    "agent_option",
-    "agent_option_value",
-    "agent_option_class",
-    "agent_option_price_per_share",
-    "agents_options_duration_months",
-]
+FIELDS = BIRTH_FIELDS
 
 
 def clean_space(value: str | None) -> str:
@@ -130,8 +105,15 @@ def parse_currency_class(text: str | None) -> str | None:
     return None
 
 
-def extract_field(body: str, labels: Iterable[str]) -> str | None:
+def extract_field(
+    body: str, labels: Iterable[str], index: Dict[str, Any] | None = None
+) -> str | None:
     for label in labels:
+        if label_key(label) in LABEL_PATTERNS:
+            value = label_value(index, label, body)
+            if value is not None:
+                return clean_space(value)
+            continue
         pattern = rf"{re.escape(label)}\s*[:\-–—]\s*(.+)"
         match = re.search(pattern, body, re.IGNORECASE)
         if match:
@@ -167,33 +149,40 @@ def extract_months(text: str | None) -> int | None:
     return None
 
 
-def normalize_row(row: dict) -> dict:
-    normalized: dict[str, Any] = {}
+def normalize_row(row: CpcBirthRow) -> CpcBirthRow:
+    """Normaliza strings no próprio registro (sem copiar para outro dict)."""
     for field in FIELDS:
-        value = row.get(field)
+        value = row[field]
         if isinstance(value, str):
             value = clean_space(value)
-            if value == "":
-                value = None
-        normalized[field] = value
-    return normalized
+            row[field] = value or None
+    return row
+
+
+def is_cpc_birth_unico(rec: Dict[str, Any]) -> Dict[str, Any] | None:
+    """
+    Fase 1 (sem body_text): apenas NEW LISTING-CPC-SHARES Unico segue
+    para o download do body e o parse.
+    """
+    ctype = (rec.get("canonical_type") or "").upper()
+    cclass = (rec.get("canonical_class") or "").capitalize()
+    if "NEW LISTING-CPC-SHARES" not in ctype or cclass != "Unico":
+        return None
+    return rec
 
 
-def parse_cpc_birth_unico(rec: Dict[str, Any]) -> Dict[str, Any] | None:
+def parse_cpc_birth_unico(rec: Dict[str, Any]) -> CpcBirthRow | None:
     """
     Parser para NEW LISTING-CPC-SHARES 'Unico',
     alinhado com o parser v13b (planilha).
     rec vem da view vw_bulletins_with_canonical.
     """
 
-    ctype = (rec.get("canonical_type") or "").upper()
-    cclass = (rec.get("canonical_class") or "").capitalize()
-
     # apenas NEW LISTING-CPC-SHARES Unico
-    if "NEW LISTING-CPC-SHARES" not in ctype or cclass != "Unico":
+    if is_cpc_birth_unico(rec) is None:
         return None
 
-    row = {f: None for f in FIELDS}
+    row = CpcBirthRow()
 
     # campos básicos
     row["company_name"] = clean_space(
@@ -206,6 +195,8 @@ def parse_cpc_birth_unico(rec: Dict[str, Any]) -> Dict[str, Any] | None:
     row["tier"] = clean_space(rec.get("tier", ""))
 
     body = rec.get("body_text", "") or ""
+    # índice "Label: valor" da ingestão; None em linhas antigas (regex no body)
+    labels = rec.get("body_labels")
 
     # -----------------------
     # Prospectus / Effective
@@ -233,11 +224,9 @@ def parse_cpc_birth_unico(rec: Dict[str, Any]) -> Dict[str, Any] | None:
     # -----------------------
     # Commence Date
     # -----------------------
-    line_m = re.search(r"(?mi)^\s*Commence Date:(.*)$", body)
+    line = label_value(labels, "Commence Date", body)
     commence_date_raw: str | None = None
-    if line_m:
-        line = line_m.group(1)
-
+    if line is not None:
         p1 = re.search(
             r"(?:on\s+)?(?:Mon|Tues|Tue|Wed|Thu|Thur|Fri|Sat|Sun|Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday)?\s*,?\s*([A-Za-z]+\s+\d{1,2}(?:,\s*\d{4}| \d{4}))",
             line,
@@ -265,7 +254,7 @@ def parse_cpc_birth_unico(rec: Dict[str, Any]) -> Dict[str, Any] | None:
     # -----------------------
     # Corporate Jurisdiction
     # -----------------------
-    row["corporate_jurisdiction"] = extract_field(body, ["Corporate Jurisdiction"])
+    row["corporate_jurisdiction"] = extract_field(body, ["Corporate Jurisdiction"], labels)
 
     # -----------------------
     # Gross Proceeds
@@ -306,7 +295,7 @@ def parse_cpc_birth_unico(rec: Dict[str, Any]) -> Dict[str, Any] | None:
     # -----------------------
     # Capitalization
     # -----------------------
-    capitalization = extract_field(body, ["Capitalization"])
+    capitalization = extract_field(body, ["Capitalization"], labels)
     row["capitalization"] = capitalization
 
     ios_match = re.search(
@@ -333,7 +322,7 @@ def parse_cpc_birth_unico(rec: Dict[str, Any]) -> Dict[str, Any] | None:
     # -----------------------
     # Escrowed Shares
     # -----------------------
-    escrow_line = extract_field(body, ["Escrowed Shares"])
+    escrow_line = extract_field(body, ["Escrowed Shares"], labels)
     qty_str = None
     escrow_class = None
 
@@ -355,42 +344,37 @@ def parse_cpc_birth_unico(rec: Dict[str, Any]) -> Dict[str, Any] | None:
     # -----------------------
     # Transfer Agent / Trading Symbol / CUSIP / Sponsoring / Agent
     # -----------------------
-    ta_raw = re.search(r"(?mi)^\s*Transfer Agent:\s*(.+)$", body)
-    ta = ta_raw.group(1).strip() if ta_raw else None
+    ta = label_value(labels, "Transfer Agent", body)
+    ta = ta.strip() if ta is not None else None
     if ta:
         ta = re.sub(r"\s*\(.*?\)\s*$", "", ta).strip()
     row["transfer_agent"] = ta
 
-    ts = re.search(r"(?mi)^\s*Trading Symbol:\s*([A-Z0-9\.\-]+)", body)
-    row["trading_symbol"] = ts.group(1).strip() if ts else clean_space(
+    ts = label_value(labels, "Trading Symbol", body)
+    row["trading_symbol"] = ts.strip() if ts is not None else clean_space(
         rec.get("ticker", "")
     )
 
-    cu = re.search(r"(?mi)^\s*CUSIP Number:\s*([A-Z0-9 ]+)", body)
-    row["cusip_number"] = cu.group(1).strip() if cu else None
+    cu = label_value(labels, "CUSIP Number", body)
+    row["cusip_number"] = cu.strip() if cu is not None else None
 
-    sm = re.search(r"(?mi)^\s*Sponsoring Member:\s*(.+)$", body)
-    row["sponsoring_member"] = sm.group(1).strip() if sm else None
+    sm = label_value(labels, "Sponsoring Member", body)
+    row["sponsoring_member"] = sm.strip() if sm is not None else None
 
-    ag = re.search(r"(?mi)^\s*Agent:\s*(.+)$", body)
-    row["agent"] = ag.group(1).strip() if ag else None
+    ag = label_value(labels, "Agent", body)
+    row["agent"] = ag.strip() if ag is not None else None
 
     # -----------------------
     # Agent's Options
     # -----------------------
-    if re.search(r"Agent's Options:\s*none", body, re.IGNORECASE):
+    if label_value(labels, "Agent's Options none", body) is not None:
         row["agent_option"] = "none"
         row["agent_option_value"] = 0
         row["agent_option_class"] = None
         row["agent_option_price_per_share"] = None
         row["agents_options_duration_months"] = 0
     else:
-        ao_block_match = re.search(
-            r"Agent's Options:\s*(.+?)(?:\n\n|$)",
-            body,
-            flags=re.IGNORECASE | re.DOTALL,
-        )
-        ao_block = ao_block_match.group(1) if ao_block_match else ""
+        ao_block = label_value(labels, "Agent's Options", body) or ""
 
         # quantidade de opções
         qty_match = re.search(
@@ -444,118 +428,93 @@ def parse_cpc_birth_unico(rec: Dict[str, Any]) -> Dict[str, Any] | None:
     return normalize_row(row)
 
 
-def fetch_marked_rows():
-    url = f"{SUPABASE_URL}/rest/v1/{VIEW_NAME}"
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-    }
-    params: Dict[str, Any] = {
-        "select": "id,company,ticker,composite_key,canonical_type,canonical_class,bulletin_date,tier,body_text,parser_profile,parser_status",
-    }
-
-    if COMPOSITE_KEY:
-        params["composite_key"] = f"eq.{COMPOSITE_KEY}"
-
-    params["parser_profile"] = f"eq.{PARSER_PROFILE_ENV}"
-    params["parser_status"] = "eq.ready"
-
-    resp = requests.get(url, headers=headers, params=params, timeout=60)
-    resp.raise_for_status()
-    return resp.json()
+def fetch_marked_rows() -> List[Dict[str, Any]]:
+    """
+    Reivindica (claim com lease) um lote de linhas ready deste parser_profile
+    e busca seus dados na view.
+    """
+    ids = parser_queue.claim_rows(PARSER_PROFILE_ENV, composite_key=COMPOSITE_KEY)
+    return parser_queue.fetch_rows(ids, META_COLUMNS)
 
 
-def upsert_cpc_birth(rows: List[Dict[str, Any]]) -> None:
+def upsert_cpc_birth(rows: List[CpcBirthRow]) -> List[Dict[str, Any]]:
+    """Upsert em cpc_birth; devolve id/ticker/company das linhas gravadas."""
     url = f"{SUPABASE_URL}/rest/v1/{TABLE_NAME}"
     headers = {
         "apikey": SUPABASE_KEY,
         "Authorization": f"Bearer {SUPABASE_KEY}",
         "Content-Type": "application/json",
-        "Prefer": "resolution=merge-duplicates",
+        "Prefer": "resolution=merge-duplicates,return=representation",
     }
     # se tiver unique em composite_key, isso evita 409
-    params = {"on_conflict": "composite_key"}
-    resp = requests.post(
-        url, headers=headers, params=params, data=json.dumps(rows), timeout=60
+    params = {
+        "on_conflict": "composite_key",
+        "select": "id,ticker,trading_symbol,company_name,bulletin_date",
+    }
+    resp = sb_http.post(
+        url, headers=headers, params=params, data=stream_rows(rows), timeout=60
     )
 
     if not resp.ok:
         print("Erro ao inserir em cpc_birth:", resp.status_code, resp.text)
         resp.raise_for_status()
+    return resp.json()
 
 
-def mark_done(ids: List[int]) -> None:
-    url = f"{SUPABASE_URL}/rest/v1/all_data"
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": "application/json",
-        "Prefer": "return=representation",
+def commit_cpc_birth(rows: List[CpcBirthRow]) -> None:
+    """
+    Upsert em cpc_birth e, em seguida, vincula eventos que aguardavam
+    essas births. Falha no vínculo não desfaz o lote: o catch-up
+    (python src/cpc_link_resolver.py) resolve depois.
+    """
+    births = upsert_cpc_birth(rows)
+    try:
+        cpc_link_resolver.resolve_for_births(births)
+    except Exception as e:
+        print("Erro ao resolver vínculos pendentes:", str(e))
+
+
+def batch_spec() -> Dict[str, Any]:
+    """Argumentos de parser_queue.run_batches (também usados pelo parser_worker)."""
+    return {
+        "fetch": fetch_marked_rows,
+        # cache local (source_hash + versão do parser): reruns só parseiam o que mudou
+        "parse": parse_cache.cached(
+            parse_cpc_birth_unico,
+            PARSER_PROFILE_ENV,
+            parse_cache.code_version(PARSE_VERSION, __file__),
+            CpcBirthRow,
+        ),
+        "commit": commit_cpc_birth,
+        "prepare": is_cpc_birth_unico,
+        "label": f"CPC birth Unico (profile={PARSER_PROFILE_ENV})",
+        "profile": PARSER_PROFILE_ENV,
     }
-    for id_ in ids:
-        payload = {
-            "parser_status": "done",
-            "parser_parsed_at": datetime.utcnow().isoformat(),
-        }
-        resp = requests.patch(
-            f"{url}?id=eq.{id_}", headers=headers, data=json.dumps(payload), timeout=60
-        )
-        if not resp.ok:
-            print("Erro ao marcar done:", id_, resp.status_code, resp.text)
-            resp.raise_for_status()
-
-def mark_running(ids: List[int]) -> None:
-    """Marca registros como 'running' (início do processamento)."""
-    url = f"{SUPABASE_URL}/rest/v1/all_data"
-    headers = {**sb_headers(), "Content-Type": "application/json", "Prefer": "return=representation"}
-    payload = {"parser_status": "running"}
-    for id_ in ids:
-        resp = requests.patch(f"{url}?id=eq.{id_}", headers=headers, data=json.dumps(payload), timeout=60)
-        if not resp.ok:
-            print("Erro ao marcar running:", id_, resp.status_code, resp.text)
-            resp.raise_for_status()
-
-def mark_error(id_: int) -> None:
-    """Marca um registro como 'error' (sem mensagem, pois all_data não tem parser_error)."""
-    url = f"{SUPABASE_URL}/rest/v1/all_data"
-    headers = {**sb_headers(), "Content-Type": "application/json", "Prefer": "return=representation"}
-    payload = {"parser_status": "error"}
-    resp = requests.patch(f"{url}?id=eq.{id_}", headers=headers, data=json.dumps(payload), timeout=60)
-    if not resp.ok:
-        print("Erro ao marcar error:", id_, resp.status_code, resp.text)
-        resp.raise_for_status()
 
 
 def main() -> None:
-    records = fetch_marked_rows()
-    ids_all: List[int] = [r.get(\"id\") for r in records if r.get(\"id\") is not None]
-
-    if ids_all:
-        mark_running([int(x) for x in ids_all])
-
-    print(f"{len(records)} registros marcados para CPC birth Unico.")
-
-    rows_cpc: List[Dict[str, Any]] = []
-    ids: List[int] = []
-    for rec in records:
-        rid = rec.get("id")
-        try:
-            row = parse_cpc_birth_unico(rec)
-            if row:
-                rows_cpc.append(row)
-                ids.append(rec["id"])
-
-        except Exception as e:
-            if rid is not None:
-                print("Erro ao processar registro; marcando error:", rid, str(e))
-                mark_error(int(rid))
-    if not rows_cpc:
-        print("Nada para inserir em cpc_birth.")
+    spec = batch_spec()
+
+    if "--dry-run" in sys.argv:
+        # Só leitura: parseia o histórico do profile e compara com cpc_birth
+        parser_dryrun.run_dry_run(
+            PARSER_PROFILE_ENV,
+            META_COLUMNS,
+            spec["prepare"],
+            spec["parse"],
+            table=TABLE_NAME,
+            key_field="composite_key",
+            label=spec["label"],
+            composite_key=COMPOSITE_KEY,
+        )
         return
 
-    upsert_cpc_birth(rows_cpc)
-    mark_done(ids)
-    print("Concluído.")
+    parser_queue.run_batches(
+        **spec,
+        single=bool(COMPOSITE_KEY),
+        resume="--resume" in sys.argv,
+    )
+
 
 if __name__ == "__main__":
     main()
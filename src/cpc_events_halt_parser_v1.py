@@ -1,11 +1,17 @@
 import os
+import sys
 import re
-import json
 import hashlib
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 
-import requests
+import sb_http
+
+import cpc_link_resolver
+from cpc_records import CpcEventRow, stream_rows
+import parse_cache
+import parser_dryrun
+import parser_queue
 
 # 1) Constantes / config
 SUPABASE_URL = os.environ["SUPABASE_URL"]
@@ -13,7 +19,9 @@ SUPABASE_KEY = os.environ["SUPABASE_SERVICE_KEY"]
 
 VIEW_NAME = "vw_bulletins_with_canonical"
 EVENTS_TABLE = "cpc_events"
-BIRTH_TABLE = "cpc_birth"
+
+# body_text é buscado depois, só para os registros que passam no prepare
+META_COLUMNS = "id,company,ticker,composite_key,canonical_type,canonical_class,bulletin_date,tier,parser_profile,parser_status"
 
 COMPOSITE_KEY = os.environ.get("COMPOSITE_KEY")  # opcional: processar só um boletim
 PARSER_PROFILE_ENV = os.environ.get("PARSER_PROFILE") or "events_halt_v1"
@@ -49,55 +57,18 @@ def sb_headers() -> Dict[str, str]:
 
 def fetch_marked_rows() -> list[dict]:
     """
-    Busca na view apenas linhas marcadas como ready para este parser_profile,
-    e do tipo HALT.
-    """
-    url = f"{SUPABASE_URL}/rest/v1/{VIEW_NAME}"
-    params: Dict[str, Any] = {
-        "select": "id,company,ticker,composite_key,canonical_type,canonical_class,bulletin_date,tier,body_text,parser_profile,parser_status",
-        "parser_profile": f"eq.{PARSER_PROFILE_ENV}",
-        "parser_status": "eq.ready",
-        "canonical_type": "ilike.*halt*",
-    }
-    if COMPOSITE_KEY:
-        params["composite_key"] = f"eq.{COMPOSITE_KEY}"
-
-    resp = requests.get(url, headers=sb_headers(), params=params, timeout=60)
-    resp.raise_for_status()
-    return resp.json()
-
-def find_cpc_birth_id(company: str | None, ticker: str | None) -> Optional[str]:
+    Reivindica (claim com lease) um lote de linhas ready deste parser_profile,
+    do tipo HALT, e busca seus dados na view.
     """
-    Resolve o UUID em cpc_birth para o evento atual.
-    Estratégia v1: tenta ticker primeiro, e em seguida company_name + ticker.
-    """
-    url = f"{SUPABASE_URL}/rest/v1/{BIRTH_TABLE}"
-    headers = sb_headers()
-
-    t = clean_space(ticker).upper()
-    c = clean_space(company).upper()
-
-    # 1) ticker
-    if t:
-        params = {"select": "id", "ticker": f"eq.{t}", "limit": 1}
-        r = requests.get(url, headers=headers, params=params, timeout=60)
-        r.raise_for_status()
-        data = r.json()
-        if data:
-            return data[0]["id"]
-
-    # 2) company + ticker
-    if c and t:
-        params = {"select": "id", "company_name": f"eq.{c}", "ticker": f"eq.{t}", "limit": 1}
-        r = requests.get(url, headers=headers, params=params, timeout=60)
-        r.raise_for_status()
-        data = r.json()
-        if data:
-            return data[0]["id"]
-
-    return None
+    ids = parser_queue.claim_rows(
+        PARSER_PROFILE_ENV,
+        type_pattern="%halt%",
+        composite_key=COMPOSITE_KEY,
+        canonical_type="HALT",
+    )
+    return parser_queue.fetch_rows(ids, META_COLUMNS)
 
-def upsert_events(rows: List[Dict[str, Any]]) -> None:
+def upsert_events(rows: List[CpcEventRow]) -> None:
     url = f"{SUPABASE_URL}/rest/v1/{EVENTS_TABLE}"
     headers = {
         **sb_headers(),
@@ -105,54 +76,27 @@ def upsert_events(rows: List[Dict[str, Any]]) -> None:
         "Prefer": "resolution=merge-duplicates",
     }
     params = {"on_conflict": "event_composite_key"}
-    resp = requests.post(url, headers=headers, params=params, data=json.dumps(rows), timeout=60)
+    resp = sb_http.post(url, headers=headers, params=params, data=stream_rows(rows), timeout=60)
     if not resp.ok:
         print("Erro ao inserir em cpc_events:", resp.status_code, resp.text)
         resp.raise_for_status()
 
-def mark_done(ids: List[int]) -> None:
-    url = f"{SUPABASE_URL}/rest/v1/all_data"
-    headers = {
-        **sb_headers(),
-        "Content-Type": "application/json",
-        "Prefer": "return=representation",
-    }
-    for id_ in ids:
-        payload = {
-            "parser_status": "done",
-            "parser_parsed_at": datetime.utcnow().isoformat(),
-        }
-        resp = requests.patch(f"{url}?id=eq.{id_}", headers=headers, data=json.dumps(payload), timeout=60)
-        if not resp.ok:
-            print("Erro ao marcar done:", id_, resp.status_code, resp.text)
-            resp.raise_for_status()
-
-def mark_running(ids: List[int]) -> None:
-    """Marca registros como 'running' (início do processamento)."""
-    url = f"{SUPABASE_URL}/rest/v1/all_data"
-    headers = {**sb_headers(), "Content-Type": "application/json", "Prefer": "return=representation"}
-    payload = {"parser_status": "running"}
-    for id_ in ids:
-        resp = requests.patch(f"{url}?id=eq.{id_}", headers=headers, data=json.dumps(payload), timeout=60)
-        if not resp.ok:
-            print("Erro ao marcar running:", id_, resp.status_code, resp.text)
-            resp.raise_for_status()
-
-def mark_error(id_: int) -> None:
-    """Marca um registro como 'error' (sem mensagem, pois all_data não tem parser_error)."""
-    url = f"{SUPABASE_URL}/rest/v1/all_data"
-    headers = {**sb_headers(), "Content-Type": "application/json", "Prefer": "return=representation"}
-    payload = {"parser_status": "error"}
-    resp = requests.patch(f"{url}?id=eq.{id_}", headers=headers, data=json.dumps(payload), timeout=60)
-    if not resp.ok:
-        print("Erro ao marcar error:", id_, resp.status_code, resp.text)
-        resp.raise_for_status()
+def commit_events(rows: List[CpcEventRow]) -> None:
+    """Upsert em cpc_events + fila de vínculo para eventos sem cpc_birth_id."""
+    upsert_events(rows)
+    cpc_link_resolver.enqueue_pending(
+        [r["event_composite_key"] for r in rows if not r.get("cpc_birth_id")],
+        PARSER_PROFILE_ENV,
+    )
+
 
 # --- Parser HALT ---
-def parse_event_halt(rec: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+def resolve_event_halt(rec: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
-    HALT v1: extrai effective_time e effective_date do padrão:
-    'Effective at 12:09 p.m. PST, September 26, 2008, trading ... was halted ...'
+    Fase 1 (sem body_text): confere o tipo HALT e resolve o cpc_birth_id.
+    Devolve o registro com 'cpc_birth_id' (None se a cpc_birth ainda não
+    existe; o evento vai para a fila de vínculo pendente), ou None para
+    descartar.
     """
     ctype = (rec.get("canonical_type") or "").upper()
     if "HALT" not in ctype:
@@ -160,13 +104,24 @@ def parse_event_halt(rec: Dict[str, Any]) -> Optional[Dict[str, Any]]:
 
     company = rec.get("company")
     ticker = rec.get("ticker")
-    body = rec.get("body_text") or ""
-
-    cpc_birth_id = find_cpc_birth_id(company, ticker)
+    cpc_birth_id = cpc_link_resolver.find_cpc_birth_id(company, ticker)
     if not cpc_birth_id:
-        print("SEM cpc_birth_id:", company, ticker, rec.get("composite_key"))
+        print("SEM cpc_birth_id (vínculo pendente):", company, ticker, rec.get("composite_key"))
+
+    rec["cpc_birth_id"] = cpc_birth_id
+    return rec
+
+def parse_event_halt(rec: Dict[str, Any]) -> Optional[CpcEventRow]:
+    """
+    HALT v1: extrai effective_time e effective_date do padrão:
+    'Effective at 12:09 p.m. PST, September 26, 2008, trading ... was halted ...'
+    """
+    if "cpc_birth_id" not in rec and resolve_event_halt(rec) is None:
         return None
 
+    cpc_birth_id = rec["cpc_birth_id"]
+    body = rec.get("body_text") or ""
+
     effective_time = None
     effective_date_text = None
     effective_text = None
@@ -187,60 +142,62 @@ def parse_event_halt(rec: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     if re.search(r"at\s+the\s+request\s+of\s+the\s+Company", body, re.IGNORECASE):
         summary = "Trading halted at the request of the Company, pending an announcement."
 
-    row: Dict[str, Any] = {
-        "cpc_birth_id": cpc_birth_id,
-        "event_composite_key": rec["composite_key"],
-        "event_type": clean_space(rec.get("canonical_type") or "HALT"),
-        "bulletin_date": rec.get("bulletin_date"),
-        "event_effective_date": event_effective_date,
-        "event_effective_time": effective_time,
-        "event_effective_text": effective_text,
-        "event_summary": summary,
-        "event_body_raw": body,
-        "parse_version": PARSE_VERSION,
-        "parsed_at": datetime.utcnow().isoformat(),
-        "source_hash": sha1(body),
-    }
+    row = CpcEventRow(
+        cpc_birth_id=cpc_birth_id,
+        event_composite_key=rec["composite_key"],
+        event_type=clean_space(rec.get("canonical_type") or "HALT"),
+        bulletin_date=rec.get("bulletin_date"),
+        event_effective_date=event_effective_date,
+        event_effective_time=effective_time,
+        event_effective_text=effective_text,
+        event_summary=summary,
+        parse_version=PARSE_VERSION,
+        parsed_at=datetime.utcnow().isoformat(),
+        source_hash=sha1(body),
+    )
     return row
 
-def main() -> None:
-    records = fetch_marked_rows()
-    print(f"{len(records)} registros marcados para HALT (profile={PARSER_PROFILE_ENV}).")
-
-    rows: List[Dict[str, Any]] = []
-    ids_done: List[int] = []
-    ids_all: List[int] = [r.get("id") for r in records if r.get("id") is not None]
+def batch_spec() -> Dict[str, Any]:
+    """Argumentos de parser_queue.run_batches (também usados pelo parser_worker)."""
+    return {
+        "fetch": fetch_marked_rows,
+        # cache local (source_hash + versão do parser): reruns só parseiam o que mudou
+        "parse": parse_cache.cached(
+            parse_event_halt,
+            PARSER_PROFILE_ENV,
+            parse_cache.code_version(PARSE_VERSION, __file__),
+            CpcEventRow,
+        ),
+        "commit": commit_events,
+        "prepare": resolve_event_halt,
+        "label": f"HALT (profile={PARSER_PROFILE_ENV})",
+        "profile": PARSER_PROFILE_ENV,
+    }
 
-    if ids_all:
-        # Marca como running assim que o job começa a processar
-        mark_running(ids_all)
 
-    for rec in records:
-        rid = rec.get("id")
-        try:
-            row = parse_event_halt(rec)
-            if row:
-                rows.append(row)
-                if rid is not None:
-                    ids_done.append(rid)
-            else:
-                # Não conseguiu parsear: marca como error para não ficar preso em ready/running
-                if rid is not None:
-                    print("Registro não parseado; marcando error:", rid)
-                    mark_error(int(rid))
-        except Exception as e:
-            if rid is not None:
-                print("Erro ao processar registro; marcando error:", rid, str(e))
-                mark_error(int(rid))
-
-
-    if not rows:
-        print("Nada para inserir em cpc_events.")
+def main() -> None:
+    spec = batch_spec()
+
+    if "--dry-run" in sys.argv:
+        # Só leitura: parseia o histórico do profile e compara com cpc_events
+        parser_dryrun.run_dry_run(
+            PARSER_PROFILE_ENV,
+            META_COLUMNS,
+            spec["prepare"],
+            spec["parse"],
+            table=EVENTS_TABLE,
+            key_field="event_composite_key",
+            label=spec["label"],
+            type_pattern="%halt%",
+            composite_key=COMPOSITE_KEY,
+        )
         return
 
-    upsert_events(rows)
-    mark_done(ids_done)
-    print("Concluído.")
+    parser_queue.run_batches(
+        **spec,
+        single=bool(COMPOSITE_KEY),
+        resume="--resume" in sys.argv,
+    )
 
 if __name__ == "__main__":
     main()
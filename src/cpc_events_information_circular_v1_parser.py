@@ -1,19 +1,26 @@
 import os
 import re
+import sys
 import hashlib
 from datetime import datetime
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
-import requests
+import sb_http
+
+import cpc_link_resolver
+from cpc_records import CpcEventRow, stream_rows
+import parse_cache
+import parser_dryrun
+import parser_queue
 
 # ======================================================
 # CPC Events Parser — Information Circular (FINAL)
 # File: src/cpc_events_information_circular_v1_parser.py
 #
-# IMPORTANT (repo padrão):
-# - ESTE PARSER NÃO escreve em all_data.
-# - all_data é atualizado exclusivamente pelo route.ts (PATCH).
-# - Este script apenas lê a view e grava em cpc_events.
+# Mesmo loop dos outros parsers de eventos (parser_queue.run_batches):
+# claim com lease, upsert em cpc_events e done/error em all_data, que
+# também zera parser_priority (pedido do route.ts sai da faixa
+# prioritária). COMPOSITE_KEY processa só aquele boletim.
 # ======================================================
 
 SUPABASE_URL = os.environ["SUPABASE_URL"]
@@ -29,14 +36,18 @@ if not SUPABASE_KEY:
 
 VIEW_NAME = os.environ.get("VIEW_NAME") or "vw_bulletins_with_canonical"
 TABLE_EVENTS = os.environ.get("TABLE_EVENTS") or "cpc_events"
-TABLE_CPC_BIRTH = os.environ.get("TABLE_CPC_BIRTH") or "cpc_birth"
+
+# body_text é buscado depois, só para os registros que passam no prepare
+META_COLUMNS = "id,company,ticker,composite_key,canonical_type,canonical_class,bulletin_date,tier,parser_profile,parser_status"
 
 COMPOSITE_KEY = os.environ.get("COMPOSITE_KEY")
-PARSER_PROFILE = (
+PARSER_PROFILE_ENV = (
     os.environ.get("PARSER_PROFILE")
     or "cpc_events_information_circular_v1"
 )
 
+PARSE_VERSION = "cpc_events_information_circular_v1"
+
 HEADERS = {
     "apikey": SUPABASE_KEY,
     "Authorization": f"Bearer {SUPABASE_KEY}",
@@ -66,76 +77,18 @@ def parse_long_date(s: str) -> Optional[str]:
     return None
 
 
-def fetch_bulletin(composite_key: str) -> Dict[str, Any]:
-    params = {
-        "select": "company,ticker,bulletin_date,canonical_type,body_text",
-        "composite_key": f"eq.{composite_key}",
-        "limit": "1",
-    }
-    r = requests.get(
-        sb_url(VIEW_NAME),
-        headers=HEADERS,
-        params=params,
-        timeout=60,
+def fetch_marked_rows() -> List[Dict[str, Any]]:
+    """
+    Reivindica (claim com lease) um lote de linhas ready deste parser_profile,
+    do tipo CPC-INFORMATION CIRCULAR, e busca seus dados na view.
+    """
+    ids = parser_queue.claim_rows(
+        PARSER_PROFILE_ENV,
+        type_pattern="%information circular%",
+        composite_key=COMPOSITE_KEY,
+        canonical_type="CPC-INFORMATION CIRCULAR",
     )
-    r.raise_for_status()
-    rows = r.json()
-    if not rows:
-        raise RuntimeError(
-            f"Composite key não encontrado na view: {composite_key}"
-        )
-    return rows[0]
-
-
-def ticker_variants(t: str) -> Tuple[str, ...]:
-    t = (t or "").strip().upper()
-    if not t:
-        return ()
-    root = t.split(".")[0]
-    out = [t]
-    if root and root != t:
-        out.append(root)
-    return tuple(dict.fromkeys(out))
-
-
-def find_cpc_birth_id(company: str, ticker: str) -> Optional[str]:
-    for tv in ticker_variants(ticker):
-        params = {
-            "select": "id,bulletin_date",
-            "ticker": f"eq.{tv}",
-            "order": "bulletin_date.asc",
-            "limit": "1",
-        }
-        r = requests.get(
-            sb_url(TABLE_CPC_BIRTH),
-            headers=HEADERS,
-            params=params,
-            timeout=60,
-        )
-        r.raise_for_status()
-        rows = r.json()
-        if rows:
-            return rows[0]["id"]
-
-    if company:
-        params = {
-            "select": "id,bulletin_date",
-            "company_name": f"ilike.%{company}%",
-            "order": "bulletin_date.asc",
-            "limit": "1",
-        }
-        r = requests.get(
-            sb_url(TABLE_CPC_BIRTH),
-            headers=HEADERS,
-            params=params,
-            timeout=60,
-        )
-        r.raise_for_status()
-        rows = r.json()
-        if rows:
-            return rows[0]["id"]
-
-    return None
+    return parser_queue.fetch_rows(ids, META_COLUMNS)
 
 
 def parse_information_circular(
@@ -163,41 +116,61 @@ def parse_information_circular(
     return circular_date, purpose
 
 
-def insert_event(row: Dict[str, Any]) -> None:
-    headers = dict(HEADERS)
-    headers["Prefer"] = "return=minimal"
-    r = requests.post(
+def upsert_events(rows: List[CpcEventRow]) -> None:
+    headers = {**HEADERS, "Prefer": "resolution=merge-duplicates"}
+    params = {"on_conflict": "event_composite_key"}
+    r = sb_http.post(
         sb_url(TABLE_EVENTS),
         headers=headers,
-        json=row,
+        params=params,
+        data=stream_rows(rows),
         timeout=60,
     )
-    r.raise_for_status()
+    if not r.ok:
+        print("Erro ao inserir em cpc_events:", r.status_code, r.text)
+        r.raise_for_status()
 
 
-def main() -> None:
-    if not COMPOSITE_KEY:
-        raise RuntimeError("COMPOSITE_KEY env não informado.")
+def commit_events(rows: List[CpcEventRow]) -> None:
+    """Upsert em cpc_events + fila de vínculo para eventos sem cpc_birth_id."""
+    upsert_events(rows)
+    cpc_link_resolver.enqueue_pending(
+        [r["event_composite_key"] for r in rows if not r.get("cpc_birth_id")],
+        PARSER_PROFILE_ENV,
+    )
+
 
-    b = fetch_bulletin(COMPOSITE_KEY)
+def resolve_event_information_circular(rec: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Fase 1 (sem body_text): confere o tipo e resolve o cpc_birth_id (None
+    se a cpc_birth ainda não existe: vínculo pendente), ou None para descartar.
+    """
+    ctype = (rec.get("canonical_type") or "").upper()
+    if "INFORMATION CIRCULAR" not in ctype:
+        return None
+
+    company = rec.get("company")
+    ticker = rec.get("ticker")
+    cpc_birth_id = cpc_link_resolver.find_cpc_birth_id(company, ticker)
+    if not cpc_birth_id:
+        print("SEM cpc_birth_id (vínculo pendente):", company, ticker, rec.get("composite_key"))
 
-    company = b.get("company") or ""
-    ticker = b.get("ticker") or ""
-    bulletin_date = b.get("bulletin_date")
-    body_text = b.get("body_text") or ""
+    rec["cpc_birth_id"] = cpc_birth_id
+    return rec
 
+
+def parse_event_information_circular(rec: Dict[str, Any]) -> Optional[CpcEventRow]:
+    if "cpc_birth_id" not in rec and resolve_event_information_circular(rec) is None:
+        return None
+
+    body_text = rec.get("body_text") or ""
     if not body_text.strip():
-        raise RuntimeError("body_text vazio — não há o que parsear.")
+        # body vazio: nada a parsear (linha vai para error)
+        return None
 
+    bulletin_date = rec.get("bulletin_date")
     circular_date, purpose = parse_information_circular(body_text)
 
-    cpc_birth_id = find_cpc_birth_id(company, ticker)
-    if not cpc_birth_id:
-        raise RuntimeError(
-            f"Não encontrei cpc_birth_id para company='{company}' "
-            f"ticker='{ticker}'."
-        )
-
     summary = "CPC Information Circular accepted for filing."
     if circular_date:
         summary = (
@@ -205,21 +178,62 @@ def main() -> None:
             f"(circular dated {circular_date})."
         )
 
-    event_row = {
-        "cpc_birth_id": cpc_birth_id,
-        "event_composite_key": COMPOSITE_KEY,
-        "event_type": (b.get("canonical_type") or "CPC-INFORMATION CIRCULAR").strip(),
-        "bulletin_date": bulletin_date,
-        "event_effective_date": circular_date or bulletin_date,
-        "event_effective_time": None,
-        "event_effective_text": purpose,
-        "event_summary": summary,
-        "event_body_raw": body_text,
-        "parse_version": PARSER_PROFILE,
-        "source_hash": sha1(body_text),
+    return CpcEventRow(
+        cpc_birth_id=rec["cpc_birth_id"],
+        event_composite_key=rec["composite_key"],
+        event_type=(rec.get("canonical_type") or "CPC-INFORMATION CIRCULAR").strip(),
+        bulletin_date=bulletin_date,
+        event_effective_date=circular_date or bulletin_date,
+        event_effective_time=None,
+        event_effective_text=purpose,
+        event_summary=summary,
+        parse_version=PARSE_VERSION,
+        parsed_at=datetime.utcnow().isoformat(),
+        source_hash=sha1(body_text),
+    )
+
+
+def batch_spec() -> Dict[str, Any]:
+    """Argumentos de parser_queue.run_batches (também usados pelo parser_worker)."""
+    return {
+        "fetch": fetch_marked_rows,
+        # cache local (source_hash + versão do parser): reruns só parseiam o que mudou
+        "parse": parse_cache.cached(
+            parse_event_information_circular,
+            PARSER_PROFILE_ENV,
+            parse_cache.code_version(PARSE_VERSION, __file__),
+            CpcEventRow,
+        ),
+        "commit": commit_events,
+        "prepare": resolve_event_information_circular,
+        "label": f"CPC-INFORMATION CIRCULAR (profile={PARSER_PROFILE_ENV})",
+        "profile": PARSER_PROFILE_ENV,
     }
 
-    insert_event(event_row)
+
+def main() -> None:
+    spec = batch_spec()
+
+    if "--dry-run" in sys.argv:
+        # Só leitura: parseia o histórico do profile e compara com cpc_events
+        parser_dryrun.run_dry_run(
+            PARSER_PROFILE_ENV,
+            META_COLUMNS,
+            spec["prepare"],
+            spec["parse"],
+            table=TABLE_EVENTS,
+            key_field="event_composite_key",
+            label=spec["label"],
+            type_pattern="%information circular%",
+            composite_key=COMPOSITE_KEY,
+        )
+        return
+
+    parser_queue.run_batches(
+        **spec,
+        single=bool(COMPOSITE_KEY),
+        resume="--resume" in sys.argv,
+    )
 
 
 if __name__ == "__main__":
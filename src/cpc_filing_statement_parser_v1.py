@@ -1,11 +1,17 @@
 import os
+import sys
 import re
-import json
 import hashlib
 from datetime import datetime, timezone
 from typing import Dict, Any, List, Optional
 
-import requests
+import sb_http
+
+import cpc_link_resolver
+from cpc_records import CpcEventRow, stream_rows
+import parse_cache
+import parser_dryrun
+import parser_queue
 
 # 1) Constantes / config
 SUPABASE_URL = os.environ["SUPABASE_URL"]
@@ -13,7 +19,9 @@ SUPABASE_KEY = os.environ["SUPABASE_SERVICE_KEY"]
 
 VIEW_NAME = "vw_bulletins_with_canonical"
 EVENTS_TABLE = "cpc_events"
-BIRTH_TABLE = "cpc_birth"
+
+# body_text é buscado depois, só para os registros que passam no prepare
+META_COLUMNS = "id,company,ticker,composite_key,canonical_type,canonical_class,bulletin_date,tier,parser_profile,parser_status"
 
 COMPOSITE_KEY = os.getenv("COMPOSITE_KEY", "").strip()  # opcional
 PARSER_PROFILE_ENV = os.getenv("PARSER_PROFILE", "cpc_filing_statement_v1").strip() or "cpc_filing_statement_v1"
@@ -69,86 +77,53 @@ def parse_dated_to_yyyy_mm_dd(text: str) -> Optional[str]:
 
 def fetch_marked_rows() -> list[dict]:
     """
-    Busca na view apenas linhas marcadas como ready para este parser_profile,
-    e do tipo CPC-Filing Statement.
+    Reivindica (claim com lease) um lote de linhas ready deste parser_profile,
+    do tipo CPC-Filing Statement, e busca seus dados na view.
     """
-    url = f"{SUPABASE_URL}/rest/v1/{VIEW_NAME}"
-    params: Dict[str, Any] = {
-        "select": "id,company,ticker,composite_key,canonical_type,canonical_class,bulletin_date,tier,body_text,parser_profile,parser_status",
-        "parser_profile": f"eq.{PARSER_PROFILE_ENV}",
-        "parser_status": "eq.ready",
-        "canonical_type": "ilike.*filing statement*",
-        "order": "bulletin_date.asc",
-        "limit": "1000",
-    }
-    if COMPOSITE_KEY:
-        params["composite_key"] = f"eq.{COMPOSITE_KEY}"
-
-    resp = requests.get(url, headers=sb_headers(), params=params, timeout=60)
-    resp.raise_for_status()
-    return resp.json()
-
-def find_cpc_birth_id(company: str | None, ticker: str | None) -> Optional[str]:
+    ids = parser_queue.claim_rows(
+        PARSER_PROFILE_ENV,
+        type_pattern="%filing statement%",
+        composite_key=COMPOSITE_KEY,
+        canonical_type="CPC-FILING STATEMENT",
+    )
+    return parser_queue.fetch_rows(ids, META_COLUMNS)
+
+def resolve_event_row(rec: dict) -> Optional[Dict[str, Any]]:
     """
-    Resolve o UUID em cpc_birth para o evento atual.
-    Estratégia v1: tenta ticker primeiro, e em seguida company + ticker.
+    Fase 1 (sem body_text): resolve o cpc_birth_id (pode ficar None).
     """
-    url = f"{SUPABASE_URL}/rest/v1/{BIRTH_TABLE}"
-    headers = sb_headers()
-
-    t = clean_space(ticker).upper()
-    c = clean_space(company).upper()
-
-    # 1) ticker
-    if t:
-        params = {"select": "id", "ticker": f"eq.{t}", "limit": 1}
-        r = requests.get(url, headers=headers, params=params, timeout=60)
-        r.raise_for_status()
-        data = r.json()
-        if data:
-            return data[0]["id"]
-
-    # 2) company + ticker
-    if c and t:
-        params = {"select": "id", "company_name": f"eq.{c}", "ticker": f"eq.{t}", "limit": 1}
-        r = requests.get(url, headers=headers, params=params, timeout=60)
-        r.raise_for_status()
-        data = r.json()
-        if data:
-            return data[0]["id"]
-
-    return None
-
-def build_event_row(rec: dict) -> Optional[Dict[str, Any]]:
+    rec["cpc_birth_id"] = cpc_link_resolver.find_cpc_birth_id(rec.get("company"), rec.get("ticker"))
+    return rec
+
+def build_event_row(rec: dict) -> Optional[CpcEventRow]:
     body = rec.get("body_text") or ""
     effective_date = parse_dated_to_yyyy_mm_dd(body)
     if not effective_date:
         return None
 
-    company = rec.get("company")
-    ticker = rec.get("ticker")
-    cpc_birth_id = find_cpc_birth_id(company, ticker)
+    if "cpc_birth_id" not in rec:
+        resolve_event_row(rec)
+    cpc_birth_id = rec["cpc_birth_id"]
 
     summary = "Exchange accepted for filing the Company's CPC Filing Statement."
 
     src_hash = hashlib.sha1(body.encode("utf-8")).hexdigest()
 
-    return {
-        "cpc_birth_id": cpc_birth_id,
-        "event_composite_key": rec.get("composite_key"),
-        "event_type": clean_space(rec.get("canonical_type") or "CPC-FILING STATEMENT"),
-        "bulletin_date": rec.get("bulletin_date"),
-        "event_effective_date": effective_date,
-        "event_effective_time": None,
-        "event_effective_text": None,
-        "event_summary": summary,
-        "event_body_raw": body,
-        "parse_version": PARSER_PROFILE_ENV,
-        "parsed_at": now_iso(),
-        "source_hash": src_hash,
-    }
-
-def upsert_events(rows: List[Dict[str, Any]]) -> None:
+    return CpcEventRow(
+        cpc_birth_id=cpc_birth_id,
+        event_composite_key=rec.get("composite_key"),
+        event_type=clean_space(rec.get("canonical_type") or "CPC-FILING STATEMENT"),
+        bulletin_date=rec.get("bulletin_date"),
+        event_effective_date=effective_date,
+        event_effective_time=None,
+        event_effective_text=None,
+        event_summary=summary,
+        parse_version=PARSER_PROFILE_ENV,
+        parsed_at=now_iso(),
+        source_hash=src_hash,
+    )
+
+def upsert_events(rows: List[CpcEventRow]) -> None:
     url = f"{SUPABASE_URL}/rest/v1/{EVENTS_TABLE}"
     headers = {
         **sb_headers(),
@@ -156,77 +131,61 @@ def upsert_events(rows: List[Dict[str, Any]]) -> None:
         "Prefer": "resolution=merge-duplicates",
     }
     params = {"on_conflict": "event_composite_key"}
-    resp = requests.post(url, headers=headers, params=params, data=json.dumps(rows), timeout=60)
+    resp = sb_http.post(url, headers=headers, params=params, data=stream_rows(rows), timeout=60)
     if not resp.ok:
         print("Erro ao inserir em cpc_events:", resp.status_code, resp.text)
         resp.raise_for_status()
 
-def mark_status(ids: List[int], status: str, set_parsed_at: bool = False) -> None:
-    url = f"{SUPABASE_URL}/rest/v1/all_data"
-    headers = {
-        **sb_headers(),
-        "Content-Type": "application/json",
-        "Prefer": "return=representation",
-    }
-    payload: Dict[str, Any] = {"parser_status": status}
-    if status in ("ready", "running"):
-        payload["parser_parsed_at"] = None
-    if set_parsed_at:
-        payload["parser_parsed_at"] = now_iso()
-
-    for id_ in ids:
-        r = requests.patch(f"{url}?id=eq.{id_}", headers=headers, data=json.dumps(payload), timeout=60)
-        if not r.ok:
-            print("Erro ao atualizar status em all_data:", id_, r.status_code, r.text)
-            r.raise_for_status()
+def commit_events(rows: List[CpcEventRow]) -> None:
+    """Upsert em cpc_events + fila de vínculo para eventos sem cpc_birth_id."""
+    upsert_events(rows)
+    cpc_link_resolver.enqueue_pending(
+        [r["event_composite_key"] for r in rows if not r.get("cpc_birth_id")],
+        PARSER_PROFILE_ENV,
+    )
 
-def mark_running(ids: List[int]) -> None:
-    mark_status(ids, "running")
 
-def mark_done(ids: List[int]) -> None:
-    # done + parsed_at
-    mark_status(ids, "done", set_parsed_at=True)
+def batch_spec() -> Dict[str, Any]:
+    """Argumentos de parser_queue.run_batches (também usados pelo parser_worker)."""
+    return {
+        "fetch": fetch_marked_rows,
+        # cache local (source_hash + versão do parser): reruns só parseiam o que mudou
+        "parse": parse_cache.cached(
+            build_event_row,
+            PARSER_PROFILE_ENV,
+            parse_cache.code_version(PARSER_PROFILE_ENV, __file__),
+            CpcEventRow,
+        ),
+        "commit": commit_events,
+        "prepare": resolve_event_row,
+        "label": f"CPC Filing Statement (profile={PARSER_PROFILE_ENV})",
+        "profile": PARSER_PROFILE_ENV,
+    }
 
-def mark_error(id_: int) -> None:
-    mark_status([id_], "error")
 
 def main() -> None:
-    records = fetch_marked_rows()
-    if not records:
-        print("Nada a processar.")
+    spec = batch_spec()
+
+    if "--dry-run" in sys.argv:
+        # Só leitura: parseia o histórico do profile e compara com cpc_events
+        parser_dryrun.run_dry_run(
+            PARSER_PROFILE_ENV,
+            META_COLUMNS,
+            spec["prepare"],
+            spec["parse"],
+            table=EVENTS_TABLE,
+            key_field="event_composite_key",
+            label=spec["label"],
+            type_pattern="%filing statement%",
+            composite_key=COMPOSITE_KEY,
+        )
         return
 
-    ids_all = [int(r["id"]) for r in records if r.get("id") is not None]
-    if ids_all:
-        mark_running(ids_all)
-
-    out_rows: List[Dict[str, Any]] = []
-    ids_done: List[int] = []
-
-    for rec in records:
-        rid = rec.get("id")
-        try:
-            row = build_event_row(rec)
-            if row:
-                out_rows.append(row)
-                if rid is not None:
-                    ids_done.append(int(rid))
-            else:
-                if rid is not None:
-                    print("Não foi possível extrair effective_date; marcando error:", rid)
-                    mark_error(int(rid))
-        except Exception as e:
-            if rid is not None:
-                print("Erro ao processar registro; marcando error:", rid, str(e))
-                mark_error(int(rid))
-
-    if out_rows:
-        upsert_events(out_rows)
-
-    if ids_done:
-        mark_done(ids_done)
-
-    print(f"Finalizado. done={len(ids_done)} total={len(ids_all)}")
+    parser_queue.run_batches(
+        **spec,
+        single=bool(COMPOSITE_KEY),
+        resume="--resume" in sys.argv,
+    )
 
 if __name__ == "__main__":
     main()
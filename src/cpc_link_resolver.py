@@ -0,0 +1,250 @@
+import os
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import sb_http
+import cpc_name_index
+
+# ======================================================
+# Re-resolução incremental de cpc_events sem cpc_birth_id
+#
+# - Os parsers de eventos chamam enqueue_pending() para eventos gravados
+#   com cpc_birth_id = None (tabela cpc_event_pending_links).
+# - O parser de cpc_birth chama resolve_for_births() com as linhas que
+#   acabou de gravar: só os eventos pendentes com ticker/company dessas
+#   linhas são consultados e recebem cpc_birth_id num PATCH por birth.
+#   O nome é comparado pela chave de cpc_name_index.normalize_name
+#   (company_key na fila, preenchida por public.cpc_name_key), a mesma
+#   do vínculo: a seleção não deixa de fora o que match_birth vincularia.
+# - match_birth é a única regra de vínculo evento -> cpc_birth: os
+#   parsers a aplicam contra o cpc_birth inteiro (find_cpc_birth_id) e
+#   resolve_for_births contra as births recém-gravadas.
+# - Rodando este arquivo direto, todos os pendentes são conferidos contra
+#   cpc_birth (recuperação / catch-up). Nenhum body é re-parseado.
+# ======================================================
+
+SUPABASE_URL = os.environ["SUPABASE_URL"]
+SUPABASE_KEY = (
+    os.environ.get("SUPABASE_SERVICE_KEY")
+    or os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+)
+if not SUPABASE_KEY:
+    raise RuntimeError(
+        "Missing env: SUPABASE_SERVICE_KEY or SUPABASE_SERVICE_ROLE_KEY"
+    )
+
+PENDING_TABLE = "cpc_event_pending_links"
+EVENTS_TABLE = "cpc_events"
+BIRTH_TABLE = "cpc_birth"
+
+PAGE_SIZE = 1000
+IN_CHUNK = 200
+
+
+def sb_headers() -> Dict[str, str]:
+    return {
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+# --- Normalização (mesma regra da função SQL cpc_ticker_variants) ---
+def ticker_variants(ticker: str | None) -> Tuple[str, ...]:
+    out: List[str] = []
+    for t in (ticker or "").split(","):
+        t = t.strip().upper()
+        if not t:
+            continue
+        out.append(t)
+        root = t.split(".")[0].strip()
+        if root:
+            out.append(root)
+    return tuple(dict.fromkeys(out))
+
+
+def match_birth(
+    company: str | None,
+    ticker: str | None,
+    by_ticker: Callable[[str], Optional[str]],
+    by_company: Callable[[str], Optional[str]],
+) -> Optional[str]:
+    """
+    Regra única de vínculo evento -> cpc_birth: cada variante do ticker do
+    evento (o próprio e a raiz sem .P, nessa ordem) contra as variantes de
+    ticker/trading_symbol das births; depois o nome (regras de cpc_name_index).
+    """
+    for t in ticker_variants(ticker):
+        bid = by_ticker(t)
+        if bid:
+            return bid
+    return by_company(company) if company else None
+
+
+def find_cpc_birth_id(company: str | None, ticker: str | None) -> Optional[str]:
+    """match_birth contra o cpc_birth inteiro (parsers de eventos)."""
+    return match_birth(
+        company, ticker, cpc_name_index.find_by_ticker, cpc_name_index.find_by_company
+    )
+
+
+def chunks(values: List[Any], size: int = IN_CHUNK) -> Iterable[List[Any]]:
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def quote_list(values: Iterable[str]) -> str:
+    # valores entre aspas: tickers com '.' e nomes com ',' ou espaços
+    return ",".join('"' + v.replace('"', '\\"') + '"' for v in values)
+
+
+def fetch_all(table: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    url = f"{SUPABASE_URL}/rest/v1/{table}"
+    out: List[Dict[str, Any]] = []
+    offset = 0
+    while True:
+        page = {**params, "limit": PAGE_SIZE, "offset": offset}
+        resp = sb_http.get(url, headers=sb_headers(), params=page, timeout=60)
+        resp.raise_for_status()
+        data = resp.json()
+        out.extend(data)
+        if len(data) < PAGE_SIZE:
+            return out
+        offset += PAGE_SIZE
+
+
+# --- Fila ---
+def enqueue_pending(event_keys: List[str], profile: str) -> int:
+    """Enfileira eventos gravados sem cpc_birth_id (um RPC por lote)."""
+    keys = [k for k in event_keys if k]
+    if not keys:
+        return 0
+    url = f"{SUPABASE_URL}/rest/v1/rpc/enqueue_pending_links"
+    payload = {"p_keys": keys, "p_profile": profile}
+    resp = sb_http.post(url, headers=sb_headers(), data=json.dumps(payload), timeout=60)
+    if not resp.ok:
+        print("Erro ao enfileirar vínculos pendentes:", resp.status_code, resp.text)
+        resp.raise_for_status()
+    count = int(resp.json() or 0)
+    print(f"{count} eventos sem cpc_birth_id na fila de vínculo pendente.")
+    return count
+
+
+def build_birth_index(
+    births: List[Dict[str, Any]],
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Índices ticker -> id e nome (normalize_name) -> id. Em colisão vence
+    o cpc_birth mais antigo (mesma regra de order=bulletin_date.asc dos parsers).
+    """
+    by_ticker: Dict[str, str] = {}
+    by_company: Dict[str, str] = {}
+    ordered = sorted(births, key=lambda b: b.get("bulletin_date") or "9999-12-31")
+    for b in ordered:
+        bid = b.get("id")
+        if not bid:
+            continue
+        for source in (b.get("ticker"), b.get("trading_symbol")):
+            for t in ticker_variants(source):
+                by_ticker.setdefault(t, bid)
+        c = cpc_name_index.normalize_name(b.get("company_name"))
+        if c:
+            by_company.setdefault(c, bid)
+    return by_ticker, by_company
+
+
+def fetch_affected_pending(
+    tickers: List[str], companies: List[str]
+) -> List[Dict[str, Any]]:
+    """Só os pendentes que compartilham ticker ou nome (normalize_name) com as births dadas."""
+    seen: Dict[str, Dict[str, Any]] = {}
+    select = "event_composite_key,company_norm,company_key,tickers"
+    for part in chunks(tickers):
+        params = {"select": select, "tickers": "ov.{" + quote_list(part) + "}"}
+        for r in fetch_all(PENDING_TABLE, params):
+            seen[r["event_composite_key"]] = r
+    for part in chunks(companies):
+        params = {"select": select, "company_key": f"in.({quote_list(part)})"}
+        for r in fetch_all(PENDING_TABLE, params):
+            seen[r["event_composite_key"]] = r
+    return list(seen.values())
+
+
+def link_events(cpc_birth_id: str, event_keys: List[str]) -> int:
+    url = f"{SUPABASE_URL}/rest/v1/{EVENTS_TABLE}"
+    headers = {**sb_headers(), "Prefer": "return=representation"}
+    linked = 0
+    for part in chunks(event_keys):
+        params = {
+            "event_composite_key": f"in.({quote_list(part)})",
+            "cpc_birth_id": "is.null",
+            "select": "event_composite_key",
+        }
+        payload = {"cpc_birth_id": cpc_birth_id}
+        resp = sb_http.patch(url, headers=headers, params=params, data=json.dumps(payload), timeout=60)
+        if not resp.ok:
+            print("Erro ao vincular eventos:", cpc_birth_id, resp.status_code, resp.text)
+            resp.raise_for_status()
+        linked += len(resp.json())
+    return linked
+
+
+def drop_pending(event_keys: List[str]) -> None:
+    url = f"{SUPABASE_URL}/rest/v1/{PENDING_TABLE}"
+    headers = {**sb_headers(), "Prefer": "return=minimal"}
+    for part in chunks(event_keys):
+        params = {"event_composite_key": f"in.({quote_list(part)})"}
+        resp = sb_http.delete(url, headers=headers, params=params, timeout=60)
+        if not resp.ok:
+            print("Erro ao limpar vínculos pendentes:", resp.status_code, resp.text)
+            resp.raise_for_status()
+
+
+def resolve_for_births(births: List[Dict[str, Any]]) -> int:
+    """
+    Vincula os eventos pendentes afetados pelas births informadas
+    (cada item: id, ticker, trading_symbol, company_name, bulletin_date).
+    Retorna quantos eventos receberam cpc_birth_id.
+    """
+    by_ticker, by_company = build_birth_index(births)
+    if not by_ticker and not by_company:
+        return 0
+
+    pending = fetch_affected_pending(list(by_ticker), list(by_company))
+    if not pending:
+        return 0
+
+    names = cpc_name_index.CompanyNameIndex(births)
+    groups: Dict[str, List[str]] = {}
+    for p in pending:
+        # tickers da fila vêm ordenados; o ticker completo antes da raiz
+        tickers = sorted(p.get("tickers") or [], key=lambda t: "." not in t)
+        company = p.get("company_key") or p.get("company_norm")
+        bid = match_birth(company, ",".join(tickers), by_ticker.get, names.best)
+        if bid:
+            groups.setdefault(bid, []).append(p["event_composite_key"])
+
+    linked = 0
+    resolved: List[str] = []
+    for bid, keys in groups.items():
+        linked += link_events(bid, keys)
+        resolved.extend(keys)
+
+    # eventos que já tinham cpc_birth_id também saem da fila
+    drop_pending(resolved)
+    print(f"Vínculos pendentes resolvidos: {linked} eventos ({len(resolved)} saíram da fila).")
+    return linked
+
+
+def main() -> None:
+    births = fetch_all(
+        BIRTH_TABLE,
+        {"select": "id,ticker,trading_symbol,company_name,bulletin_date", "order": "id.asc"},
+    )
+    print(f"{len(births)} linhas de cpc_birth carregadas.")
+    resolve_for_births(births)
+    sb_http.print_metrics("cpc_link_resolver")
+
+
+if __name__ == "__main__":
+    main()
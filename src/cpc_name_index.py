@@ -0,0 +1,198 @@
+import os
+import re
+import heapq
+import unicodedata
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import sb_http
+
+# ======================================================
+# Índice local de trigramas sobre cpc_birth.company_name
+#
+# Substitui o fallback company_name=ilike.%...% dos parsers de eventos
+# (scan completo no servidor). Os nomes são normalizados (sem
+# [formerly ...], pontuação e sufixos Inc./Corp./Ltd.) e a busca devolve
+# os top-k por similaridade de Dice sobre trigramas, em memória.
+# Carregado uma vez por processo (load_index / find_by_company).
+#
+# Match aproximado aceito a partir de CPC_NAME_MATCH_THRESHOLD (padrão
+# 0.9): plural/singular, um erro de digitação ou "West Bridge" x
+# "Westbridge" ficam acima de 0.9; nomes que diferem numa palavra inteira
+# ("Northern"/"Southern", "... Partners") ficam perto de 0.75-0.8. Números
+# e romanos diferentes nunca casam (serial_tokens). CPC_NAME_MATCH_THRESHOLD=1
+# volta a aceitar só o nome normalizado exato. Todo vínculo aproximado
+# aceito é logado com o score para auditoria.
+#
+# O mesmo carregamento guarda as variantes de ticker de cada cpc_birth
+# (by_ticker, cpc_link_resolver.build_birth_index): os parsers resolvem
+# o vínculo com cpc_link_resolver.match_birth sobre find_by_ticker e
+# find_by_company, a mesma regra do resolvedor de pendentes.
+#
+# Run de um boletim só (COMPOSITE_KEY): carregar o índice inteiro custa
+# mais que o parse; tenta antes o servidor (RPCs cpc_birth_id_by_ticker e
+# cpc_birth_id_by_company) e, no nome, só cai no índice se não achar.
+# ======================================================
+
+# similaridade mínima para aceitar um match por nome (1.0 = só exato)
+MATCH_THRESHOLD = float(os.environ.get("CPC_NAME_MATCH_THRESHOLD") or 0.9)
+TOP_K = 5
+SINGLE_KEY = bool((os.environ.get("COMPOSITE_KEY") or "").strip())
+
+ROMAN_RE = re.compile(r"[IVX]+")
+
+CORPORATE_SUFFIXES = {
+    "INC", "INCORPORATED", "CORP", "CORPORATION", "LTD", "LIMITED",
+    "LTEE", "CO", "COMPANY", "PLC", "LLC", "SA",
+}
+
+
+def normalize_name(company: str | None) -> str:
+    """
+    Caixa alta, sem acentos, pontuação, [formerly ...] e sufixos societários
+    (mesma regra da função SQL cpc_name_key, company_key da fila de pendentes).
+    """
+    c = re.sub(r"\[formerly.*?\]", " ", company or "", flags=re.IGNORECASE)
+    c = unicodedata.normalize("NFKD", c).encode("ascii", "ignore").decode("ascii")
+    c = re.sub(r"[^A-Z0-9 ]+", " ", c.upper())
+    words = c.split()
+    while words and words[-1] in CORPORATE_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+def serial_tokens(name: str) -> Set[str]:
+    """Números e romanos ('ABC CAPITAL II' x 'ABC CAPITAL'): CPCs em série são empresas distintas."""
+    return {w for w in name.split() if w.isdigit() or ROMAN_RE.fullmatch(w)}
+
+
+def trigrams(name: str) -> Set[str]:
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CompanyNameIndex:
+    def __init__(
+        self,
+        births: List[Dict[str, Any]],
+        by_ticker: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.by_ticker: Dict[str, str] = by_ticker or {}
+        self._ids: List[str] = []
+        self._names: List[str] = []
+        self._sizes: List[int] = []
+        self._exact: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = {}
+
+        # mais antigo primeiro: em empate de score vence o cpc_birth original
+        ordered = sorted(births, key=lambda b: b.get("bulletin_date") or "9999-12-31")
+        for b in ordered:
+            name = normalize_name(b.get("company_name"))
+            if not b.get("id") or not name:
+                continue
+            idx = len(self._ids)
+            self._ids.append(b["id"])
+            self._names.append(name)
+            grams = trigrams(name)
+            self._sizes.append(len(grams))
+            self._exact.setdefault(name, idx)
+            for g in grams:
+                self._postings.setdefault(g, []).append(idx)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def lookup(self, company: str | None, k: int = TOP_K) -> List[Tuple[float, str, str]]:
+        """Top-k (score, cpc_birth_id, nome normalizado), score de Dice em [0, 1]."""
+        name = normalize_name(company)
+        if not name:
+            return []
+        exact = self._exact.get(name)
+        if exact is not None:
+            return [(1.0, self._ids[exact], name)]
+
+        grams = trigrams(name)
+        shared: Dict[int, int] = {}
+        for g in grams:
+            for idx in self._postings.get(g, ()):
+                shared[idx] = shared.get(idx, 0) + 1
+
+        scored = (
+            (2.0 * n / (len(grams) + self._sizes[idx]), -idx)
+            for idx, n in shared.items()
+        )
+        return [
+            (score, self._ids[-neg], self._names[-neg])
+            for score, neg in heapq.nlargest(k, scored)
+        ]
+
+    def best(self, company: str | None, threshold: float = MATCH_THRESHOLD) -> Optional[str]:
+        query = normalize_name(company)
+        serial = serial_tokens(query)
+        for score, birth_id, name in self.lookup(company):
+            if score < threshold:
+                break
+            if name == query:
+                return birth_id
+            if serial_tokens(name) == serial:
+                print(
+                    f"Vínculo aproximado por nome: {company!r} -> {name!r} "
+                    f"({birth_id}) score={score:.3f}"
+                )
+                return birth_id
+        return None
+
+
+_INDEX: Optional[CompanyNameIndex] = None
+
+
+def load_index(refresh: bool = False) -> CompanyNameIndex:
+    global _INDEX
+    if _INDEX is None or refresh:
+        # import tardio: cpc_link_resolver exige as envs do Supabase
+        import cpc_link_resolver
+
+        births = cpc_link_resolver.fetch_all(
+            cpc_link_resolver.BIRTH_TABLE,
+            {"select": "id,ticker,trading_symbol,company_name,bulletin_date", "order": "id.asc"},
+        )
+        by_ticker, _ = cpc_link_resolver.build_birth_index(births)
+        _INDEX = CompanyNameIndex(births, by_ticker)
+        print(f"Índice de nomes de cpc_birth: {len(_INDEX)} empresas.")
+    return _INDEX
+
+
+def rpc_birth_id(function: str, payload: Dict[str, Any]) -> Optional[str]:
+    # import tardio: cpc_link_resolver exige as envs do Supabase
+    import cpc_link_resolver
+
+    resp = sb_http.post(
+        f"{cpc_link_resolver.SUPABASE_URL}/rest/v1/rpc/{function}",
+        headers=cpc_link_resolver.sb_headers(),
+        json=payload,
+        timeout=60,
+    )
+    resp.raise_for_status()
+    return resp.json() or None
+
+
+def exact_match(company: str) -> Optional[str]:
+    """cpc_birth_id pelo nome exato (cpc_norm_company) no servidor, sem índice."""
+    return rpc_birth_id("cpc_birth_id_by_company", {"p_company": company})
+
+
+def find_by_ticker(ticker: str) -> Optional[str]:
+    """cpc_birth_id mais antigo com essa variante de ticker/trading_symbol ou None."""
+    if SINGLE_KEY and _INDEX is None:
+        return rpc_birth_id("cpc_birth_id_by_ticker", {"p_ticker": ticker})
+    return load_index().by_ticker.get(ticker.strip().upper())
+
+
+def find_by_company(company: str | None) -> Optional[str]:
+    """cpc_birth_id do melhor match por nome (exato ou >= MATCH_THRESHOLD) ou None."""
+    if not normalize_name(company):
+        return None
+    if SINGLE_KEY and _INDEX is None:
+        found = exact_match(company)
+        if found:
+            return found
+    return load_index().best(company)
@@ -0,0 +1,150 @@
+import os
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+# ======================================================
+# Registros compactos (__slots__) para cpc_birth e cpc_events
+#
+# Só o contêiner, um dict de 36 chaves por linha de cpc_birth ocupa ~840 B
+# e o objeto com __slots__ ~330 B (2,5x; tracemalloc, CPython 3.11, ver
+# tests/test_cpc_records.py). Contando os valores (strings distintas por
+# linha) a linha inteira fica ~15% menor. Em backfills as linhas ficam em
+# memória até o upsert, então os parsers montam estes registros e eles são
+# serializados direto para o JSON do upsert (sem dict intermediário).
+# A interface de item (row["campo"], row.get) é mantida para o código
+# de parse existente.
+#
+# O corpo do upsert é gerado em pedaços de STREAM_CHUNK_BYTES (corpo
+# chunked): o JSON do lote nunca existe como uma string única.
+# ======================================================
+
+STREAM_CHUNK_BYTES = int(os.environ.get("UPSERT_STREAM_CHUNK_KB") or 64) * 1024
+
+BIRTH_FIELDS = [
+    "company_name",
+    "ticker",
+    "composite_key",
+    "canonical_type",
+    "bulletin_date",
+    "tier",
+    "prospectus_date",
+    "prospectus_date_iso",
+    "effective_date",
+    "effective_date_iso",
+    "gross_proceeds",
+    "gross_proceeds_value",
+    "gross_proceeds_class",
+    "gross_proceeds_class_volume",
+    "gross_proceeds_volume_value",
+    "gross_proceeds_value_per_share",
+    "commence_date",
+    "commence_date_iso",
+    "corporate_jurisdiction",
+    "capitalization",
+    "capitalization_volume",
+    "capitalization_volume_value",
+    "capitalization_class",
+    "escrowed_shares",
+    "escrowed_shares_value",
+    "escrowed_shares_class",
+    "transfer_agent",
+    "trading_symbol",
+    "cusip_number",
+    "sponsoring_member",
+    "agent",
+    "agent_option",
+    "agent_option_value",
+    "agent_option_class",
+    "agent_option_price_per_share",
+    "agents_options_duration_months",
+]
+
+EVENT_FIELDS = [
+    "cpc_birth_id",
+    "event_composite_key",
+    "event_type",
+    "bulletin_date",
+    "event_effective_date",
+    "event_effective_time",
+    "event_effective_text",
+    "event_summary",
+    # sem event_body_raw: o body fica em bulletin_bodies, por source_hash
+    "parse_version",
+    "parsed_at",
+    "source_hash",
+]
+
+
+class SlottedRow:
+    __slots__ = ()
+
+    def __init__(self, **values: Any) -> None:
+        for field in self.__slots__:
+            setattr(self, field, values.pop(field, None))
+        if values:
+            raise TypeError(f"Campos desconhecidos em {type(self).__name__}: {sorted(values)}")
+
+    def __getitem__(self, field: str) -> Any:
+        return getattr(self, field)
+
+    def __setitem__(self, field: str, value: Any) -> None:
+        setattr(self, field, value)
+
+    def get(self, field: str, default: Any = None) -> Any:
+        return getattr(self, field, default)
+
+    def items(self) -> Iterator[tuple]:
+        for field in self.__slots__:
+            yield field, getattr(self, field)
+
+    def to_payload(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def to_json(self) -> str:
+        """Objeto JSON montado campo a campo, sem dict intermediário."""
+        return "{" + ",".join(
+            f"{json.dumps(field)}:{json.dumps(getattr(self, field))}"
+            for field in self.__slots__
+        ) + "}"
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_payload()!r})"
+
+
+class CpcBirthRow(SlottedRow):
+    __slots__ = tuple(BIRTH_FIELDS)
+
+
+class CpcEventRow(SlottedRow):
+    __slots__ = tuple(EVENT_FIELDS)
+
+
+def row_payload(row: Any) -> Dict[str, Any]:
+    return row.to_payload() if isinstance(row, SlottedRow) else row
+
+
+def iter_rows_json(rows: Iterable[Any], chunk_bytes: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    JSON array do upsert em pedaços de ~chunk_bytes, linha a linha.
+    Aceita registros slotted ou dicts (replay do journal, all_data).
+    """
+    parts = [b"["]
+    size = 1
+    sep = b""
+    for r in rows:
+        piece = (r.to_json() if isinstance(r, SlottedRow) else json.dumps(r)).encode("utf-8")
+        parts.append(sep)
+        parts.append(piece)
+        size += len(sep) + len(piece)
+        sep = b","
+        if size >= chunk_bytes:
+            yield b"".join(parts)
+            parts = []
+            size = 0
+    parts.append(b"]")
+    yield b"".join(parts)
+
+
+def stream_rows(rows: Iterable[Any]) -> Callable[[], Iterator[bytes]]:
+    """Corpo para sb_http (data=...): o gerador é refeito a cada tentativa."""
+    return lambda: iter_rows_json(rows)
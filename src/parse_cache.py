@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Type
+
+import bulletin_labels
+import cpc_records
+from cpc_records import SlottedRow, row_payload
+
+# ======================================================
+# Cache local de resultados de parse (SQLite, LRU por tamanho)
+#
+# Chave: profile + versão do parser + sha1 do body + metadados do registro.
+# A versão inclui o hash do arquivo do parser: editar o código invalida o
+# cache sozinho, então reruns de desenvolvimento/recuperação só pagam CPU
+# pelo que mudou. Resultados None (registro descartado) também são
+# guardados. body_labels entra pelo sha1 (índice ou regex são caminhos
+# distintos do parser). cpc_birth_id não entra na chave; é reaplicado do
+# registro, e parsed_at é carimbado de novo a cada hit (é a hora deste parse).
+#
+# PARSE_CACHE=off desliga; PARSE_CACHE_PATH / PARSE_CACHE_MAX_MB ajustam.
+# Cada escrita é commitada na hora (autocommit + busy_timeout), então vários
+# processos podem abrir o mesmo arquivo; ainda assim o pipeline dá um arquivo
+# por estágio/shard. Erro de SQLite nunca derruba um parse: vira miss.
+# ======================================================
+
+CACHE_PATH = os.environ.get("PARSE_CACHE_PATH") or os.path.join(".parse_cache", "parse_cache.sqlite")
+MAX_BYTES = int(float(os.environ.get("PARSE_CACHE_MAX_MB") or 256) * 1024 * 1024)
+ENABLED = (os.environ.get("PARSE_CACHE") or "on").lower() not in ("0", "off", "false", "no")
+BUSY_TIMEOUT_MS = int(os.environ.get("PARSE_CACHE_BUSY_MS") or 2000)
+
+# campos do registro que não influenciam o parse (ou são reaplicados)
+IGNORED_INPUTS = {"id", "body_text", "body_labels", "cpc_birth_id", "parser_status", "parser_profile"}
+MISS = object()
+
+
+class ParseCache:
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = MAX_BYTES) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        # autocommit: nenhuma transação fica aberta entre operações
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        self.conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS parse_cache ("
+            " key TEXT PRIMARY KEY,"
+            " payload TEXT,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS parse_cache_lru ON parse_cache (last_used)")
+        self.total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM parse_cache").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.errors = 0
+
+    def get(self, key: str) -> Any:
+        """Payload JSON (str), None para resultado vazio, ou MISS."""
+        row = self.conn.execute("SELECT payload FROM parse_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return MISS
+        self.hits += 1
+        try:
+            # só afeta a ordem do LRU: se o arquivo estiver ocupado, segue sem
+            self.conn.execute("UPDATE parse_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.OperationalError:
+            self.errors += 1
+        return row[0]
+
+    def put(self, key: str, payload: Optional[str]) -> None:
+        size = len(key) + len(payload or "")
+        old = self.conn.execute("SELECT size FROM parse_cache WHERE key = ?", (key,)).fetchone()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO parse_cache (key, payload, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, payload, size, time.time()),
+        )
+        self.total += size - (old[0] if old else 0)
+        if self.total > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove os menos usados até ficar em 90% do limite."""
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        keys = []
+        for key, size in self.conn.execute("SELECT key, size FROM parse_cache ORDER BY last_used ASC"):
+            if self.total - freed <= target:
+                break
+            keys.append((key,))
+            freed += size
+        self.conn.executemany("DELETE FROM parse_cache WHERE key = ?", keys)
+        self.total -= freed
+        self.evicted += len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "errors": self.errors,
+            "size_mb": round(self.total / 1024 / 1024, 2),
+        }
+
+
+_CACHE: Optional[ParseCache] = None
+
+
+def get_cache() -> Optional[ParseCache]:
+    global _CACHE
+    if not ENABLED:
+        return None
+    if _CACHE is None:
+        try:
+            _CACHE = ParseCache()
+        except sqlite3.Error as e:
+            print(f"Cache de parse desligado ({CACHE_PATH}): {e}")
+            return None
+        atexit.register(_close)
+    return _CACHE
+
+
+def _close() -> None:
+    if _CACHE is not None:
+        _CACHE.conn.close()
+        print("Cache de parse:", " ".join(f"{k}={v}" for k, v in _CACHE.stats().items()))
+
+
+def code_version(parse_version: str, module_file: str) -> str:
+    """
+    PARSE_VERSION + hash do arquivo do parser e dos módulos que moldam a
+    linha (cpc_records, bulletin_labels): editar o código invalida o cache.
+    """
+    h = hashlib.sha1()
+    for path in (module_file, cpc_records.__file__, bulletin_labels.__file__):
+        with open(path, "rb") as fh:
+            h.update(fh.read())
+    return f"{parse_version}:{h.hexdigest()[:12]}"
+
+
+def cache_key(profile: str, version: str, rec: Dict[str, Any]) -> str:
+    body = (rec.get("body_text") or "").encode("utf-8")
+    inputs = {k: v for k, v in rec.items() if k not in IGNORED_INPUTS}
+    h = hashlib.sha1()
+    h.update(f"{profile}\x00{version}\x00".encode("utf-8"))
+    h.update(hashlib.sha1(body).digest())
+    # sem índice (None) e índice vazio/antigo não colidem com o índice atual
+    labels = json.dumps(rec.get("body_labels"), sort_keys=True, ensure_ascii=False)
+    h.update(hashlib.sha1(labels.encode("utf-8")).digest())
+    h.update(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def restamp(previous: Optional[str]) -> str:
+    """Hora UTC atual no mesmo formato do parsed_at guardado (com ou sem fuso)."""
+    now = datetime.now(timezone.utc)
+    if previous and (previous.endswith("Z") or "+" in previous[10:]):
+        return now.isoformat()
+    return now.replace(tzinfo=None).isoformat()
+
+
+def cached(
+    parse: Callable[[Dict[str, Any]], Any],
+    profile: str,
+    version: str,
+    row_cls: Type[SlottedRow],
+) -> Callable[[Dict[str, Any]], Any]:
+    """Envolve uma função de parse; sem cache habilitado devolve a própria função."""
+    cache = get_cache()
+    if cache is None:
+        return parse
+
+    def wrapper(rec: Dict[str, Any]) -> Any:
+        key = cache_key(profile, version, rec)
+        try:
+            hit = cache.get(key)
+        except sqlite3.Error:
+            cache.errors += 1
+            hit = MISS
+        if hit is not MISS:
+            if hit is None:
+                return None
+            row = row_cls(**json.loads(hit))
+            if "cpc_birth_id" in row_cls.__slots__:
+                row["cpc_birth_id"] = rec.get("cpc_birth_id")
+            if "parsed_at" in row_cls.__slots__:
+                row["parsed_at"] = restamp(row["parsed_at"])
+            return row
+
+        row = parse(rec)
+        try:
+            cache.put(key, None if row is None else json.dumps(row_payload(row), default=str))
+        except sqlite3.Error:
+            cache.errors += 1
+        return row
+
+    return wrapper
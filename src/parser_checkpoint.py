@@ -0,0 +1,105 @@
+import os
+import json
+import uuid
+from typing import Any, Dict, List
+
+from cpc_records import row_payload
+
+# ======================================================
+# Journal local de checkpoints dos parsers em lote
+#
+# Um arquivo JSONL por profile/shard em PARSER_CHECKPOINT_DIR. Cada lote
+# grava até três entradas, nesta ordem:
+#   claimed   -> ids reivindicados (e o worker dono do lease)
+#   parsed    -> linhas parseadas, ainda não gravadas no Supabase
+#   committed -> upsert + mark_done/mark_error concluídos
+# Com --resume, lotes "parsed" sem "committed" são regravados e lotes só
+# "claimed" voltam para ready (ver parser_queue.resume_from_journal).
+# ======================================================
+
+CHECKPOINT_DIR = os.environ.get("PARSER_CHECKPOINT_DIR") or ".parser_checkpoints"
+
+
+class CheckpointJournal:
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def new_batch(self) -> str:
+        return uuid.uuid4().hex[:12]
+
+    def claimed(self, batch: str, worker: str, ids: List[int]) -> None:
+        self._append({"op": "claimed", "batch": batch, "worker": worker, "ids": ids})
+
+    def parsed(
+        self,
+        batch: str,
+        rows: List[Any],
+        ids_done: List[int],
+        ids_error: List[int],
+    ) -> None:
+        self._append(
+            {
+                "op": "parsed",
+                "batch": batch,
+                "rows": [row_payload(r) for r in rows],
+                "ids_done": ids_done,
+                "ids_error": ids_error,
+            }
+        )
+
+    def committed(self, batch: str) -> None:
+        self._append({"op": "committed", "batch": batch})
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """
+        Lotes sem 'committed', na ordem em que foram reivindicados.
+        Cada item traz 'batch', 'worker', 'ids' e, se já parseado, 'parsed'.
+        Uma linha truncada no fim (processo morto no meio da escrita) é ignorada.
+        """
+        if not os.path.exists(self.path):
+            return []
+
+        batches: Dict[str, Dict[str, Any]] = {}
+        with open(self.path, encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    print("Linha inválida no journal; ignorando:", line[:80])
+                    continue
+
+                batch = entry.get("batch")
+                op = entry.get("op")
+                if op == "claimed":
+                    batches[batch] = {
+                        "batch": batch,
+                        "worker": entry.get("worker"),
+                        "ids": entry.get("ids") or [],
+                    }
+                elif op == "parsed" and batch in batches:
+                    batches[batch]["parsed"] = entry
+                elif op == "committed":
+                    batches.pop(batch, None)
+
+        return list(batches.values())
+
+    def clear(self) -> None:
+        # Trunca em vez de remover: o cache do workflow sempre salva o estado
+        # mais recente e nunca restaura um journal antigo com lotes já gravados.
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        open(self.path, "w", encoding="utf-8").close()
+
+
+def open_journal(profile: str, shard_index: int = 0, shard_count: int = 1) -> CheckpointJournal:
+    name = f"{profile}-shard{shard_index}of{shard_count}.jsonl"
+    return CheckpointJournal(os.path.join(CHECKPOINT_DIR, name))
@@ -0,0 +1,211 @@
+import os
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+import sb_http
+
+import parser_queue
+from cpc_records import row_payload
+
+# ======================================================
+# Dry-run com diff por campo (flag --dry-run dos parsers em lote)
+#
+# Lê o histórico do profile direto da view (sem claim, sem PATCH), parseia
+# com o código atual e compara com o que está gravado em cpc_birth /
+# cpc_events para as mesmas chaves. Nada é escrito no Supabase; o relatório
+# vai para o stdout e para DRY_RUN_REPORT (JSON).
+# ======================================================
+
+PAGE_SIZE = int(os.environ.get("DRY_RUN_PAGE_SIZE") or 500)
+KEYS_PER_REQUEST = 200
+SAMPLES_PER_FIELD = int(os.environ.get("DRY_RUN_SAMPLES") or 5)
+
+# campos que mudam a cada execução e não dizem nada sobre o parser
+VOLATILE_FIELDS = {"id", "parsed_at"}
+
+
+def fetch_meta_page(
+    profile: str,
+    select: str,
+    after_id: int,
+    type_pattern: str | None,
+    composite_key: str | None,
+) -> List[Dict[str, Any]]:
+    url = f"{parser_queue.SUPABASE_URL}/rest/v1/{parser_queue.VIEW_NAME}"
+    params: Dict[str, Any] = {
+        "select": select,
+        "parser_profile": f"eq.{profile}",
+        "id": f"gt.{after_id}",
+        "order": "id.asc",
+        "limit": PAGE_SIZE,
+    }
+    if type_pattern:
+        params["canonical_type"] = "ilike." + type_pattern.replace("%", "*")
+    if composite_key:
+        params["composite_key"] = f"eq.{composite_key}"
+    resp = sb_http.get(url, headers=parser_queue.sb_headers(), params=params, timeout=60)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def fetch_stored(table: str, key_field: str, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Linhas já gravadas para as mesmas chaves (um GET por página)."""
+    url = f"{parser_queue.SUPABASE_URL}/rest/v1/{table}"
+    stored: Dict[str, Dict[str, Any]] = {}
+    for start in range(0, len(keys), KEYS_PER_REQUEST):
+        part = keys[start:start + KEYS_PER_REQUEST]
+        quoted = ",".join('"' + k.replace('"', '\\"') + '"' for k in part)
+        params = {"select": "*", key_field: f"in.({quoted})"}
+        resp = sb_http.get(url, headers=parser_queue.sb_headers(), params=params, timeout=60)
+        resp.raise_for_status()
+        stored.update({r[key_field]: r for r in resp.json()})
+    return stored
+
+
+def same_value(old: Any, new: Any) -> bool:
+    if old is None or new is None:
+        return old is None and new is None
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        return float(old) == float(new)
+    return str(old).strip() == str(new).strip()
+
+
+class DiffReport:
+    def __init__(self) -> None:
+        self.records = 0
+        self.parsed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.new_rows = 0
+        self.rows_changed = 0
+        self.fields: Dict[str, Dict[str, Any]] = {}
+
+    def _field(self, name: str) -> Dict[str, Any]:
+        return self.fields.setdefault(
+            name,
+            {"changed": 0, "unchanged": 0, "newly_null": 0, "newly_filled": 0, "samples": []},
+        )
+
+    def compare(self, key: str, new: Dict[str, Any], old: Optional[Dict[str, Any]]) -> None:
+        self.parsed += 1
+        if old is None:
+            self.new_rows += 1
+            return
+
+        row_changed = False
+        for name, value in new.items():
+            if name in VOLATILE_FIELDS:
+                continue
+            stats = self._field(name)
+            before = old.get(name)
+            if same_value(before, value):
+                stats["unchanged"] += 1
+                continue
+
+            row_changed = True
+            stats["changed"] += 1
+            if value is None:
+                stats["newly_null"] += 1
+            elif before is None:
+                stats["newly_filled"] += 1
+            if len(stats["samples"]) < SAMPLES_PER_FIELD:
+                stats["samples"].append({"key": key, "old": before, "new": value})
+        if row_changed:
+            self.rows_changed += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "parsed": self.parsed,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "new_rows": self.new_rows,
+            "rows_changed": self.rows_changed,
+            "fields": self.fields,
+        }
+
+    def print_summary(self, label: str) -> None:
+        print(f"Dry-run {label}: {self.records} registros, {self.parsed} parseados, "
+              f"{self.skipped} descartados, {self.errors} erros.")
+        print(f"  linhas novas (sem versão gravada): {self.new_rows}")
+        print(f"  linhas gravadas que mudariam: {self.rows_changed}")
+        print(f"  {'campo':<34} {'changed':>8} {'unchanged':>10} {'newly_null':>11} {'newly_filled':>13}")
+        for name, st in sorted(self.fields.items(), key=lambda kv: -kv[1]["changed"]):
+            print(f"  {name:<34} {st['changed']:>8} {st['unchanged']:>10} "
+                  f"{st['newly_null']:>11} {st['newly_filled']:>13}")
+
+
+def run_dry_run(
+    profile: str,
+    meta_select: str,
+    prepare: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]] | None,
+    parse: Callable[[Dict[str, Any]], Any],
+    table: str,
+    key_field: str,
+    label: str,
+    type_pattern: str | None = None,
+    composite_key: str | None = None,
+) -> DiffReport:
+    """
+    Parseia todos os registros do profile (qualquer parser_status) e compara
+    com `table` por `key_field`. Somente leitura.
+    """
+    report = DiffReport()
+    after_id = 0
+
+    while True:
+        page = fetch_meta_page(profile, meta_select, after_id, type_pattern, composite_key)
+        if not page:
+            break
+        after_id = max(int(r["id"]) for r in page)
+        # a view não expõe composite_key_hash: o shard é filtrado aqui
+        page = [r for r in page if parser_queue.in_shard(r.get("composite_key"))]
+        report.records += len(page)
+
+        kept: List[Dict[str, Any]] = []
+        for rec in page:
+            try:
+                ready = prepare(rec) if prepare else rec
+            except Exception as e:
+                print("Dry-run: erro ao resolver", rec.get("composite_key"), str(e))
+                report.errors += 1
+                continue
+            if ready is None:
+                report.skipped += 1
+            else:
+                kept.append(ready)
+
+        new_rows: Dict[str, Dict[str, Any]] = {}
+        for start in range(0, len(kept), parser_queue.BODY_BATCH_SIZE):
+            chunk = kept[start:start + parser_queue.BODY_BATCH_SIZE]
+            bodies = parser_queue.fetch_bodies([int(r["id"]) for r in chunk])
+            for rec in chunk:
+                parser_queue.attach_body(rec, bodies)
+                try:
+                    row = parse(rec)
+                except Exception as e:
+                    print("Dry-run: erro ao parsear", rec.get("composite_key"), str(e))
+                    report.errors += 1
+                    continue
+                finally:
+                    parser_queue.detach_body(rec)
+                if row is None:
+                    report.skipped += 1
+                    continue
+                payload = row_payload(row)
+                new_rows[payload[key_field]] = payload
+
+        stored = fetch_stored(table, key_field, list(new_rows))
+        for key, payload in new_rows.items():
+            report.compare(key, payload, stored.get(key))
+
+        if composite_key:
+            break
+
+    report.print_summary(label)
+    sb_http.print_metrics(label)
+    path = os.environ.get("DRY_RUN_REPORT") or f"dry_run_{profile}.json"
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(report.to_dict(), fh, ensure_ascii=False, indent=2, default=str)
+    print(f"Relatório salvo em {path}")
+    return report
@@ -0,0 +1,488 @@
+import os
+import json
+import time
+import hashlib
+import uuid
+import socket
+import contextlib
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import sb_http
+
+import parser_checkpoint
+
+# ======================================================
+# Fila de parsing com lease (all_data)
+#
+# Usado pelos parsers em lote (cpc_birth, halt, resume, filing statement).
+# As funções SQL estão em supabase/migrations/*_parser_leases.sql:
+# - claim_parser_rows: ready -> running para até N linhas, atômico
+# - renew_parser_lease: estende o lease das linhas deste worker
+# - reclaim_expired_parser_leases: running com lease vencido -> ready
+# ======================================================
+
+SUPABASE_URL = os.environ["SUPABASE_URL"]
+SUPABASE_KEY = (
+    os.environ.get("SUPABASE_SERVICE_KEY")
+    or os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+)
+if not SUPABASE_KEY:
+    raise RuntimeError(
+        "Missing env: SUPABASE_SERVICE_KEY or SUPABASE_SERVICE_ROLE_KEY"
+    )
+
+VIEW_NAME = "vw_bulletins_with_canonical"
+
+CLAIM_BATCH_SIZE = int(os.environ.get("CLAIM_BATCH_SIZE") or 200)
+LEASE_SECONDS = int(os.environ.get("LEASE_SECONDS") or 600)
+BODY_BATCH_SIZE = int(os.environ.get("BODY_BATCH_SIZE") or 50)
+# Sharding: cada runner da matrix processa só composite_key_hash % COUNT == INDEX
+SHARD_INDEX = int(os.environ.get("SHARD_INDEX") or 0)
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT") or 1)
+if SHARD_COUNT < 1 or not 0 <= SHARD_INDEX < SHARD_COUNT:
+    raise RuntimeError(f"Shard inválido: SHARD_INDEX={SHARD_INDEX} SHARD_COUNT={SHARD_COUNT}")
+
+WORKER_ID = (
+    os.environ.get("PARSER_WORKER_ID")
+    or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+)
+
+# Faixas de all_data.parser_priority (ver *_parser_priority.sql)
+PRIORITY_BULK = 0     # backlog / backfill
+PRIORITY_RECENT = 1   # recém-ingerido
+PRIORITY_SINGLE = 2   # pedido de um boletim (route.ts / COMPOSITE_KEY)
+
+# claim restrito à faixa prioritária (None = todas); ver priority_lane()
+_min_priority: Optional[int] = None
+# claim restrito a uma janela de bulletin_date (None = todas); ver date_window()
+_date_window: Tuple[Optional[str], Optional[str]] = (None, None)
+# latências ponta a ponta (s) das linhas prioritárias concluídas neste processo
+LATENCIES: List[float] = []
+
+
+def sb_headers() -> Dict[str, str]:
+    return {
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def in_filter(values: List[Any]) -> str:
+    return "in.(" + ",".join(str(v) for v in values) + ")"
+
+
+def composite_key_hash(composite_key: str | None) -> int:
+    """Espelho em Python da coluna gerada all_data.composite_key_hash."""
+    digest = hashlib.md5((composite_key or "").encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) & 0x7FFFFFFF
+
+
+def in_shard(composite_key: str | None) -> bool:
+    return SHARD_COUNT <= 1 or composite_key_hash(composite_key) % SHARD_COUNT == SHARD_INDEX
+
+
+def rpc(name: str, payload: Dict[str, Any]) -> Any:
+    url = f"{SUPABASE_URL}/rest/v1/rpc/{name}"
+    resp = sb_http.post(url, headers=sb_headers(), data=json.dumps(payload), timeout=60)
+    if not resp.ok:
+        print(f"Erro na RPC {name}:", resp.status_code, resp.text)
+        resp.raise_for_status()
+    return resp.json()
+
+
+# --- Lease ---
+def claim_rows(
+    profile: str,
+    limit: int = CLAIM_BATCH_SIZE,
+    type_pattern: str | None = None,
+    composite_key: str | None = None,
+    canonical_type: str | None = None,
+) -> List[int]:
+    """
+    Reivindica até `limit` linhas ready (ou running com lease vencido) do
+    profile, marcando-as running para este worker. Retorna os ids.
+    `canonical_type` filtra por igualdade em all_data.canonical_types
+    (classificado na ingestão); `type_pattern` é o ILIKE sobre a view
+    (ex.: '%halt%'), usado só para linhas ainda não classificadas.
+    O filtro de shard (SHARD_INDEX/SHARD_COUNT) é aplicado no SQL.
+    Maior parser_priority primeiro; dentro de priority_lane() só a faixa
+    prioritária, dentro de date_window() só a janela de datas.
+    """
+    data = rpc(
+        "claim_parser_rows",
+        {
+            "p_profile": profile,
+            "p_worker_id": WORKER_ID,
+            "p_limit": limit,
+            "p_lease_seconds": LEASE_SECONDS,
+            "p_type_pattern": type_pattern,
+            "p_composite_key": composite_key or None,
+            "p_shard_index": SHARD_INDEX,
+            "p_shard_count": SHARD_COUNT,
+            "p_canonical_type": canonical_type,
+            "p_min_priority": _min_priority,
+            "p_from": _date_window[0],
+            "p_to": _date_window[1],
+        },
+    )
+    return [int(r["id"]) for r in data or []]
+
+
+@contextlib.contextmanager
+def priority_lane(min_priority: int = PRIORITY_RECENT) -> Iterator[None]:
+    """Dentro do bloco, claim_rows só reivindica linhas com prioridade >= min_priority."""
+    global _min_priority
+    previous = _min_priority
+    _min_priority = min_priority
+    try:
+        yield
+    finally:
+        _min_priority = previous
+
+
+@contextlib.contextmanager
+def date_window(date_from: str, date_to: str) -> Iterator[None]:
+    """Dentro do bloco, claim_rows só reivindica linhas com bulletin_date em [date_from, date_to]."""
+    global _date_window
+    previous = _date_window
+    _date_window = (date_from, date_to)
+    try:
+        yield
+    finally:
+        _date_window = previous
+
+
+def renew_lease(ids: List[int]) -> int:
+    if not ids:
+        return 0
+    return int(
+        rpc(
+            "renew_parser_lease",
+            {"p_worker_id": WORKER_ID, "p_ids": ids, "p_lease_seconds": LEASE_SECONDS},
+        )
+        or 0
+    )
+
+
+def reclaim_expired(profile: str | None = None) -> int:
+    return int(rpc("reclaim_expired_parser_leases", {"p_profile": profile}) or 0)
+
+
+def fetch_rows(ids: List[int], select: str) -> List[Dict[str, Any]]:
+    """
+    Busca na view as linhas reivindicadas (um GET por lote de ids).
+    Ids que não aparecem na view são marcados error para não voltarem à fila.
+    """
+    if not ids:
+        return []
+    url = f"{SUPABASE_URL}/rest/v1/{VIEW_NAME}"
+    params = {"select": select, "id": in_filter(ids), "order": "bulletin_date.asc"}
+    resp = sb_http.get(url, headers=sb_headers(), params=params, timeout=60)
+    resp.raise_for_status()
+    rows = resp.json()
+
+    found = {int(r["id"]) for r in rows if r.get("id") is not None}
+    missing = [i for i in ids if i not in found]
+    if missing:
+        print("Ids reivindicados ausentes na view; marcando error:", missing)
+        mark_error(missing)
+    return rows
+
+
+def fetch_bodies(ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    Segunda fase: body_text e body_labels (índice "Label: valor" gravado na
+    ingestão) apenas dos ids que serão de fato parseados. Lido de all_data,
+    já que a view não expõe body_labels.
+    """
+    if not ids:
+        return {}
+    url = f"{SUPABASE_URL}/rest/v1/all_data"
+    params = {"select": "id,body_text,body_labels", "id": in_filter(ids)}
+    resp = sb_http.get(url, headers=sb_headers(), params=params, timeout=60)
+    resp.raise_for_status()
+    return {
+        int(r["id"]): {
+            "body_text": r.get("body_text") or "",
+            "body_labels": r.get("body_labels"),
+        }
+        for r in resp.json()
+    }
+
+
+def attach_body(rec: Dict[str, Any], bodies: Dict[int, Dict[str, Any]]) -> None:
+    got = bodies.get(int(rec["id"])) or {}
+    rec["body_text"] = got.get("body_text") or ""
+    rec["body_labels"] = got.get("body_labels")
+
+
+def detach_body(rec: Dict[str, Any]) -> None:
+    rec.pop("body_text", None)
+    rec.pop("body_labels", None)
+
+
+# --- Status em all_data (em lote, apenas linhas do worker dono do lease) ---
+# done/error encerram o pedido: prioridade e parser_requested_at voltam ao
+# padrão, senão um ready posterior (UI do lifecycle) furaria a fila com a
+# prioridade antiga e a latência seria medida do pedido antigo.
+PRIORITY_RESET = {"parser_priority": PRIORITY_BULK, "parser_requested_at": None}
+
+
+def _patch_owned(ids: List[int], payload: Dict[str, Any], what: str, worker: str | None = None) -> None:
+    if not ids:
+        return
+    url = f"{SUPABASE_URL}/rest/v1/all_data"
+    headers = {**sb_headers(), "Prefer": "return=minimal"}
+    params = {"id": in_filter(ids), "parser_worker_id": f"eq.{worker or WORKER_ID}"}
+    resp = sb_http.patch(url, headers=headers, params=params, data=json.dumps(payload), timeout=60)
+    if not resp.ok:
+        print(f"Erro ao marcar {what}:", ids, resp.status_code, resp.text)
+        resp.raise_for_status()
+
+
+def _priority_rows(ids: List[int], worker: str | None = None) -> List[Dict[str, Any]]:
+    """Linhas prioritárias do lote, lidas antes do done zerar a prioridade."""
+    if not ids:
+        return []
+    url = f"{SUPABASE_URL}/rest/v1/all_data"
+    params = {
+        "select": "composite_key,parser_priority,parser_requested_at",
+        "id": in_filter(ids),
+        "parser_worker_id": f"eq.{worker or WORKER_ID}",
+        "parser_priority": f"gte.{PRIORITY_RECENT}",
+    }
+    resp = sb_http.get(url, headers=sb_headers(), params=params, timeout=60)
+    if not resp.ok:
+        print("Erro ao ler prioridade:", resp.status_code, resp.text)
+        return []
+    return resp.json() or []
+
+
+def _parse_ts(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def report_latency(rows: List[Dict[str, Any]], parsed_at: str) -> None:
+    """Latência ponta a ponta (fila -> done) das linhas prioritárias."""
+    for r in rows:
+        if (r.get("parser_priority") or 0) < PRIORITY_RECENT or not r.get("parser_requested_at"):
+            continue
+        latency = (_parse_ts(parsed_at) - _parse_ts(r["parser_requested_at"])).total_seconds()
+        LATENCIES.append(latency)
+        print(f"⏱️ {r.get('composite_key')} (prioridade {r['parser_priority']}): {latency:.1f}s ponta a ponta")
+
+
+def latency_summary() -> str:
+    if not LATENCIES:
+        return ""
+    ordered = sorted(LATENCIES)
+    p50 = ordered[len(ordered) // 2]
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"latência prioritária n={len(ordered)} p50={p50:.1f}s p95={p95:.1f}s max={ordered[-1]:.1f}s"
+
+
+def mark_done(ids: List[int], worker: str | None = None) -> None:
+    if not ids:
+        return
+    priority = _priority_rows(ids, worker)
+    parsed_at = now_iso()
+    _patch_owned(
+        ids,
+        {
+            "parser_status": "done",
+            "parser_parsed_at": parsed_at,
+            "parser_worker_id": None,
+            "parser_lease_expires_at": None,
+            **PRIORITY_RESET,
+        },
+        "done",
+        worker,
+    )
+    report_latency(priority, parsed_at)
+
+
+def mark_error(ids: List[int], worker: str | None = None) -> None:
+    """Marca como 'error' (sem mensagem, pois all_data não tem parser_error)."""
+    _patch_owned(
+        ids,
+        {"parser_status": "error", "parser_worker_id": None, "parser_lease_expires_at": None, **PRIORITY_RESET},
+        "error",
+        worker,
+    )
+
+
+def release(ids: List[int], worker: str | None = None) -> None:
+    """Devolve linhas ainda não processadas para ready."""
+    _patch_owned(
+        ids,
+        {"parser_status": "ready", "parser_worker_id": None, "parser_lease_expires_at": None},
+        "ready",
+        worker,
+    )
+
+
+# --- Checkpoint / resume ---
+def resume_from_journal(
+    journal: parser_checkpoint.CheckpointJournal,
+    profile: str,
+    commit: Callable[[List[Dict[str, Any]]], None],
+) -> None:
+    """
+    Retoma uma execução interrompida:
+    - lotes parseados e não gravados: refaz commit + mark_done/mark_error;
+    - lotes só reivindicados: devolve as linhas para ready;
+    - por fim, devolve para ready qualquer running com lease vencido do profile.
+    """
+    for batch in journal.pending():
+        worker = batch.get("worker")
+        parsed = batch.get("parsed")
+        if parsed:
+            rows = parsed.get("rows") or []
+            print(f"Resume: regravando lote {batch['batch']} ({len(rows)} linhas).")
+            if rows:
+                commit(rows)
+            mark_done(parsed.get("ids_done") or [], worker)
+            mark_error(parsed.get("ids_error") or [], worker)
+        else:
+            print(f"Resume: devolvendo lote {batch['batch']} para ready ({len(batch['ids'])} ids).")
+            release(batch["ids"], worker)
+        journal.committed(batch["batch"])
+
+    reclaimed = reclaim_expired(profile)
+    if reclaimed:
+        print(f"Resume: {reclaimed} linhas running com lease vencido voltaram para ready.")
+
+
+# --- Loop padrão dos parsers ---
+def run_batches(
+    fetch: Callable[[], List[Dict[str, Any]]],
+    parse: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+    commit: Callable[[List[Dict[str, Any]]], None],
+    label: str,
+    profile: str,
+    prepare: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]] | None = None,
+    single: bool = False,
+    resume: bool = False,
+    report: bool = True,
+) -> Tuple[int, int]:
+    """
+    Reivindica lotes via `fetch` (apenas metadados, sem body_text) até a
+    fila esvaziar. Para cada lote:
+    prepare (tipo, cpc_birth_id...) -> body_text em lotes de BODY_BATCH_SIZE
+    -> parse -> commit (upsert) -> mark_done / mark_error.
+    `prepare` devolve o registro (possivelmente enriquecido) ou None para
+    descartá-lo sem baixar o body.
+    O lease é renovado quando metade do prazo já passou.
+    Cada etapa é registrada no journal de checkpoints; `resume=True`
+    (flag --resume) retoma o que ficou pendente antes de seguir a fila.
+    `single=True` processa apenas um lote (ex.: COMPOSITE_KEY informado).
+    `report=False` omite o resumo/métricas (chamadas curtas do parser_worker).
+    Devolve (done, error) do run.
+    """
+    journal = parser_checkpoint.open_journal(profile, SHARD_INDEX, SHARD_COUNT)
+    if resume:
+        resume_from_journal(journal, profile, commit)
+    elif journal.pending():
+        print(f"Journal com lotes pendentes em {journal.path}; use --resume para retomá-los.")
+
+    total_done = 0
+    total_error = 0
+
+    while True:
+        records = fetch()
+        if not records:
+            break
+        print(
+            f"{len(records)} registros reivindicados para {label} "
+            f"(worker={WORKER_ID}, shard={SHARD_INDEX}/{SHARD_COUNT})."
+        )
+
+        ids_batch = [int(r["id"]) for r in records if r.get("id") is not None]
+        batch = journal.new_batch()
+        journal.claimed(batch, WORKER_ID, ids_batch)
+        renewed_at = time.monotonic()
+
+        def keep_lease() -> None:
+            nonlocal renewed_at
+            if time.monotonic() - renewed_at > LEASE_SECONDS / 2:
+                renew_lease(ids_batch)
+                renewed_at = time.monotonic()
+
+        rows: List[Dict[str, Any]] = []
+        ids_done: List[int] = []
+        ids_error: List[int] = []
+
+        # Fase 1: só metadados -> resolve/filtra antes de baixar qualquer body
+        kept: List[Dict[str, Any]] = []
+        for rec in records:
+            keep_lease()
+            rid = rec.get("id")
+            if rid is None:
+                continue
+            try:
+                ready = prepare(rec) if prepare else rec
+            except Exception as e:
+                print("Erro ao resolver registro; marcando error:", rid, str(e))
+                ids_error.append(int(rid))
+                continue
+            if ready is None:
+                print("Registro descartado antes do parse; marcando error:", rid)
+                ids_error.append(int(rid))
+                continue
+            kept.append(ready)
+
+        # Fase 2: body_text em lotes, apenas para o que será parseado
+        for start in range(0, len(kept), BODY_BATCH_SIZE):
+            chunk = kept[start:start + BODY_BATCH_SIZE]
+            bodies = fetch_bodies([int(r["id"]) for r in chunk])
+            for rec in chunk:
+                keep_lease()
+                rid = rec.get("id")
+                attach_body(rec, bodies)
+                try:
+                    row = parse(rec)
+                    if row:
+                        rows.append(row)
+                        ids_done.append(int(rid))
+                    else:
+                        # Não conseguiu parsear: error para não ficar preso em running
+                        print("Registro não parseado; marcando error:", rid)
+                        ids_error.append(int(rid))
+                except Exception as e:
+                    print("Erro ao processar registro; marcando error:", rid, str(e))
+                    ids_error.append(int(rid))
+                finally:
+                    detach_body(rec)
+
+        journal.parsed(batch, rows, ids_done, ids_error)
+        if rows:
+            commit(rows)
+        mark_done(ids_done)
+        mark_error(ids_error)
+        journal.committed(batch)
+
+        total_done += len(ids_done)
+        total_error += len(ids_error)
+
+        if single:
+            break
+
+    if not journal.pending():
+        journal.clear()
+
+    if not report:
+        return total_done, total_error
+    if not total_done and not total_error:
+        print(f"Nada a processar para {label}.")
+    else:
+        print(f"Concluído. done={total_done} error={total_error}")
+    if latency_summary():
+        print(latency_summary())
+    sb_http.print_metrics(label)
+    return total_done, total_error
@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+import signal
+from typing import Any, Dict, List, Optional, Tuple
+
+# O worker atende todos os profiles com o padrão de cada parser:
+# PARSER_PROFILE/COMPOSITE_KEY do ambiente não podem vazar para os módulos.
+os.environ.pop("PARSER_PROFILE", None)
+os.environ.pop("COMPOSITE_KEY", None)
+
+import sb_http
+
+import parser_queue
+import cpc_name_index
+import cpc_birth_unico_parser
+import cpc_events_halt_parser_v1
+import cpc_events_resume_trading_parser_v1
+import cpc_filing_statement_parser_v1
+import cpc_events_information_circular_v1_parser
+
+# ======================================================
+# Worker persistente dos parsers em lote
+#
+# Um processo só, rodando por horas: interpretador, parse cache, sessão
+# HTTP (keep-alive) e índice de nomes de cpc_birth ficam quentes.
+# - Poll via RPC ready_parser_profiles (exists por profile, barato).
+# - Profile com trabalho -> parser_queue.run_batches com o batch_spec()
+#   do parser (mesmo claim/lease/checkpoint do modo one-shot).
+# - Faixa prioritária (parser_priority >= 1: pedido de um boletim ou
+#   recém-ingerido) é drenada antes do backlog, que anda um lote por
+#   profile por volta; a latência ponta a ponta é impressa por linha.
+# - Sem trabalho, o intervalo de poll dobra de POLL_MIN até POLL_MAX;
+#   volta ao mínimo assim que algo aparece.
+# - cpc_birth é processado antes dos eventos; quando grava algo, o índice
+#   de nomes é recarregado (eventos novos acham as empresas novas).
+# - SIGTERM/SIGINT: termina a fila do profile corrente e sai.
+#
+# --max-seconds N (ou WORKER_MAX_SECONDS) encerra depois de N segundos,
+# para caber no limite de duração do runner.
+# ======================================================
+
+POLL_MIN = float(os.environ.get("WORKER_POLL_MIN") or 1)
+POLL_MAX = float(os.environ.get("WORKER_POLL_MAX") or 15)
+# recarga periódica do índice de nomes (cpc_birth gravado por outro processo)
+INDEX_REFRESH_SECONDS = float(os.environ.get("WORKER_INDEX_REFRESH_SECONDS") or 900)
+METRICS_EVERY_SECONDS = float(os.environ.get("WORKER_METRICS_SECONDS") or 600)
+
+BIRTH_MODULE = cpc_birth_unico_parser
+# ordem importa: cpc_birth primeiro (eventos dependem dele)
+PARSER_MODULES = [
+    cpc_birth_unico_parser,
+    cpc_events_halt_parser_v1,
+    cpc_events_resume_trading_parser_v1,
+    cpc_filing_statement_parser_v1,
+    cpc_events_information_circular_v1_parser,
+]
+
+_stop = False
+
+
+def _request_stop(signum: int, _frame: Any) -> None:
+    global _stop
+    _stop = True
+    print(f"Sinal {signum} recebido: encerrando após o profile corrente.")
+
+
+def max_seconds() -> float:
+    if "--max-seconds" in sys.argv:
+        return float(sys.argv[sys.argv.index("--max-seconds") + 1])
+    return float(os.environ.get("WORKER_MAX_SECONDS") or 0)
+
+
+def build_registry() -> Dict[str, Dict[str, Any]]:
+    """profile -> batch_spec() do parser (parse com cache já embrulhado)."""
+    registry: Dict[str, Dict[str, Any]] = {}
+    for module in PARSER_MODULES:
+        spec = module.batch_spec()
+        registry[spec["profile"]] = spec
+    return registry
+
+
+def ready_profiles(profiles: List[str], min_priority: Optional[int] = None) -> List[str]:
+    data = parser_queue.rpc(
+        "ready_parser_profiles",
+        {"p_profiles": profiles, "p_min_priority": min_priority},
+    )
+    ready = {p for p in data or [] if p}
+    # mantém a ordem do registro (cpc_birth antes dos eventos)
+    return [p for p in profiles if p in ready]
+
+
+def run_profile(spec: Dict[str, Any], resume: bool, single: bool) -> Tuple[int, int]:
+    return parser_queue.run_batches(**spec, resume=resume, single=single, report=False)
+
+
+def record(profile: str, done: int, error: int, totals: Dict[str, List[int]]) -> bool:
+    totals[profile][0] += done
+    totals[profile][1] += error
+    if done or error:
+        print(f"[{profile}] done={done} error={error}")
+    return bool(done or error)
+
+
+def sleep_interruptible(seconds: float) -> None:
+    end = time.monotonic() + seconds
+    while not _stop and time.monotonic() < end:
+        time.sleep(min(0.5, end - time.monotonic()))
+
+
+def main() -> None:
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    registry = build_registry()
+    profiles = list(registry)
+    birth_profile = BIRTH_MODULE.PARSER_PROFILE_ENV
+    limit = max_seconds()
+    started = time.monotonic()
+    print(
+        f"Worker {parser_queue.WORKER_ID} iniciado: profiles={','.join(profiles)} "
+        f"poll={POLL_MIN:g}-{POLL_MAX:g}s max={limit or '-'}s"
+    )
+
+    cpc_name_index.load_index()
+    index_loaded_at = time.monotonic()
+    metrics_at = time.monotonic()
+
+    # journals pendentes de um worker anterior: retomados uma vez, na partida
+    resumed = set()
+    totals: Dict[str, List[int]] = {p: [0, 0] for p in profiles}
+    poll = POLL_MIN
+
+    while not _stop:
+        if limit and time.monotonic() - started >= limit:
+            print(f"Tempo máximo atingido ({limit:g}s).")
+            break
+
+        worked = False
+        # 1) faixa prioritária (pedidos de um boletim, recém-ingeridos):
+        #    drena tudo, em todos os profiles, antes de tocar o backlog
+        for profile in ready_profiles(profiles, parser_queue.PRIORITY_RECENT):
+            if _stop:
+                break
+            with parser_queue.priority_lane():
+                done, error = run_profile(registry[profile], profile not in resumed, single=False)
+            resumed.add(profile)
+            worked = record(profile, done, error, totals) or worked
+            if profile == birth_profile and done:
+                cpc_name_index.load_index(refresh=True)
+                index_loaded_at = time.monotonic()
+
+        # 2) backlog: um lote por profile e volta ao topo, para que um pedido
+        #    novo espere no máximo um lote
+        if not worked:
+            for profile in ready_profiles(profiles):
+                if _stop:
+                    break
+                done, error = run_profile(registry[profile], profile not in resumed, single=True)
+                resumed.add(profile)
+                worked = record(profile, done, error, totals) or worked
+                if profile == birth_profile and done:
+                    cpc_name_index.load_index(refresh=True)
+                    index_loaded_at = time.monotonic()
+
+        if time.monotonic() - index_loaded_at > INDEX_REFRESH_SECONDS:
+            cpc_name_index.load_index(refresh=True)
+            index_loaded_at = time.monotonic()
+
+        if time.monotonic() - metrics_at > METRICS_EVERY_SECONDS:
+            if parser_queue.latency_summary():
+                print(parser_queue.latency_summary())
+            sb_http.print_metrics("parser_worker")
+            metrics_at = time.monotonic()
+
+        poll = POLL_MIN if worked else min(POLL_MAX, poll * 2)
+        sleep_interruptible(poll)
+
+    print(
+        "Worker encerrado. "
+        + " ".join(f"{p}={d}/{e}" for p, (d, e) in totals.items())
+        + f" tempo={time.monotonic() - started:.0f}s"
+    )
+    if parser_queue.latency_summary():
+        print(parser_queue.latency_summary())
+    sb_http.print_metrics("parser_worker")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import sb_http
+
+import parse_cache
+import parser_queue
+
+# ======================================================
+# Orquestrador ingestão -> cpc_birth -> eventos (DAG)
+#
+#   ingest ──> cpc_birth ──┬─> events_halt_v1
+#                          ├─> events_resume_trading_v1
+#                          ├─> cpc_filing_statement_v1
+#                          └─> cpc_events_information_circular_v1
+#
+# - Cada estágio roda como subprocesso (o script de sempre, com
+#   PARSER_PROFILE do estágio); estágios independentes rodam juntos e
+#   um estágio começa assim que todas as dependências terminam.
+# - Só roda o que foi afetado:
+#   ingest: a listagem do bucket (nome/updated_at/eTag/size) é comparada
+#     com a de cada arquivo no último run com sucesso (pipeline_stage_state.
+#     files); só os novos/alterados vão para o robot_depurar (DEPURAR_FILES).
+#     Sem estado anterior (ou --force), ingere o bucket inteiro;
+#   parsers: há linhas ready no profile (all_data entra na fila pelo
+#     trigger all_data_enqueue_parser só quando o bloco muda);
+#   eventos: depois de um cpc_birth que gravou algo, requeue_downstream_errors
+#     devolve para ready os eventos com erro das empresas tocadas.
+# - Estágio com falha bloqueia só os seus dependentes.
+#
+# - SB_RATE_LIMIT/SB_BURST são divididos entre os estágios que rodam
+#   juntos (o limitador do sb_http é por processo).
+# - Cada estágio de parser (e shard, se SHARD_COUNT > 1) usa o próprio
+#   PARSE_CACHE_PATH, para os subprocessos paralelos não disputarem o
+#   mesmo arquivo SQLite.
+#
+# --force roda tudo; --from <estágio> roda só o estágio e o que depende dele.
+# ======================================================
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_TABLE = "pipeline_stage_state"
+INGEST_STAGE = "ingest"
+# limite de uma variável de ambiente no Linux é 128 KiB; acima disso, bucket inteiro
+DEPURAR_FILES_MAX_BYTES = 100_000
+
+STAGES: Dict[str, Dict[str, Any]] = {
+    INGEST_STAGE: {
+        "deps": [],
+        "script": "robot_depurar.py",
+    },
+    "cpc_birth": {
+        "deps": [INGEST_STAGE],
+        "script": "cpc_birth_unico_parser.py",
+        "profile": "cpc_birth",
+    },
+    "events_halt_v1": {
+        "deps": ["cpc_birth"],
+        "script": "cpc_events_halt_parser_v1.py",
+        "profile": "events_halt_v1",
+        "requeue": True,
+    },
+    "events_resume_trading_v1": {
+        "deps": ["cpc_birth"],
+        "script": "cpc_events_resume_trading_parser_v1.py",
+        "profile": "events_resume_trading_v1",
+        "requeue": True,
+    },
+    "cpc_filing_statement_v1": {
+        "deps": ["cpc_birth"],
+        "script": "cpc_filing_statement_parser_v1.py",
+        "profile": "cpc_filing_statement_v1",
+        "requeue": True,
+    },
+    "cpc_events_information_circular_v1": {
+        "deps": ["cpc_birth"],
+        "script": "cpc_events_information_circular_v1_parser.py",
+        "profile": "cpc_events_information_circular_v1",
+        "requeue": True,
+    },
+}
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def depth(stage: str) -> int:
+    return 1 + max((depth(d) for d in STAGES[stage]["deps"]), default=-1)
+
+
+def rate_env(stage: str, selected: List[str]) -> Dict[str, str]:
+    """
+    Parte de SB_RATE_LIMIT/SB_BURST do estágio: o limitador do sb_http é
+    por processo e os estágios do mesmo nível (mesmas dependências) rodam
+    juntos, então dividem a taxa.
+    """
+    n = sum(1 for s in selected if depth(s) == depth(stage))
+    return {"SB_RATE_LIMIT": f"{sb_http.MAX_RATE / n:g}", "SB_BURST": str(max(1, sb_http.BURST // n))}
+
+
+def cache_env(stage: str) -> Dict[str, str]:
+    """PARSE_CACHE_PATH do estágio: <base>.<estágio>[.shardN].sqlite ao lado do cache padrão."""
+    root, ext = os.path.splitext(parse_cache.CACHE_PATH)
+    suffix = f".shard{parser_queue.SHARD_INDEX}" if parser_queue.SHARD_COUNT > 1 else ""
+    return {"PARSE_CACHE_PATH": f"{root}.{stage}{suffix}{ext or '.sqlite'}"}
+
+
+def downstream(stage: str) -> List[str]:
+    out = [stage]
+    for name, spec in STAGES.items():
+        if stage in spec["deps"]:
+            out.extend(s for s in downstream(name) if s not in out)
+    return out
+
+
+# --- Estado dos estágios ---
+def read_state() -> Dict[str, Dict[str, Any]]:
+    url = f"{parser_queue.SUPABASE_URL}/rest/v1/{STATE_TABLE}"
+    resp = sb_http.get(url, headers=parser_queue.sb_headers(), params={"select": "*"}, timeout=60)
+    resp.raise_for_status()
+    return {r["stage"]: r for r in resp.json() or []}
+
+
+def save_state(
+    stage: str,
+    status: str,
+    fingerprint: Optional[str] = None,
+    files: Optional[Dict[str, str]] = None,
+) -> None:
+    url = f"{parser_queue.SUPABASE_URL}/rest/v1/{STATE_TABLE}"
+    headers = {**parser_queue.sb_headers(), "Prefer": "resolution=merge-duplicates,return=minimal"}
+    payload: Dict[str, Any] = {"stage": stage, "last_status": status, "last_run_at": now_iso(), "updated_at": now_iso()}
+    if fingerprint is not None:
+        payload["fingerprint"] = fingerprint
+    if files is not None:
+        payload["files"] = files
+    resp = sb_http.post(url, headers=headers, params={"on_conflict": "stage"}, data=json.dumps(payload), timeout=60)
+    if not resp.ok:
+        print(f"Erro ao salvar estado de {stage}:", resp.status_code, resp.text)
+
+
+def bucket_files() -> Dict[str, str]:
+    """Assinatura (updated_at/eTag/size) de cada arquivo do bucket, por nome."""
+    # import tardio: robot_depurar cria o client supabase-py na importação
+    import robot_depurar
+
+    out = {}
+    for f in robot_depurar.list_bulletin_files():
+        meta = f.get("metadata") or {}
+        out[f["name"]] = f"{f.get('updated_at')}\x00{meta.get('eTag')}\x00{meta.get('size')}"
+    return out
+
+
+def files_fingerprint(files: Dict[str, str]) -> str:
+    h = hashlib.sha1()
+    for name in sorted(files):
+        h.update(f"{name}\x00{files[name]}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def changed_files(files: Dict[str, str], last: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Arquivos novos/alterados desde o último run ok; None quando não há
+    estado por arquivo confiável (primeiro run ou último run falhou sem
+    nunca ter gravado um mapa), e aí o bucket inteiro é ingerido.
+    """
+    previous = last.get("files")
+    if not isinstance(previous, dict):
+        return None
+    return sorted(name for name, sig in files.items() if previous.get(name) != sig)
+
+
+# --- Execução ---
+def run_script(stage: str, script: str, extra_env: Dict[str, str]) -> bool:
+    env = {k: v for k, v in os.environ.items() if k not in ("PARSER_PROFILE", "COMPOSITE_KEY", "DEPURAR_FILES")}
+    env.update(extra_env)
+    proc = subprocess.run(
+        [sys.executable, os.path.join(SRC_DIR, script)],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    for line in proc.stdout.splitlines():
+        print(f"[{stage}] {line}")
+    return proc.returncode == 0
+
+
+def has_ready_rows(profile: str) -> bool:
+    data = parser_queue.rpc("ready_parser_profiles", {"p_profiles": [profile]})
+    return bool(data)
+
+
+def run_stage(stage: str, force: bool, state: Dict[str, Dict[str, Any]], rate: Dict[str, str]) -> str:
+    """Devolve ran | skipped | failed."""
+    spec = STAGES[stage]
+    profile = spec.get("profile")
+
+    if stage == INGEST_STAGE:
+        files = bucket_files()
+        fingerprint = files_fingerprint(files)
+        last = state.get(stage) or {}
+        # o mapa por arquivo só é gravado em run ok (robot_depurar sai != 0
+        # quando um upsert falha ou nenhum bloco é gravado); run com falha
+        # mantém o mapa anterior, e o próximo refaz os mesmos arquivos
+        changed = None if force else changed_files(files, last)
+        if changed is not None and not changed:
+            if last.get("fingerprint") != fingerprint:
+                # só remoções: nada a ingerir, mas o mapa passa a refletir o bucket
+                save_state(stage, "ok", fingerprint, files)
+            return "skipped"
+        env = dict(rate)
+        if changed is not None and len("\n".join(changed).encode("utf-8")) <= DEPURAR_FILES_MAX_BYTES:
+            print(f"[{stage}] {len(changed)} de {len(files)} arquivo(s) novos/alterados.")
+            env["DEPURAR_FILES"] = "\n".join(changed)
+        ok = run_script(stage, spec["script"], env)
+        save_state(stage, "ok" if ok else "failed", fingerprint if ok else None, files if ok else None)
+        return "ran" if ok else "failed"
+
+    if not force and not has_ready_rows(profile):
+        return "skipped"
+    ok = run_script(stage, spec["script"], {**rate, **cache_env(stage), "PARSER_PROFILE": profile})
+    save_state(stage, "ok" if ok else "failed")
+    return "ran" if ok else "failed"
+
+
+def requeue_dependents(stage: str, since: str) -> None:
+    profiles = [s["profile"] for s in STAGES.values() if stage in s["deps"] and s.get("requeue")]
+    if not profiles:
+        return
+    n = int(parser_queue.rpc("requeue_downstream_errors", {"p_profiles": profiles, "p_since": since}) or 0)
+    if n:
+        print(f"{n} eventos com erro voltaram para ready após {stage}.")
+
+
+def main() -> None:
+    force = "--force" in sys.argv
+    selected = list(STAGES)
+    if "--from" in sys.argv:
+        selected = downstream(sys.argv[sys.argv.index("--from") + 1])
+
+    state = read_state()
+    status: Dict[str, str] = {s: "pending" for s in selected}
+    elapsed: Dict[str, float] = {}
+    t0 = time.monotonic()
+    print(f"Pipeline: {' -> '.join(selected)}{' (--force)' if force else ''}")
+
+    with ThreadPoolExecutor(max_workers=len(selected)) as pool:
+        running: Dict[Future, str] = {}
+        started: Dict[str, float] = {}
+        started_at: Dict[str, str] = {}
+        while True:
+            # dependências fora da seleção contam como satisfeitas
+            for stage in selected:
+                if status[stage] != "pending":
+                    continue
+                deps = [status.get(d, "skipped") for d in STAGES[stage]["deps"]]
+                if any(d in ("failed", "blocked") for d in deps):
+                    status[stage] = "blocked"
+                elif all(d in ("ran", "skipped") for d in deps):
+                    status[stage] = "running"
+                    started[stage] = time.monotonic()
+                    started_at[stage] = now_iso()
+                    running[pool.submit(run_stage, stage, force, state, rate_env(stage, selected))] = stage
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                stage = running.pop(fut)
+                try:
+                    status[stage] = fut.result()
+                except Exception as e:
+                    print(f"[{stage}] erro: {e}")
+                    status[stage] = "failed"
+                elapsed[stage] = time.monotonic() - started[stage]
+                print(f"[{stage}] {status[stage]} em {elapsed[stage]:.1f}s")
+                if status[stage] == "ran":
+                    requeue_dependents(stage, started_at[stage])
+
+    print(
+        f"Pipeline concluído em {time.monotonic() - t0:.1f}s: "
+        + " ".join(f"{s}={status[s]}" for s in selected)
+    )
+    sb_http.print_metrics("pipeline")
+    if any(v == "failed" for v in status.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
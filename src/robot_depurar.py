@@ -1,9 +1,15 @@
-import os, re, unicodedata
-import pandas as pd
-import requests
+import io, os, re, sys, gzip, mmap, codecs, zipfile, calendar, tempfile, unicodedata
+from bisect import bisect_left
+from itertools import chain
 from datetime import datetime
+import pandas as pd
 from supabase import create_client
 
+from bulletin_classifier import load_classifier
+from bulletin_labels import extract_labels
+from cpc_records import stream_rows
+import sb_http
+
 # ---------------------------------------------------------------------
 # Variáveis de ambiente fornecidas pelo GitHub Actions
 # ---------------------------------------------------------------------
@@ -12,6 +18,21 @@ SUPABASE_SERVICE_KEY = os.environ["SUPABASE_SERVICE_KEY"]
 
 supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 BUCKET = "uploads"
+# cópia local dos arquivos do bucket (opcional): releitura de bloco via mmap
+LOCAL_DIR = os.environ.get("BULLETIN_LOCAL_DIR")
+# .txt puro, .txt.gz (um boletim) ou .zip (vários .txt)
+BULLETIN_SUFFIXES = (".txt", ".txt.gz", ".zip")
+# .zip precisa de acesso aleatório: lido por HTTP Range; servidor que
+# ignora Range manda o arquivo inteiro para um temporário que só passa
+# para o disco acima deste tamanho
+ZIP_SPOOL_BYTES = 32 * 1024 * 1024
+# .txt.gz/.zip em stream: bytes por leitura/Range e blocos por lote de linhas
+STREAM_READ_BYTES = 1024 * 1024
+STREAM_BLOCK_BATCH = int(os.environ.get("INGEST_STREAM_BLOCKS") or 500)
+CANONICAL_MAP_TABLE = "bulletin_canonical_map"
+
+# Classificador canônico de BULLETIN TYPE; recarregado do banco em main()
+CLASSIFIER = load_classifier()
 
 # ---------------------------------------------------------------------
 # Regex e padrões
@@ -19,6 +40,8 @@ BUCKET = "uploads"
 BULLETIN_DATE_RE = re.compile(r'(BULLETIN DATE|NOTICE DATE):\s*(.+)', re.IGNORECASE)
 TIER_RE          = re.compile(r'(TSX Venture Tier\s+\d+ Company|NEX Company)', re.IGNORECASE)
 BLOCK_SPLITTER   = re.compile(r'\nTSX-X\s*\n\s*_+\s*\n|\n_{5,}\n', re.IGNORECASE)
+CRLF_RE          = re.compile(r'\r\n')
+NON_SPACE_RE     = re.compile(r'\S')
 
 # Padrões alternativos para header
 HEADER_PATTERNS = [
@@ -65,18 +88,174 @@ def normalize_tier(raw: str) -> str | None:
         return "Nex"
     return raw.strip()
 
+# ---------------------------------------------------------------------
+# Normalização em coluna (todos os blocos de um arquivo de uma vez)
+# ---------------------------------------------------------------------
+# "January 30, 2008" / "Jan 30, 2008": o formato de quase todos os boletins.
+# Mesmos nomes (calendar segue o locale, como o strptime) e mesma regex do
+# %B/%b %d, %Y do strptime; dígitos só ASCII. O resto vai para normalize_date
+# (inclusive ano < 1000: o strftime("%Y") da glibc não completa com zeros).
+MONTHS = {
+    name.lower(): f"{i:02d}"
+    for names in (calendar.month_name, calendar.month_abbr)
+    for i, name in enumerate(names) if name
+}
+MONTH_DATE_RE = (
+    r"(?i)^(" + "|".join(sorted(map(re.escape, MONTHS), key=len, reverse=True)) + r")"
+    r"\s+(3[01]|[12][0-9]|0[1-9]|[1-9]),\s+([1-9][0-9]{3})\Z"
+)
+
+def normalize_dates(raw: pd.Series) -> pd.Series:
+    """normalize_date em coluna (Series de object, None onde não há data)."""
+    txt = (
+        raw.str.strip()
+        .str.replace("  ", " ", regex=False)
+        .str.replace(r",(\d{4})", r", \1", regex=True)
+    )
+    parts = txt.str.extract(MONTH_DATE_RE)
+    iso = parts[2] + "-" + parts[0].str.lower().map(MONTHS) + "-" + parts[1].str.zfill(2)
+    # dia inexistente no mês (30 de fevereiro) vira NaT e cai no fallback
+    out = iso.where(pd.to_datetime(iso, format="%Y-%m-%d", errors="coerce").notna())
+    rest = out.isna() & raw.notna()
+    if rest.any():
+        out[rest] = raw[rest].map(normalize_date)
+    return out.astype(object).where(out.notna(), None)
+
+def normalize_tiers(raw: pd.Series) -> pd.Series:
+    """normalize_tier em coluna; a ordem dos mask mantém a precedência dos ifs."""
+    lower = raw.str.lower()
+    out = raw.str.strip()
+    for needle, label in (("nex", "Nex"), ("tier 2", "Tier 2"), ("tier 1", "Tier 1")):
+        out = out.mask(lower.str.contains(needle, regex=False, na=False), label)
+    out = out.where(raw.str.len() > 0)
+    return out.astype(object).where(out.notna(), None)
+
+SPACES_RE = re.compile(r"[ \t]+")
+# separador do lote de NFKC: starter sem decomposição nem composição
+NFKC_SEP = "\x00"
+
+def _collapse_spaces(s: str) -> str:
+    # sem tab nem espaço duplo o sub não muda nada
+    if "\t" in s or "  " in s:
+        s = SPACES_RE.sub(" ", s)
+    return s.strip()
+
 def normalize_text(s: str) -> str:
     if s is None: return ""
-    s = unicodedata.normalize("NFKC", s)
-    s = re.sub(r"[ \t]+", " ", s)
-    return s.strip()
+    # ASCII puro (quase todos os boletins) já está em NFKC; isascii() é O(1)
+    if not s.isascii():
+        s = unicodedata.normalize("NFKC", s)
+    return _collapse_spaces(s)
+
+def normalize_blocks(blocks: list) -> list:
+    """
+    normalize_text de todos os blocos de um arquivo, com a mesma saída.
+    Os blocos não-ASCII passam por uma única chamada de NFKC, unidos por
+    NFKC_SEP (que não interage com vizinhos na normalização).
+    """
+    out = list(blocks)
+    wide = [i for i, b in enumerate(out) if b is not None and not b.isascii()]
+    if wide and not any(NFKC_SEP in out[i] for i in wide):
+        joined = unicodedata.normalize("NFKC", NFKC_SEP.join(out[i] for i in wide))
+        for i, part in zip(wide, joined.split(NFKC_SEP)):
+            out[i] = part
+    else:
+        for i in wide:
+            out[i] = unicodedata.normalize("NFKC", out[i])
+    return ["" if b is None else _collapse_spaces(b) for b in out]
 
 # ---------------------------------------------------------------------
 # Funções auxiliares
 # ---------------------------------------------------------------------
+def unify_newlines(txt: str) -> str:
+    return txt.replace("\r\n", "\n").replace("\r", "\n")
+
+def block_spans(txt: str) -> list:
+    """
+    Os blocos de parse_blocks com o intervalo [início, fim) de cada um no
+    texto original (antes de \r\n -> \n): (bloco, início, fim).
+    """
+    t = unify_newlines(txt)
+    # índices em t onde um \r\n virou \n (cada um desloca o original em +1)
+    collapsed = [m.start() - k for k, m in enumerate(CRLF_RE.finditer(txt))]
+    spans = []
+    pos = 0
+    for m in [*BLOCK_SPLITTER.finditer(t), None]:
+        end = m.start() if m else len(t)
+        seg = t[pos:end]
+        b = seg.strip()
+        if b:
+            start = pos + len(seg) - len(seg.lstrip())
+            stop = start + len(b)
+            spans.append((b, start + bisect_left(collapsed, start), stop + bisect_left(collapsed, stop)))
+        pos = m.end() if m else end
+    return spans
+
 def parse_blocks(txt: str):
-    t = txt.replace("\r\n", "\n").replace("\r", "\n")
-    return [b.strip() for b in BLOCK_SPLITTER.split(t) if b.strip()]
+    return [b for b, _, _ in block_spans(txt)]
+
+def iter_text(fh, encoding: str):
+    """
+    Texto de um arquivo binário em pedaços, já com \r\n/\r -> \n. Um \r
+    no fim do pedaço espera o próximo (pode ser metade de um \r\n).
+    Decodificação estrita: UnicodeDecodeError sobe para quem chamou.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    carry = ""
+    while True:
+        data = fh.read(STREAM_READ_BYTES)
+        txt = carry + decoder.decode(data, final=not data)
+        carry = ""
+        if data and txt.endswith("\r"):
+            txt, carry = txt[:-1], "\r"
+        if txt:
+            yield unify_newlines(txt)
+        if not data:
+            return
+
+def iter_blocks(chunks):
+    """
+    parse_blocks sobre um texto que chega em pedaços: mesmos blocos, sem
+    juntar o texto inteiro. Antes do fim, um separador só é aceito com
+    texto não-branco depois dele (o \\s* do BLOCK_SPLITTER ainda poderia crescer).
+    """
+    buf = ""
+    for chunk in chain(chunks, [None]):
+        final = chunk is None
+        buf += chunk or ""
+        pos = 0
+        for m in BLOCK_SPLITTER.finditer(buf):
+            if not final and not NON_SPACE_RE.search(buf, m.end()):
+                break
+            b = buf[pos:m.start()].strip()
+            if b:
+                yield b
+            pos = m.end()
+        buf = buf[pos:]
+    b = buf.strip()
+    if b:
+        yield b
+
+def byte_ranges(raw: bytes, txt: str, encoding: str | None, spans: list) -> list | None:
+    """
+    (offset, tamanho) em bytes de cada bloco no arquivo. None quando o texto
+    não volta byte a byte para o arquivo (bytes inválidos, codec com BOM/estado).
+    """
+    try:
+        if not encoding or "".encode(encoding) or txt.encode(encoding) != raw:
+            return None
+    except (LookupError, UnicodeError):
+        return None
+    out = []
+    offset = 0
+    prev = 0
+    for _, start, stop in spans:
+        offset += len(txt[prev:start].encode(encoding))
+        size = len(txt[start:stop].encode(encoding))
+        out.append((offset, size))
+        offset += size
+        prev = stop
+    return out
 
 def extract_company_ticker(body: str):
     """
@@ -138,65 +317,423 @@ def extract_bulletin_type(body: str) -> str | None:
         return None
     return " ".join(collected).replace(" ,", ",").strip()
 
-def parse_one_block(b: str, source_file: str, block_id: int) -> dict:
-    body = normalize_text(b)
+def load_canonical_map():
+    """Lê bulletin_canonical_map; se a tabela não responder, fica o mapa padrão."""
+    global CLASSIFIER
+    try:
+        res = sb_http.call(
+            lambda: supabase.table(CANONICAL_MAP_TABLE).select("pattern,canonical_type,parser_profile").execute()
+        )
+        CLASSIFIER = load_classifier(res.data or [])
+        print(f"🗂️ Mapa canônico carregado ({len(res.data or [])} padrões).")
+    except Exception as e:
+        print("⚠️ Falha ao carregar mapa canônico, usando padrão:", str(e))
+
+def block_row(body: str, source_file: str, block_id: int) -> dict:
+    """Linha de all_data com bulletin_date e tier ainda crus (texto do boletim)."""
     company, ticker = extract_company_ticker(body)
     mdate = BULLETIN_DATE_RE.search(body)
     mtier = TIER_RE.search(body)
+    bulletin_type = extract_bulletin_type(body)
     return {
         "source_file": source_file.split("-")[-1],
         "block_id": block_id,
         "company": company,
         "ticker": ticker,
-        "bulletin_type": extract_bulletin_type(body),
-        "bulletin_date": normalize_date(mdate.group(2)) if mdate else None,
-        "tier": normalize_tier(mtier.group(1)) if mtier else None,
+        "bulletin_type": bulletin_type,
+        "bulletin_date": mdate.group(2) if mdate else None,
+        "tier": mtier.group(1) if mtier else None,
         "body_text": body,
-        "composite_key": f"{source_file.split('-')[-1]}-{block_id}"
+        # "Label: valor" por chave, lido pelos parsers sem regex no body
+        "body_labels": extract_labels(body),
+        "composite_key": f"{source_file.split('-')[-1]}-{block_id}",
+        # canonical_type, canonical_class, canonical_types, canonical_parser_profile
+        **CLASSIFIER.classify(bulletin_type),
     }
 
+def parse_one_block(b: str, source_file: str, block_id: int, normalized: bool = False) -> dict:
+    body = b if normalized else normalize_text(b)
+    row = block_row(body, source_file, block_id)
+    row["bulletin_date"] = normalize_date(row["bulletin_date"])
+    row["tier"] = normalize_tier(row["tier"])
+    return row
+
+def parse_block_rows(bodies: list, source_file: str, start: int = 1) -> list:
+    """
+    parse_one_block de todos os blocos (já normalizados) de um arquivo:
+    data e tier saem de operações em coluna sobre o arquivo inteiro em vez
+    de strptime/ifs por bloco. Mesmo resultado, bloco a bloco. O
+    composite_key é o de block_row (uma só regra para os dois caminhos).
+    """
+    if not bodies:
+        return []
+    rows = [block_row(body, source_file, i) for i, body in enumerate(bodies, start=start)]
+    cols = pd.DataFrame({
+        "date": [r["bulletin_date"] for r in rows],
+        "tier": [r["tier"] for r in rows],
+    }, dtype=object)
+    dates = normalize_dates(cols["date"]).tolist()
+    tiers = normalize_tiers(cols["tier"]).tolist()
+    for row, d, t in zip(rows, dates, tiers):
+        row["bulletin_date"] = d
+        row["tier"] = t
+    return rows
+
 # ---------------------------------------------------------------------
-# Pipeline principal
+# Etapas (também usadas por src/backfill.py)
 # ---------------------------------------------------------------------
-def main():
-    print("🚀 Iniciando depuração dos arquivos do bucket…")
+def list_bulletin_files() -> list:
+    files = sb_http.call(lambda: supabase.storage.from_(BUCKET).list())
+    return [f for f in files or [] if f["name"].lower().endswith(BULLETIN_SUFFIXES)]
 
-    files = supabase.storage.from_(BUCKET).list()
-    if not files:
-        print("⚠️ Nenhum arquivo encontrado no bucket 'uploads'.")
+def requested_files() -> list:
+    """
+    Objetos pedidos no disparo (--file <nome>, repetível, ou DEPURAR_FILES
+    com um nome por linha, vindo do input files do depurar.yml). Lista
+    vazia = todos os arquivos do bucket.
+    """
+    names = [sys.argv[i + 1] for i, a in enumerate(sys.argv[:-1]) if a == "--file"]
+    names += (os.environ.get("DEPURAR_FILES") or "").splitlines()
+    out = []
+    for name in (n.strip() for n in names):
+        if not name or name in out:
+            continue
+        if not name.lower().endswith(BULLETIN_SUFFIXES):
+            print(f"⚠️ Ignorando {name}: extensão não suportada.")
+            continue
+        out.append(name)
+    return out
+
+def text_rows(source_file: str, source_object: str, txt: str, raw: bytes | None, encoding: str | None) -> list:
+    """
+    Linhas de all_data dos blocos de um arquivo de boletins. Com `raw`
+    (arquivo guardado descomprimido) grava o offset/tamanho em bytes de
+    cada bloco (source_byte_offset/source_byte_length) para releitura por Range.
+    """
+    spans = block_spans(txt)
+    ranges = byte_ranges(raw, txt, encoding, spans) if raw is not None else None
+    bodies = normalize_blocks([b for b, _, _ in spans])
+    rows = parse_block_rows(bodies, source_file)
+    for i, row in enumerate(rows, start=1):
+        offset, size = ranges[i - 1] if ranges else (None, None)
+        row.update({
+            "source_object": source_object,
+            "source_byte_offset": offset,
+            "source_byte_length": size,
+            "source_encoding": encoding if ranges else None,
+        })
+    return rows
+
+class RangeFile(io.RawIOBase):
+    """Objeto do storage como arquivo binário com seek, lido por HTTP Range."""
+
+    def __init__(self, url: str, size: int):
+        self.url = url
+        self.size = size
+        self.pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: self.size}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def readinto(self, b) -> int:
+        if self.pos >= self.size or not len(b):
+            return 0
+        stop = min(self.size, self.pos + len(b)) - 1
+        # fecha a resposta a cada Range: devolve a conexão ao pool
+        with range_get(self.url, self.pos, stop) as resp:
+            data = resp.raw.read(stop - self.pos + 1, decode_content=False)
+        b[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+def range_get(url: str, start: int, stop: int):
+    # identity: bytes como estão no storage, sem Content-Encoding no caminho
+    resp = sb_http.get(
+        url,
+        headers={"Range": f"bytes={start}-{stop}", "Accept-Encoding": "identity"},
+        timeout=120,
+        stream=True,
+    )
+    if not resp.ok:
+        resp.close()
+        resp.raise_for_status()
+    return resp
+
+def open_zip(url: str):
+    """ZipFile sobre RangeFile (só diretório central + membros lidos); sem Range, temporário."""
+    resp = range_get(url, 0, 0)
+    total = (resp.headers.get("Content-Range") or "").rpartition("/")[2]
+    if resp.status_code == 206 and total.isdigit():
+        resp.close()
+        return zipfile.ZipFile(io.BufferedReader(RangeFile(url, int(total)), buffer_size=STREAM_READ_BYTES))
+    tmp = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_BYTES)
+    with resp:
+        for chunk in resp.iter_content(chunk_size=STREAM_READ_BYTES):
+            tmp.write(chunk)
+    tmp.seek(0)
+    return zipfile.ZipFile(tmp)
+
+def open_gz(url: str):
+    resp = sb_http.get(url, headers={"Accept-Encoding": "identity"}, timeout=300, stream=True)
+    resp.raise_for_status()
+    # o .gz é o próprio objeto: Content-Encoding: gzip do storage não pode
+    # ser desfeito aqui também (seria um segundo gunzip)
+    resp.raw.decode_content = False
+    return gzip.GzipFile(fileobj=resp.raw)
+
+def iter_members(name: str):
+    """
+    (nome do .txt interno, abrir) de um .txt.gz ou .zip; abrir() devolve o
+    .txt descomprimido em stream, do início, a cada chamada.
+    """
+    url = supabase.storage.from_(BUCKET).get_public_url(name)
+    if name.lower().endswith(".gz"):
+        yield name[:-3], lambda: open_gz(url)
         return
+    with open_zip(url) as zf:
+        members = sorted(
+            (i for i in zf.infolist() if not i.is_dir() and i.filename.lower().endswith(".txt")),
+            key=lambda i: i.filename,
+        )
+        # o composite_key usa só o nome (parte depois do último "-"): dois
+        # membros com o mesmo nome gerariam chaves repetidas no mesmo upsert
+        seen: dict = {}
+        for info in members:
+            seen.setdefault(os.path.basename(info.filename).split("-")[-1], []).append(info.filename)
+        dup = [n for names in seen.values() if len(names) > 1 for n in names]
+        if dup:
+            raise ValueError(f"{name}: .txt internos com o mesmo nome: {', '.join(dup)}")
+        for info in members:
+            yield os.path.basename(info.filename), lambda info=info: zf.open(info)
 
-    rows = []
-    for f in files:
-        if not f["name"].lower().endswith(".txt"):
-            continue
+def iter_archive_batches(name: str):
+    """
+    (nome do .txt interno, linhas, recomeço) de um .txt.gz/.zip em lotes de
+    STREAM_BLOCK_BATCH blocos: descompressão, decodificação e separação dos
+    blocos em stream, sem o arquivo nem o .txt inteiros em memória.
+    O .txt é utf-8 ou, se não decodificar, latin-1 (decisão do arquivo
+    inteiro): nesse caso ele é relido do início e o primeiro lote vem com
+    recomeço=True (mesmos composite_keys, que substituem os já entregues).
+    """
+    for inner, open_member in iter_members(name):
+        restart = False
+        for encoding in ("utf-8", "latin-1"):
+            try:
+                with open_member() as fh:
+                    block_id = 1
+                    pending: list = []
+                    for block in iter_blocks(iter_text(fh, encoding)):
+                        pending.append(block)
+                        if len(pending) >= STREAM_BLOCK_BATCH:
+                            yield inner, archive_rows(inner, name, pending, block_id), restart
+                            restart = False
+                            block_id += len(pending)
+                            pending = []
+                    if pending or restart:
+                        yield inner, archive_rows(inner, name, pending, block_id), restart
+                break
+            except UnicodeDecodeError:
+                print(f"⚠️ {inner} não é UTF-8; relendo como latin-1.")
+                restart = True
 
-        url = supabase.storage.from_(BUCKET).get_public_url(f["name"])
-        print(f"📂 Processando {f['name']}")
-        resp = requests.get(url)
+def archive_rows(inner: str, source_object: str, blocks: list, start: int) -> list:
+    # offsets de bytes não valem dentro do comprimido: sem índice de Range
+    rows = parse_block_rows(normalize_blocks(blocks), inner, start)
+    for row in rows:
+        row.update({
+            "source_object": source_object,
+            "source_byte_offset": None,
+            "source_byte_length": None,
+            "source_encoding": None,
+        })
+    return rows
+
+def iter_file_batches(name: str):
+    """(.txt, linhas, recomeço) de um arquivo do bucket: .txt num lote só, .txt.gz/.zip em stream."""
+    if name.lower().endswith(".txt"):
+        url = supabase.storage.from_(BUCKET).get_public_url(name)
+        resp = sb_http.get(url, timeout=120)
         resp.raise_for_status()
-        txt = resp.text
+        yield name, text_rows(name, name, resp.text, resp.content, resp.encoding or resp.apparent_encoding), False
+        return
+    yield from iter_archive_batches(name)
 
-        for i, b in enumerate(parse_blocks(txt), start=1):
-            rows.append(parse_one_block(b, f["name"], i))
+def ingest_file(name: str) -> list:
+    """
+    Baixa um arquivo do bucket e devolve as linhas de all_data dos seus
+    blocos. .txt.gz e .zip são descomprimidos em stream; o composite_key
+    vem do .txt interno (n20080130.txt-9), como se tivesse sido enviado solto.
+    """
+    rows: dict = {}
+    for inner, batch, restart in iter_file_batches(name):
+        if restart:
+            # .txt interno relido em latin-1: descarta o que veio dele em utf-8
+            src = inner.split("-")[-1]
+            rows = {k: r for k, r in rows.items() if r["source_file"] != src}
+        rows.update((r["composite_key"], r) for r in batch)
+    return list(rows.values())
 
-    if not rows:
-        print("⚠️ Nenhum bloco processado.")
+def read_block(source_object: str, offset: int, size: int, encoding: str) -> str:
+    """Um bloco pelo índice de bytes: mmap da cópia local ou HTTP Range no storage."""
+    local = os.path.join(LOCAL_DIR, source_object) if LOCAL_DIR else None
+    if local and os.path.exists(local):
+        with open(local, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            raw = mm[offset:offset + size]
+    else:
+        url = supabase.storage.from_(BUCKET).get_public_url(source_object)
+        stop = offset + size - 1
+        # mesmo Range do RangeFile (identity): os offsets valem para os
+        # bytes do objeto, não para um corpo comprimido no caminho
+        with range_get(url, offset, stop) as resp:
+            coding = (resp.headers.get("Content-Encoding") or "identity").lower()
+            if coding != "identity":
+                raise RuntimeError(f"{source_object}: Range com Content-Encoding {coding}")
+            if resp.status_code == 206:
+                got = (resp.headers.get("Content-Range") or "").partition("/")[0]
+                if got != f"bytes {offset}-{stop}":
+                    raise RuntimeError(f"{source_object}: Content-Range {got!r}, esperado bytes {offset}-{stop}")
+                raw = resp.raw.read(size, decode_content=False)
+            else:
+                # servidor que ignora Range devolve 200 com o arquivo inteiro
+                raw = resp.raw.read(offset + size, decode_content=False)[offset:]
+        if len(raw) != size:
+            raise RuntimeError(f"{source_object}: {len(raw)} bytes lidos, esperado {size}")
+    return unify_newlines(raw.decode(encoding, errors="replace"))
+
+def reingest_block(composite_key: str) -> dict | None:
+    """
+    Regera a linha de all_data de um único bloco. Com índice de bytes é uma
+    leitura por Range; linhas antigas, sem índice, baixam o arquivo inteiro.
+    """
+    res = sb_http.call(lambda: supabase.table("all_data").select(
+        "source_file,block_id,source_object,source_byte_offset,source_byte_length,source_encoding"
+    ).eq("composite_key", composite_key).limit(1).execute())
+    current = (res.data or [None])[0]
+
+    if current and current.get("source_byte_offset") is not None:
+        b = read_block(
+            current["source_object"],
+            current["source_byte_offset"],
+            current["source_byte_length"],
+            current["source_encoding"],
+        )
+        row = parse_one_block(b, current["source_object"], current["block_id"])
+        row.update({k: current[k] for k in (
+            "source_object", "source_byte_offset", "source_byte_length", "source_encoding"
+        )})
+        return row
+
+    source_file = composite_key.rsplit("-", 1)[0]
+    if current and current.get("source_object"):
+        # bloco de .txt.gz/.zip (ou .txt sem índice): o objeto de origem é conhecido
+        names = [current["source_object"]]
+    else:
+        names = [f["name"] for f in list_bulletin_files() if f["name"].split("-")[-1] == source_file]
+    if not names:
+        return None
+    print(f"⚠️ {composite_key} sem índice de bytes; baixando {names[0]} inteiro.")
+    return next((r for r in ingest_file(names[0]) if r["composite_key"] == composite_key), None)
+
+def upsert_rows(rows: list) -> bool:
+    """
+    Upsert em all_data via PostgREST com o corpo JSON gerado em pedaços
+    (cpc_records.stream_rows): o lote não vira uma string única na memória.
+    """
+    resp = sb_http.post(
+        f"{SUPABASE_URL}/rest/v1/all_data",
+        headers={
+            "apikey": SUPABASE_SERVICE_KEY,
+            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+            "Content-Type": "application/json",
+            "Prefer": "resolution=merge-duplicates,return=minimal",
+        },
+        params={"on_conflict": "composite_key"},
+        data=stream_rows(rows),
+        timeout=300,
+    )
+    if not resp.ok:
+        print("❌ Erro no upsert:", resp.status_code, resp.text)
+        return False
+    return True
+
+# ---------------------------------------------------------------------
+# Pipeline principal
+# ---------------------------------------------------------------------
+def main():
+    if "--composite-key" in sys.argv:
+        composite_key = sys.argv[sys.argv.index("--composite-key") + 1]
+        print(f"🚀 Reprocessando o bloco {composite_key}…")
+        load_canonical_map()
+        row = reingest_block(composite_key)
+        ok = row is not None and upsert_rows([row])
+        if row is None:
+            print(f"⚠️ Bloco {composite_key} não encontrado.")
+        elif ok:
+            print("🚀 Upsert concluído com sucesso!")
+        sb_http.print_metrics("robot_depurar")
+        if not ok:
+            sys.exit(1)
         return
 
-    df = pd.DataFrame(rows)
-    print(f"✅ Total de blocos processados: {len(df)}")
+    # disparo do upload: só os arquivos recém-enviados, sem listar o bucket
+    names = requested_files()
+    if names:
+        print(f"🚀 Depurando {len(names)} arquivo(s) enviado(s)…")
+    elif os.environ.get("DEPURAR_FILES") or "--file" in sys.argv:
+        print("⚠️ Nenhum arquivo válido informado.")
+        return
+    else:
+        print("🚀 Iniciando depuração dos arquivos do bucket…")
+    load_canonical_map()
 
-    data = df.to_dict(orient="records")
-    res = supabase.table("all_data").upsert(
-        data,
-        on_conflict=["composite_key"]
-    ).execute()
+    if not names:
+        names = [f["name"] for f in list_bulletin_files()]
+    if not names:
+        print("⚠️ Nenhum arquivo encontrado no bucket 'uploads'.")
+        return
+
+    # upsert por lote: .txt inteiro; .txt.gz/.zip a cada STREAM_BLOCK_BATCH
+    # blocos, enquanto o resto ainda é descomprimido
+    total = 0
+    failed = 0
+    for name in names:
+        print(f"📂 Processando {name}")
+        keys: set = set()
+        try:
+            for _, rows, _ in iter_file_batches(name):
+                if rows and not upsert_rows(rows):
+                    raise RuntimeError("upsert falhou")
+                keys.update(r["composite_key"] for r in rows)
+        except Exception as e:
+            # arquivo ausente/inválido: segue com os demais e sai != 0 no fim
+            print(f"❌ Erro em {name}: {e}")
+            failed += 1
+        total += len(keys)
 
-    if getattr(res, "error", None):
-        print("❌ Erro no upsert:", res.error)
+    if not total:
+        print("⚠️ Nenhum bloco processado.")
     else:
+        print(f"✅ Total de blocos processados: {total}")
+
+    if not failed and total:
         print("🚀 Upsert concluído com sucesso!")
+    elif failed:
+        print(f"❌ Falha em {failed} arquivo(s).")
+    sb_http.print_metrics("robot_depurar")
+    # exit != 0: o pipeline não grava o fingerprint do bucket como ingerido
+    if failed or not total:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,244 @@
+import os
+import time
+import random
+import threading
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import requests
+
+# ======================================================
+# Limitador de chamadas ao Supabase (REST, RPC e storage)
+#
+# - Token bucket: teto de requisições por segundo (com rajada).
+# - Concorrência adaptativa AIMD: o limite de requisições em voo sobe
+#   +1 por "janela" de respostas boas e cai pela metade em 429/503
+#   (e 10% quando a latência passa do alvo). A taxa do bucket segue a
+#   mesma regra, sem passar do teto configurado.
+# - 429 é refeito com Retry-After ou backoff exponencial (o servidor não
+#   executou nada). 503 só é refeito em GET/PATCH/DELETE e em POST de
+#   upsert (Prefer: resolution=...): um 503 depois do commit num RPC como
+#   claim_parser_rows / enqueue_pending_links reivindicaria ou enfileiraria
+#   de novo.
+#
+# Limitador e Session são por processo: processos em paralelo (estágios
+# do src/pipeline.py, shards da matrix) somam as taxas. O pipeline divide
+# SB_RATE_LIMIT/SB_BURST entre os estágios que rodam juntos; em outros
+# casos, ajuste SB_RATE_LIMIT por processo. Keep-alive reaproveitado
+# (importante no parser_worker, que fica rodando).
+#
+# get/post/patch/delete têm a mesma assinatura de requests.* (data pode
+# ser uma fábrica de corpo em streaming, refeita a cada retry); call()
+# envolve chamadas do client supabase-py. snapshot()/print_metrics()
+# expõem os limites correntes nas métricas do run.
+# ======================================================
+
+MAX_RATE = float(os.environ.get("SB_RATE_LIMIT") or 20)  # req/s
+BURST = int(os.environ.get("SB_BURST") or 40)
+MIN_RATE = 1.0
+MAX_CONCURRENCY = int(os.environ.get("SB_MAX_CONCURRENCY") or 16)
+INITIAL_CONCURRENCY = float(os.environ.get("SB_INITIAL_CONCURRENCY") or 4)
+LATENCY_TARGET = float(os.environ.get("SB_LATENCY_TARGET_MS") or 2000) / 1000.0
+MAX_RETRIES = int(os.environ.get("SB_MAX_RETRIES") or 5)
+MAX_BACKOFF = 30.0
+
+THROTTLE_STATUS = {429, 503}
+# métodos que podem repetir depois de um 503 (o servidor pode ter executado)
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PATCH", "DELETE"}
+
+T = TypeVar("T")
+
+
+class AdaptiveLimiter:
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self.rate = MAX_RATE
+        self.limit = min(INITIAL_CONCURRENCY, MAX_CONCURRENCY)
+        self.in_flight = 0
+        self._tokens = float(BURST)
+        self._refilled = time.monotonic()
+        self._last_decrease = 0.0
+        self.latency_ewma: Optional[float] = None
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.slow = 0
+        self.wait_seconds = 0.0
+
+    # --- token bucket ---
+    def _refill(self, now: float) -> None:
+        self._tokens = min(BURST, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def acquire(self) -> None:
+        t0 = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self.in_flight < max(1, int(self.limit)) and self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    self.in_flight += 1
+                    break
+                if self._tokens < 1.0:
+                    self._cond.wait((1.0 - self._tokens) / self.rate)
+                else:
+                    self._cond.wait()
+            self.wait_seconds += time.monotonic() - t0
+
+    # --- AIMD ---
+    def release(self, latency: float, throttled: bool) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self.requests += 1
+            self.latency_ewma = (
+                latency if self.latency_ewma is None
+                else 0.8 * self.latency_ewma + 0.2 * latency
+            )
+            now = time.monotonic()
+            # no máximo uma redução por janela (~latência): uma rajada de
+            # 429 da mesma leva não derruba o limite até 1
+            can_decrease = now - self._last_decrease > max(self.latency_ewma, 0.5)
+
+            if throttled:
+                self.throttled += 1
+                if can_decrease:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.rate = max(MIN_RATE, self.rate / 2)
+                    self._last_decrease = now
+            elif latency > LATENCY_TARGET:
+                self.slow += 1
+                if can_decrease:
+                    self.limit = max(1.0, self.limit * 0.9)
+                    self._last_decrease = now
+            else:
+                self.limit = min(MAX_CONCURRENCY, self.limit + 1.0 / self.limit)
+                self.rate = min(MAX_RATE, self.rate + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def note_retry(self) -> None:
+        with self._cond:
+            self.retries += 1
+
+    def concurrency(self) -> int:
+        """Quantos workers vale a pena manter agora (para pools de threads)."""
+        return max(1, int(self.limit))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "rate_limit_rps": round(self.rate, 2),
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "slow": self.slow,
+                "retries": self.retries,
+                "latency_ewma_ms": round((self.latency_ewma or 0.0) * 1000, 1),
+                "limiter_wait_s": round(self.wait_seconds, 2),
+            }
+
+
+LIMITER = AdaptiveLimiter()
+SESSION = requests.Session()
+
+
+def backoff(attempt: int, retry_after: str | None = None) -> float:
+    if retry_after:
+        try:
+            return min(MAX_BACKOFF, float(retry_after))
+        except ValueError:
+            pass
+    return min(MAX_BACKOFF, 0.5 * (2 ** attempt)) * (0.5 + random.random() / 2)
+
+
+def retryable(method: str, status: int, headers: Optional[Dict[str, str]]) -> bool:
+    if status == 429:
+        return True
+    if status not in THROTTLE_STATUS:
+        return False
+    if method.upper() in IDEMPOTENT_METHODS:
+        return True
+    # POST de upsert (merge/ignore-duplicates) pode ser repetido; RPC não
+    prefer = next((v for k, v in (headers or {}).items() if k.lower() == "prefer"), "")
+    return "resolution=" in prefer
+
+
+def request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    """
+    requests.request sob o limitador. `data` pode ser uma função sem
+    argumentos que devolve o corpo (ex.: gerador de pedaços para corpo
+    chunked); ela é chamada de novo a cada tentativa.
+    """
+    body = kwargs.get("data")
+    body_factory = body if callable(body) else None
+    for attempt in range(MAX_RETRIES + 1):
+        if body_factory is not None:
+            kwargs["data"] = body_factory()
+        LIMITER.acquire()
+        t0 = time.monotonic()
+        resp: Optional[requests.Response] = None
+        try:
+            resp = SESSION.request(method, url, **kwargs)
+        finally:
+            throttled = resp is not None and resp.status_code in THROTTLE_STATUS
+            LIMITER.release(time.monotonic() - t0, throttled)
+        if not retryable(method, resp.status_code, kwargs.get("headers")) or attempt == MAX_RETRIES:
+            return resp
+        LIMITER.note_retry()
+        delay = backoff(attempt, resp.headers.get("Retry-After"))
+        # resposta descartada (stream=True não lê o corpo): devolve a conexão ao pool
+        resp.close()
+        time.sleep(delay)
+    return resp
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs: Any) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def patch(url: str, **kwargs: Any) -> requests.Response:
+    return request("PATCH", url, **kwargs)
+
+
+def delete(url: str, **kwargs: Any) -> requests.Response:
+    return request("DELETE", url, **kwargs)
+
+
+def _is_throttle_error(exc: Exception) -> bool:
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None) or getattr(exc, "status", None)
+    if str(code) in {str(s) for s in THROTTLE_STATUS}:
+        return True
+    text = str(exc)
+    return "429" in text or "503" in text or "Too Many Requests" in text
+
+
+def call(fn: Callable[[], T]) -> T:
+    """Chamada do client supabase-py (table/storage) sob o mesmo limitador."""
+    for attempt in range(MAX_RETRIES + 1):
+        LIMITER.acquire()
+        t0 = time.monotonic()
+        throttled = False
+        try:
+            return fn()
+        except Exception as e:
+            throttled = _is_throttle_error(e)
+            if not throttled or attempt == MAX_RETRIES:
+                raise
+        finally:
+            LIMITER.release(time.monotonic() - t0, throttled)
+        LIMITER.note_retry()
+        time.sleep(backoff(attempt))
+    raise RuntimeError("unreachable")
+
+
+def snapshot() -> Dict[str, Any]:
+    return LIMITER.snapshot()
+
+
+def print_metrics(label: str = "Supabase") -> None:
+    s = snapshot()
+    print(f"Métricas HTTP {label}: " + " ".join(f"{k}={v}" for k, v in s.items()))
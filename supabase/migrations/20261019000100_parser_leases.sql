@@ -0,0 +1,104 @@
+-- ======================================================
+-- Fila de parsing com lease (all_data)
+--
+-- Permite vários workers do mesmo parser_profile em paralelo:
+-- - claim_parser_rows: move até N linhas ready -> running num único
+--   round-trip (FOR UPDATE SKIP LOCKED), gravando worker e expiração.
+-- - renew_parser_lease: estende o lease das linhas do worker.
+-- - reclaim_expired_parser_leases: devolve para ready linhas running
+--   cujo lease expirou (worker morreu / runner despejado).
+-- ======================================================
+
+alter table public.all_data
+  add column if not exists parser_worker_id text,
+  add column if not exists parser_lease_expires_at timestamptz;
+
+create index if not exists all_data_parser_queue_idx
+  on public.all_data (parser_profile, parser_status, parser_lease_expires_at);
+
+
+create or replace function public.claim_parser_rows(
+  p_profile text,
+  p_worker_id text,
+  p_limit integer default 200,
+  p_lease_seconds integer default 600,
+  p_type_pattern text default null,
+  p_composite_key text default null
+)
+returns table (id bigint, composite_key text)
+language sql
+as $$
+  with picked as (
+    select a.id
+    from public.all_data a
+    where a.parser_profile = p_profile
+      and (
+        a.parser_status = 'ready'
+        -- lease expirado (ou running legado sem lease) é reivindicado de novo
+        or (
+          a.parser_status = 'running'
+          and (a.parser_lease_expires_at is null or a.parser_lease_expires_at < now())
+        )
+      )
+      and (p_composite_key is null or a.composite_key = p_composite_key)
+      and (
+        p_type_pattern is null
+        or exists (
+          select 1
+          from public.vw_bulletins_with_canonical v
+          where v.id = a.id
+            and v.canonical_type ilike p_type_pattern
+        )
+      )
+    order by a.bulletin_date asc nulls last, a.id asc
+    limit greatest(p_limit, 1)
+    for update of a skip locked
+  )
+  update public.all_data a
+     set parser_status = 'running',
+         parser_worker_id = p_worker_id,
+         parser_lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+    from picked
+   where a.id = picked.id
+  returning a.id::bigint, a.composite_key;
+$$;
+
+
+create or replace function public.renew_parser_lease(
+  p_worker_id text,
+  p_ids bigint[],
+  p_lease_seconds integer default 600
+)
+returns integer
+language sql
+as $$
+  with renewed as (
+    update public.all_data
+       set parser_lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+     where id = any(p_ids)
+       and parser_status = 'running'
+       and parser_worker_id = p_worker_id
+    returning 1
+  )
+  select count(*)::integer from renewed;
+$$;
+
+
+create or replace function public.reclaim_expired_parser_leases(
+  p_profile text default null
+)
+returns integer
+language sql
+as $$
+  with reclaimed as (
+    update public.all_data
+       set parser_status = 'ready',
+           parser_worker_id = null,
+           parser_lease_expires_at = null
+     where parser_status = 'running'
+       and (parser_lease_expires_at is null or parser_lease_expires_at < now())
+       and (p_profile is null or parser_profile = p_profile)
+    returning 1
+  )
+  select count(*)::integer from reclaimed;
+$$;
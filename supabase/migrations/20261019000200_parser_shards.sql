@@ -0,0 +1,73 @@
+-- ======================================================
+-- Sharding por hash de composite_key (all_data)
+--
+-- composite_key_hash é uma coluna gerada (md5 -> 31 bits), estável entre
+-- execuções e versões do Postgres. claim_parser_rows passa a aceitar
+-- p_shard_index / p_shard_count e filtra no próprio SELECT:
+--   composite_key_hash % p_shard_count = p_shard_index
+-- Assim cada runner da matrix só reivindica o seu pedaço da fila.
+-- ======================================================
+
+alter table public.all_data
+  add column if not exists composite_key_hash integer
+  generated always as (
+    (('x' || substr(md5(coalesce(composite_key, '')), 1, 8))::bit(32)::integer) & 2147483647
+  ) stored;
+
+create index if not exists all_data_parser_queue_shard_idx
+  on public.all_data (parser_profile, parser_status, composite_key_hash);
+
+
+drop function if exists public.claim_parser_rows(text, text, integer, integer, text, text);
+
+create or replace function public.claim_parser_rows(
+  p_profile text,
+  p_worker_id text,
+  p_limit integer default 200,
+  p_lease_seconds integer default 600,
+  p_type_pattern text default null,
+  p_composite_key text default null,
+  p_shard_index integer default 0,
+  p_shard_count integer default 1
+)
+returns table (id bigint, composite_key text)
+language sql
+as $$
+  with picked as (
+    select a.id
+    from public.all_data a
+    where a.parser_profile = p_profile
+      and (
+        a.parser_status = 'ready'
+        -- lease expirado (ou running legado sem lease) é reivindicado de novo
+        or (
+          a.parser_status = 'running'
+          and (a.parser_lease_expires_at is null or a.parser_lease_expires_at < now())
+        )
+      )
+      and (p_composite_key is null or a.composite_key = p_composite_key)
+      and (
+        coalesce(p_shard_count, 1) <= 1
+        or a.composite_key_hash % p_shard_count = p_shard_index
+      )
+      and (
+        p_type_pattern is null
+        or exists (
+          select 1
+          from public.vw_bulletins_with_canonical v
+          where v.id = a.id
+            and v.canonical_type ilike p_type_pattern
+        )
+      )
+    order by a.bulletin_date asc nulls last, a.id asc
+    limit greatest(p_limit, 1)
+    for update of a skip locked
+  )
+  update public.all_data a
+     set parser_status = 'running',
+         parser_worker_id = p_worker_id,
+         parser_lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+    from picked
+   where a.id = picked.id
+  returning a.id::bigint, a.composite_key;
+$$;
@@ -0,0 +1,127 @@
+-- ======================================================
+-- Fila de vínculos pendentes cpc_events -> cpc_birth
+--
+-- Eventos gravados sem cpc_birth_id (cpc_birth ainda não existia) entram
+-- aqui com ticker/company normalizados. Quando novas linhas de cpc_birth
+-- são gravadas, src/cpc_link_resolver.py procura só os eventos afetados
+-- (por ticker/company_key) e faz o PATCH de cpc_birth_id em lote.
+--
+-- company_key usa a regra de cpc_name_index.normalize_name (a mesma do
+-- vínculo), para a seleção não deixar de fora nomes que diferem só em
+-- pontuação, acentos ou sufixo societário.
+-- ======================================================
+
+-- Mesma normalização de cpc_link_resolver.norm_company / ticker_variants
+create or replace function public.cpc_norm_company(p text)
+returns text
+language sql
+immutable
+as $$
+  select nullif(
+    upper(btrim(regexp_replace(
+      regexp_replace(coalesce(p, ''), '\[formerly.*?\]', '', 'gi'),
+      '\s+', ' ', 'g'
+    ))),
+    ''
+  );
+$$;
+
+-- Mesma normalização de cpc_name_index.normalize_name: sem [formerly ...],
+-- NFKD sem o que não é ASCII, caixa alta, pontuação vira espaço e sufixos
+-- societários no fim são removidos
+create or replace function public.cpc_name_key(p text)
+returns text
+language sql
+immutable
+as $$
+  select nullif(
+    btrim(regexp_replace(
+      ' ' || btrim(regexp_replace(
+        regexp_replace(
+          upper(regexp_replace(
+            normalize(regexp_replace(coalesce(p, ''), '\[formerly.*?\]', ' ', 'gin'), NFKD),
+            '[^\x01-\x7F]', '', 'g'
+          )),
+          '[^A-Z0-9 ]+', ' ', 'g'
+        ),
+        ' +', ' ', 'g'
+      )),
+      '( (INC|INCORPORATED|CORP|CORPORATION|LTD|LIMITED|LTEE|CO|COMPANY|PLC|LLC|SA))+$', ''
+    )),
+    ''
+  );
+$$;
+
+create or replace function public.cpc_ticker_variants(p text)
+returns text[]
+language sql
+immutable
+as $$
+  select coalesce(array_agg(distinct v), '{}')
+  from (
+    select upper(btrim(t)) as v
+    from unnest(string_to_array(coalesce(p, ''), ',')) as t
+    union
+    select upper(btrim(split_part(t, '.', 1)))
+    from unnest(string_to_array(coalesce(p, ''), ',')) as t
+  ) s
+  where v <> '';
+$$;
+
+
+create table if not exists public.cpc_event_pending_links (
+  event_composite_key text primary key,
+  parser_profile text,
+  company_norm text,
+  tickers text[] not null default '{}',
+  created_at timestamptz not null default now(),
+  attempts integer not null default 0,
+  last_attempt_at timestamptz
+);
+
+create index if not exists cpc_event_pending_links_tickers_idx
+  on public.cpc_event_pending_links using gin (tickers);
+
+create index if not exists cpc_event_pending_links_company_idx
+  on public.cpc_event_pending_links (company_norm);
+
+alter table public.cpc_event_pending_links add column if not exists company_key text;
+
+create index if not exists cpc_event_pending_links_company_key_idx
+  on public.cpc_event_pending_links (company_key);
+
+update public.cpc_event_pending_links q
+   set company_key = public.cpc_name_key(a.company)
+  from public.all_data a
+ where a.composite_key = q.event_composite_key
+   and q.company_key is null;
+
+
+create or replace function public.enqueue_pending_links(
+  p_keys text[],
+  p_profile text
+)
+returns integer
+language sql
+as $$
+  with ins as (
+    insert into public.cpc_event_pending_links as q
+      (event_composite_key, parser_profile, company_norm, company_key, tickers)
+    select a.composite_key,
+           p_profile,
+           public.cpc_norm_company(a.company),
+           public.cpc_name_key(a.company),
+           public.cpc_ticker_variants(a.ticker)
+    from public.all_data a
+    where a.composite_key = any(p_keys)
+    on conflict (event_composite_key) do update
+      set parser_profile = excluded.parser_profile,
+          company_norm = excluded.company_norm,
+          company_key = excluded.company_key,
+          tickers = excluded.tickers,
+          attempts = q.attempts + 1,
+          last_attempt_at = now()
+    returning 1
+  )
+  select count(*)::integer from ins;
+$$;
@@ -0,0 +1,99 @@
+-- ======================================================
+-- Classificação canônica na ingestão (robot_depurar)
+--
+-- all_data passa a guardar o resultado do classificador de BULLETIN TYPE
+-- (src/bulletin_classifier.py), e claim_parser_rows filtra por igualdade
+-- em canonical_types (GIN) em vez de ilike sobre a view. Linhas antigas,
+-- ainda sem classificação, e as classificadas sem nenhum tipo ('{}')
+-- continuam pelo caminho do ilike.
+-- ======================================================
+
+create table if not exists public.bulletin_canonical_map (
+  pattern text primary key,
+  canonical_type text not null,
+  parser_profile text
+);
+
+insert into public.bulletin_canonical_map (pattern, canonical_type, parser_profile) values
+  ('NEW LISTING-CPC-SHARES', 'NEW LISTING-CPC-SHARES', 'cpc_birth'),
+  ('NEW LISTING-SHARES', 'NEW LISTING-SHARES', null),
+  ('HALT', 'HALT', 'events_halt_v1'),
+  ('RESUME TRADING', 'RESUME TRADING', 'events_resume_trading_v1'),
+  ('CPC-FILING STATEMENT', 'CPC-FILING STATEMENT', 'cpc_filing_statement_v1'),
+  ('CPC-INFORMATION CIRCULAR', 'CPC-INFORMATION CIRCULAR', 'cpc_events_information_circular_v1')
+on conflict (pattern) do nothing;
+
+alter table public.all_data
+  add column if not exists canonical_type text,
+  add column if not exists canonical_class text,
+  add column if not exists canonical_types text[],
+  add column if not exists canonical_parser_profile text;
+
+create index if not exists all_data_canonical_types_idx
+  on public.all_data using gin (canonical_types);
+
+create index if not exists all_data_canonical_parser_profile_idx
+  on public.all_data (canonical_parser_profile);
+
+
+drop function if exists public.claim_parser_rows(text, text, integer, integer, text, text, integer, integer);
+
+create or replace function public.claim_parser_rows(
+  p_profile text,
+  p_worker_id text,
+  p_limit integer default 200,
+  p_lease_seconds integer default 600,
+  p_type_pattern text default null,
+  p_composite_key text default null,
+  p_shard_index integer default 0,
+  p_shard_count integer default 1,
+  p_canonical_type text default null
+)
+returns table (id bigint, composite_key text)
+language sql
+as $$
+  with picked as (
+    select a.id
+    from public.all_data a
+    where a.parser_profile = p_profile
+      and (
+        a.parser_status = 'ready'
+        -- lease expirado (ou running legado sem lease) é reivindicado de novo
+        or (
+          a.parser_status = 'running'
+          and (a.parser_lease_expires_at is null or a.parser_lease_expires_at < now())
+        )
+      )
+      and (p_composite_key is null or a.composite_key = p_composite_key)
+      and (
+        coalesce(p_shard_count, 1) <= 1
+        or a.composite_key_hash % p_shard_count = p_shard_index
+      )
+      and (
+        (p_canonical_type is null and p_type_pattern is null)
+        -- classificado na ingestão: igualdade indexada
+        or (p_canonical_type is not null and p_canonical_type = any(a.canonical_types))
+        -- legado (sem classificação, ou classificado sem tipo: '{}'): ilike sobre a view
+        or (
+          (p_canonical_type is null or coalesce(cardinality(a.canonical_types), 0) = 0)
+          and p_type_pattern is not null
+          and exists (
+            select 1
+            from public.vw_bulletins_with_canonical v
+            where v.id = a.id
+              and v.canonical_type ilike p_type_pattern
+          )
+        )
+      )
+    order by a.bulletin_date asc nulls last, a.id asc
+    limit greatest(p_limit, 1)
+    for update of a skip locked
+  )
+  update public.all_data a
+     set parser_status = 'running',
+         parser_worker_id = p_worker_id,
+         parser_lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+    from picked
+   where a.id = picked.id
+  returning a.id::bigint, a.composite_key;
+$$;
@@ -0,0 +1,11 @@
+-- ======================================================
+-- Índice "Label: valor" por bulletin (robot_depurar.parse_one_block)
+--
+-- Ex.: {"_version": 2, "TRANSFER AGENT": "...", "TRADING SYMBOL": "ABC.P", ...}
+-- Cada chave é a captura do regex do parser (src/bulletin_labels.py);
+-- os parsers leem os campos por chave (parser_queue.fetch_bodies).
+-- Linhas antigas (null ou outra _version) continuam pelo regex sobre body_text.
+-- ======================================================
+
+alter table public.all_data
+  add column if not exists body_labels jsonb;
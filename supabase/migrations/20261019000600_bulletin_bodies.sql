@@ -0,0 +1,93 @@
+-- ======================================================
+-- Store de bodies por conteúdo (chave = source_hash, sha1 do body_text)
+--
+-- cpc_events deixa de guardar o bulletin inteiro em event_body_raw: os
+-- parsers mandam só metadados + source_hash e o trigger abaixo copia o
+-- body de all_data (mesma composite_key) para bulletin_bodies uma única
+-- vez por hash. A UI busca o texto sob demanda (/api/cpc_events_body)
+-- ou pela view vw_cpc_events_with_body.
+--
+-- O body continua também em all_data.body_text (ingestão, parsers e UI
+-- leem de lá): bulletin_bodies tira a cópia de cpc_events, não a de
+-- all_data, e só guarda bulletins que viraram evento.
+-- ======================================================
+
+create table if not exists public.bulletin_bodies (
+  source_hash text primary key,
+  body_text text not null,
+  created_at timestamptz not null default now()
+);
+
+-- TOAST com lz4 (Postgres 14+): bodies de bulletin comprimem bem
+alter table public.bulletin_bodies alter column body_text set compression lz4;
+
+-- leitura pública (texto dos bulletins já é público); escrita só pelo
+-- trigger (security definer) e pelo service role
+alter table public.bulletin_bodies enable row level security;
+drop policy if exists bulletin_bodies_read on public.bulletin_bodies;
+create policy bulletin_bodies_read on public.bulletin_bodies
+  for select to anon, authenticated
+  using (true);
+grant select on public.bulletin_bodies to anon, authenticated;
+
+
+-- security definer: grava no store mesmo com RLS, qualquer que seja o escritor
+create or replace function public.cpc_events_store_body()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  if new.event_body_raw is not null then
+    -- escritor antigo (ou replay de checkpoint) ainda mandando o body
+    insert into public.bulletin_bodies (source_hash, body_text)
+    values (
+      coalesce(new.source_hash, encode(sha1(convert_to(new.event_body_raw, 'UTF8')), 'hex')),
+      new.event_body_raw
+    )
+    on conflict (source_hash) do nothing;
+    new.source_hash := coalesce(new.source_hash, encode(sha1(convert_to(new.event_body_raw, 'UTF8')), 'hex'));
+    new.event_body_raw := null;
+  elsif new.source_hash is not null then
+    insert into public.bulletin_bodies (source_hash, body_text)
+    select new.source_hash, a.body_text
+    from public.all_data a
+    where a.composite_key = new.event_composite_key
+      and a.body_text is not null
+    limit 1
+    on conflict (source_hash) do nothing;
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists cpc_events_store_body on public.cpc_events;
+create trigger cpc_events_store_body
+  before insert or update of event_body_raw, source_hash on public.cpc_events
+  for each row execute function public.cpc_events_store_body();
+
+
+-- Backfill: bodies já gravados em cpc_events vão para o store e saem da tabela
+insert into public.bulletin_bodies (source_hash, body_text)
+select distinct on (e.source_hash) e.source_hash, e.event_body_raw
+from public.cpc_events e
+where e.source_hash is not null
+  and e.event_body_raw is not null
+on conflict (source_hash) do nothing;
+
+update public.cpc_events
+   set event_body_raw = null
+ where event_body_raw is not null
+   and source_hash in (select source_hash from public.bulletin_bodies);
+
+
+-- Leitura compatível com o formato antigo (body junto do evento);
+-- security_invoker: a view respeita o RLS de quem consulta
+create or replace view public.vw_cpc_events_with_body
+with (security_invoker = true) as
+select e.*, b.body_text as event_body_text
+from public.cpc_events e
+left join public.bulletin_bodies b on b.source_hash = e.source_hash;
+
+grant select on public.vw_cpc_events_with_body to anon, authenticated;
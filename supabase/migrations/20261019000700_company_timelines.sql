@@ -0,0 +1,325 @@
+-- ======================================================
+-- Timeline pré-computada por empresa (src/company_timelines.py)
+--
+-- Uma linha por empresa (nome normalizado por cpc_norm_company):
+-- cpc_birth mais antiga, eventos de cpc_events em ordem e referências
+-- dos bulletins de all_data. Reports e páginas leem a linha pronta em
+-- vez de agregar all_data/cpc_events a cada request:
+--   /api/reports/story: ordem dos bulletins (body buscado por id);
+--   lifecycle/cpc: âncora (1º NEW LISTING-CPC-SHARES) em colunas
+--   cpc_anchor_*, sem ler o jsonb de bulletins.
+--
+-- Incremental: updated_at (trigger) em all_data, cpc_birth e cpc_events;
+-- o job só recalcula empresas tocadas desde o último watermark.
+--
+-- Linhas ingeridas antes da classificação na ingestão (0400) não têm
+-- canonical_*: são classificadas aqui, uma vez, antes do 1º refresh.
+-- ======================================================
+
+-- Mesmas regras de src/bulletin_classifier.py sobre bulletin_canonical_map:
+-- tipo normalizado, padrão delimitado por não-alfanuméricos, padrão contido
+-- num maior que também casou não conta, ordem pela 1ª ocorrência e
+-- parser automático só para boletim de um único tipo.
+create or replace function public.bulletin_canonical_classify(p_bulletin_type text)
+returns table (
+  canonical_type text,
+  canonical_class text,
+  canonical_types text[],
+  canonical_parser_profile text
+)
+language sql
+stable
+as $$
+  with t as (
+    select btrim(regexp_replace(
+      regexp_replace(upper(coalesce(p_bulletin_type, '')), '\s*[-–—]\s*', '-', 'g'),
+      '\s+', ' ', 'g')) as txt
+  ),
+  pats as (
+    select
+      btrim(regexp_replace(
+        regexp_replace(upper(m.pattern), '\s*[-–—]\s*', '-', 'g'),
+        '\s+', ' ', 'g')) as p,
+      m.canonical_type,
+      m.parser_profile
+    from public.bulletin_canonical_map m
+  ),
+  hits as (
+    select p.p, p.canonical_type, p.parser_profile, strpos(t.txt, p.p) as pos
+    from pats p, t
+    where p.p <> ''
+      and t.txt ~ ('(^|[^[:alnum:]])' || p.p || '($|[^[:alnum:]])')
+  ),
+  kept as (
+    select h.*
+    from hits h, t
+    where not exists (
+      select 1
+      from hits g
+      where length(g.p) > length(h.p)
+        and strpos(g.p, h.p) > 0
+        and replace(t.txt, g.p, ' ') !~ ('(^|[^[:alnum:]])' || h.p || '($|[^[:alnum:]])')
+    )
+  ),
+  types as (
+    select
+      k.canonical_type,
+      min(k.pos) as pos,
+      (array_agg(k.parser_profile order by k.pos))[1] as parser_profile
+    from kept k
+    group by 1
+  )
+  select
+    string_agg(x.canonical_type, ', ' order by x.pos),
+    case count(*) when 0 then null when 1 then 'Unico' else 'Misto' end,
+    coalesce(array_agg(x.canonical_type order by x.pos) filter (where x.canonical_type is not null), '{}'),
+    case when count(*) = 1 then min(x.parser_profile) end
+  from types x;
+$$;
+
+update public.all_data a
+   set (canonical_type, canonical_class, canonical_types, canonical_parser_profile) = (
+     select c.canonical_type, c.canonical_class, c.canonical_types, c.canonical_parser_profile
+     from public.bulletin_canonical_classify(a.bulletin_type) c
+   )
+ where a.canonical_types is null;
+
+create or replace function public.touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.updated_at := now();
+  return new;
+end;
+$$;
+
+alter table public.all_data add column if not exists updated_at timestamptz not null default now();
+alter table public.cpc_birth add column if not exists updated_at timestamptz not null default now();
+alter table public.cpc_events add column if not exists updated_at timestamptz not null default now();
+
+-- all_data: só colunas que entram na timeline (claim/lease/status não contam)
+drop trigger if exists all_data_touch_updated_at on public.all_data;
+create trigger all_data_touch_updated_at
+  before update of company, ticker, bulletin_type, canonical_type, bulletin_date, composite_key
+  on public.all_data
+  for each row execute function public.touch_updated_at();
+
+drop trigger if exists cpc_birth_touch_updated_at on public.cpc_birth;
+create trigger cpc_birth_touch_updated_at
+  before update on public.cpc_birth
+  for each row execute function public.touch_updated_at();
+
+drop trigger if exists cpc_events_touch_updated_at on public.cpc_events;
+create trigger cpc_events_touch_updated_at
+  before update on public.cpc_events
+  for each row execute function public.touch_updated_at();
+
+create index if not exists all_data_updated_at_idx on public.all_data (updated_at);
+create index if not exists cpc_birth_updated_at_idx on public.cpc_birth (updated_at);
+create index if not exists cpc_events_updated_at_idx on public.cpc_events (updated_at);
+create index if not exists cpc_events_cpc_birth_id_idx on public.cpc_events (cpc_birth_id);
+create index if not exists all_data_company_norm_idx on public.all_data (public.cpc_norm_company(company));
+create index if not exists cpc_birth_company_norm_idx on public.cpc_birth (public.cpc_norm_company(company_name));
+
+
+create table if not exists public.company_timelines (
+  company_norm text primary key,
+  company_name text,
+  ticker text,
+  cpc_birth_id uuid,
+  birth jsonb,
+  events jsonb not null default '[]',
+  bulletins jsonb not null default '[]',
+  first_bulletin_date date,
+  last_bulletin_date date,
+  bulletin_count integer not null default 0,
+  event_count integer not null default 0,
+  -- algum bulletin NEW LISTING-CPC-SHARES; o 1º é a âncora do lifecycle/cpc
+  cpc_listing boolean not null default false,
+  cpc_anchor_id bigint,
+  cpc_anchor_date date,
+  cpc_anchor_company text,
+  cpc_anchor_ticker text,
+  refreshed_at timestamptz not null default now()
+);
+
+create index if not exists company_timelines_cpc_birth_id_idx on public.company_timelines (cpc_birth_id);
+create index if not exists company_timelines_ticker_idx on public.company_timelines (ticker);
+create index if not exists company_timelines_cpc_listing_idx on public.company_timelines (cpc_listing) where cpc_listing;
+create index if not exists company_timelines_cpc_anchor_idx
+  on public.company_timelines (company_norm) where cpc_anchor_id is not null;
+
+-- leitura pelas páginas (anon key); escrita só pelo job (service role)
+alter table public.company_timelines enable row level security;
+drop policy if exists company_timelines_read on public.company_timelines;
+create policy company_timelines_read on public.company_timelines
+  for select to anon, authenticated
+  using (true);
+grant select on public.company_timelines to anon, authenticated;
+
+create table if not exists public.timeline_job_state (
+  job text primary key,
+  watermark timestamptz,
+  updated_at timestamptz not null default now()
+);
+
+
+-- Empresas (normalizadas) tocadas desde p_since; p_since null = todas
+create or replace function public.timeline_touched_companies(p_since timestamptz)
+returns setof text
+language sql
+stable
+as $$
+  select distinct c
+  from (
+    select public.cpc_norm_company(a.company) as c
+    from public.all_data a
+    where p_since is null or a.updated_at >= p_since
+    union all
+    select public.cpc_norm_company(b.company_name)
+    from public.cpc_birth b
+    where p_since is null or b.updated_at >= p_since
+    union all
+    select public.cpc_norm_company(b.company_name)
+    from public.cpc_events e
+    join public.cpc_birth b on b.id = e.cpc_birth_id
+    where p_since is null or e.updated_at >= p_since
+  ) s
+  where c is not null;
+$$;
+
+
+-- Recalcula as timelines das empresas informadas (apaga e regrava, atômico)
+create or replace function public.refresh_company_timelines(p_companies text[])
+returns integer
+language plpgsql
+as $$
+declare
+  n integer;
+begin
+  delete from public.company_timelines t where t.company_norm = any(p_companies);
+
+  with births as (
+    select distinct on (public.cpc_norm_company(b.company_name))
+      public.cpc_norm_company(b.company_name) as company_norm,
+      b.id,
+      b.company_name,
+      b.ticker,
+      to_jsonb(b) as birth
+    from public.cpc_birth b
+    where public.cpc_norm_company(b.company_name) = any(p_companies)
+    order by public.cpc_norm_company(b.company_name), b.bulletin_date asc nulls last
+  ),
+  classified as (
+    -- canonical_* nulo (linha gravada fora do robot_depurar): classifica aqui
+    select
+      a.id, a.composite_key, a.company, a.bulletin_date, a.bulletin_type, a.ticker,
+      coalesce(a.canonical_type, c.canonical_type) as canonical_type,
+      coalesce(a.canonical_types, c.canonical_types) as canonical_types
+    from public.all_data a
+    left join lateral (
+      select * from public.bulletin_canonical_classify(a.bulletin_type)
+      where a.canonical_types is null
+    ) c on true
+    where public.cpc_norm_company(a.company) = any(p_companies)
+  ),
+  bulletins as (
+    select
+      public.cpc_norm_company(a.company) as company_norm,
+      jsonb_agg(
+        jsonb_build_object(
+          'id', a.id,
+          'composite_key', a.composite_key,
+          'company', a.company,
+          'bulletin_date', a.bulletin_date,
+          'bulletin_type', a.bulletin_type,
+          'canonical_type', a.canonical_type,
+          'ticker', a.ticker
+        )
+        order by a.bulletin_date asc nulls last, a.id asc
+      ) as items,
+      count(*) as n,
+      min(a.bulletin_date) as first_date,
+      max(a.bulletin_date) as last_date,
+      bool_or('NEW LISTING-CPC-SHARES' = any(a.canonical_types)) as cpc_listing,
+      (array_agg(jsonb_build_object(
+         'id', a.id, 'bulletin_date', a.bulletin_date, 'company', a.company, 'ticker', a.ticker)
+       order by a.bulletin_date asc nulls last, a.id asc)
+        filter (where 'NEW LISTING-CPC-SHARES' = any(a.canonical_types)
+                  and a.bulletin_date is not null))[1] as cpc_anchor,
+      -- nome/ticker mais recentes (renomeações)
+      (array_agg(a.company order by a.bulletin_date desc nulls last, a.id desc))[1] as company_name,
+      (array_agg(a.ticker order by a.bulletin_date desc nulls last, a.id desc)
+        filter (where a.ticker is not null))[1] as ticker
+    from classified a
+    group by 1
+  ),
+  events as (
+    select
+      br.company_norm,
+      jsonb_agg(
+        to_jsonb(e) - 'event_body_raw'
+        order by e.event_effective_date asc nulls last, e.bulletin_date asc nulls last, e.event_composite_key
+      ) as items,
+      count(*) as n
+    from births br
+    join public.cpc_events e on e.cpc_birth_id = br.id
+    group by 1
+  )
+  insert into public.company_timelines (
+    company_norm, company_name, ticker, cpc_birth_id, birth, events, bulletins,
+    first_bulletin_date, last_bulletin_date, bulletin_count, event_count, cpc_listing,
+    cpc_anchor_id, cpc_anchor_date, cpc_anchor_company, cpc_anchor_ticker, refreshed_at
+  )
+  select
+    k.company_norm,
+    coalesce(bu.company_name, br.company_name),
+    coalesce(bu.ticker, br.ticker),
+    br.id,
+    br.birth,
+    coalesce(ev.items, '[]'::jsonb),
+    coalesce(bu.items, '[]'::jsonb),
+    bu.first_date,
+    bu.last_date,
+    coalesce(bu.n, 0),
+    coalesce(ev.n, 0),
+    coalesce(bu.cpc_listing, false),
+    (bu.cpc_anchor->>'id')::bigint,
+    (bu.cpc_anchor->>'bulletin_date')::date,
+    bu.cpc_anchor->>'company',
+    bu.cpc_anchor->>'ticker',
+    now()
+  from (select distinct unnest(p_companies) as company_norm) k
+  left join births br on br.company_norm = k.company_norm
+  left join bulletins bu on bu.company_norm = k.company_norm
+  left join events ev on ev.company_norm = k.company_norm
+  where br.id is not null or bu.n is not null;
+
+  get diagnostics n = row_count;
+  return n;
+end;
+$$;
+
+
+-- Timelines pelos nomes como aparecem em all_data.company (mesma
+-- normalização da chave); `company` devolve o nome pedido
+create or replace function public.company_timelines_for(p_companies text[])
+returns table (
+  company text,
+  company_norm text,
+  company_name text,
+  ticker text,
+  cpc_birth_id uuid,
+  bulletins jsonb,
+  last_bulletin_date date
+)
+language sql
+stable
+as $$
+  select c.company, t.company_norm, t.company_name, t.ticker, t.cpc_birth_id, t.bulletins, t.last_bulletin_date
+  from unnest(p_companies) as c(company)
+  join public.company_timelines t on t.company_norm = public.cpc_norm_company(c.company);
+$$;
+
+grant execute on function public.company_timelines_for(text[]) to anon, authenticated;
@@ -0,0 +1,32 @@
+-- ======================================================
+-- Poll barato do parser_worker (src/parser_worker.py)
+--
+-- Devolve, entre os profiles informados, os que têm trabalho: linhas
+-- ready ou running com lease vencido (mesma regra de claim_parser_rows).
+-- Um exists por profile: o worker consulta a cada poucos segundos sem
+-- varrer all_data.
+-- ======================================================
+
+create index if not exists all_data_parser_profile_status_idx
+  on public.all_data (parser_profile, parser_status);
+
+create or replace function public.ready_parser_profiles(p_profiles text[])
+returns setof text
+language sql
+stable
+as $$
+  select p.profile
+  from unnest(p_profiles) as p(profile)
+  where exists (
+    select 1
+    from public.all_data a
+    where a.parser_profile = p.profile
+      and (
+        a.parser_status = 'ready'
+        or (
+          a.parser_status = 'running'
+          and (a.parser_lease_expires_at is null or a.parser_lease_expires_at < now())
+        )
+      )
+  );
+$$;
@@ -0,0 +1,40 @@
+-- ======================================================
+-- Backfill por janela de datas (src/backfill.py)
+--
+-- Coloca na fila (parser_status = 'ready') as linhas de all_data de uma
+-- janela de bulletin_date cujo profile está entre os pedidos: o
+-- parser_profile já gravado (inclusive atribuído à mão) e, sem ele, o
+-- perfil canônico da ingestão. Linhas running com lease
+-- válido não são tocadas; done/error são reprocessadas (é um rebuild).
+-- ======================================================
+
+create index if not exists all_data_bulletin_date_idx on public.all_data (bulletin_date);
+
+create or replace function public.backfill_mark_ready(
+  p_from date,
+  p_to date,
+  p_profiles text[]
+)
+returns table (profile text, marked integer)
+language sql
+as $$
+  with marked as (
+    update public.all_data a
+       set parser_profile = coalesce(a.parser_profile, a.canonical_parser_profile),
+           parser_status = 'ready',
+           parser_parsed_at = null,
+           parser_worker_id = null,
+           parser_lease_expires_at = null
+     where a.bulletin_date between p_from and p_to
+       and coalesce(a.parser_profile, a.canonical_parser_profile) = any(p_profiles)
+       and not (
+         a.parser_status = 'running'
+         and a.parser_lease_expires_at is not null
+         and a.parser_lease_expires_at >= now()
+       )
+    returning a.parser_profile
+  )
+  select m.parser_profile, count(*)::integer
+  from marked m
+  group by 1;
+$$;
@@ -0,0 +1,18 @@
+-- ======================================================
+-- Índice de bytes por bloco (robot_depurar.ingest_file)
+--
+-- source_object: nome do arquivo no bucket uploads
+-- source_byte_offset / source_byte_length: posição do bloco no arquivo
+-- source_encoding: codec usado na decodificação
+--
+-- Reprocessar um composite_key vira uma leitura por Range (ou mmap da
+-- cópia local) em vez de baixar e dividir o arquivo inteiro
+-- (robot_depurar.py --composite-key). Linhas antigas ficam com null e
+-- continuam pelo caminho do arquivo inteiro.
+-- ======================================================
+
+alter table public.all_data
+  add column if not exists source_object text,
+  add column if not exists source_byte_offset bigint,
+  add column if not exists source_byte_length integer,
+  add column if not exists source_encoding text;
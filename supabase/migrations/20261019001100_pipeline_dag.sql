@@ -0,0 +1,110 @@
+-- ======================================================
+-- Orquestração ingestão -> cpc_birth -> eventos (src/pipeline.py)
+--
+-- 1) Fila automática: linha nova de all_data (ou com body_text /
+--    classificação alterados) entra como ready no profile canônico;
+--    parser_profile atribuído à mão (≠ canônico anterior) é mantido.
+--    Reupsert sem mudança não recoloca nada na fila.
+-- 2) updated_at de all_data só muda quando o valor muda (antes: qualquer
+--    upsert que listasse a coluna disparava o trigger).
+-- 3) requeue_downstream_errors: eventos que falharam por falta de
+--    cpc_birth voltam para ready quando um cpc_birth da mesma empresa
+--    é gravado/alterado.
+-- 4) pipeline_stage_state: fingerprint da entrada de cada estágio e,
+--    para a ingestão, a assinatura de cada arquivo do bucket (files).
+-- ======================================================
+
+-- (2)
+drop trigger if exists all_data_touch_updated_at on public.all_data;
+create trigger all_data_touch_updated_at
+  before update of company, ticker, bulletin_type, canonical_type, bulletin_date, composite_key
+  on public.all_data
+  for each row
+  when (
+    old.company is distinct from new.company
+    or old.ticker is distinct from new.ticker
+    or old.bulletin_type is distinct from new.bulletin_type
+    or old.canonical_type is distinct from new.canonical_type
+    or old.bulletin_date is distinct from new.bulletin_date
+    or old.composite_key is distinct from new.composite_key
+  )
+  execute function public.touch_updated_at();
+
+
+-- (1)
+create or replace function public.all_data_enqueue_parser()
+returns trigger
+language plpgsql
+as $$
+begin
+  if new.canonical_parser_profile is null then
+    return new;
+  end if;
+  if tg_op = 'INSERT'
+     or old.body_text is distinct from new.body_text
+     or old.canonical_parser_profile is distinct from new.canonical_parser_profile then
+    -- running com lease válido: o worker dono termina; não muda de dono
+    if tg_op = 'UPDATE'
+       and old.parser_status = 'running'
+       and old.parser_lease_expires_at >= now() then
+      return new;
+    end if;
+    -- profile manual (ou de rota) é preservado; só segue o canônico quando
+    -- estava vazio ou ainda era o canônico anterior
+    if new.parser_profile is null
+       or (tg_op = 'UPDATE' and new.parser_profile is not distinct from old.canonical_parser_profile) then
+      new.parser_profile := new.canonical_parser_profile;
+    end if;
+    new.parser_status := 'ready';
+    new.parser_parsed_at := null;
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists all_data_enqueue_parser on public.all_data;
+create trigger all_data_enqueue_parser
+  before insert or update of body_text, canonical_parser_profile
+  on public.all_data
+  for each row execute function public.all_data_enqueue_parser();
+
+
+-- (3)
+create or replace function public.requeue_downstream_errors(
+  p_profiles text[],
+  p_since timestamptz
+)
+returns integer
+language sql
+as $$
+  with births as (
+    select distinct public.cpc_norm_company(b.company_name) as company_norm
+    from public.cpc_birth b
+    where b.updated_at >= p_since
+  ),
+  requeued as (
+    update public.all_data a
+       set parser_status = 'ready',
+           parser_worker_id = null,
+           parser_lease_expires_at = null
+      from births br
+     where a.parser_profile = any(p_profiles)
+       and a.parser_status = 'error'
+       and public.cpc_norm_company(a.company) = br.company_norm
+    returning a.id
+  )
+  select count(*)::integer from requeued;
+$$;
+
+
+-- (4)
+create table if not exists public.pipeline_stage_state (
+  stage text primary key,
+  fingerprint text,
+  last_status text,
+  last_run_at timestamptz,
+  updated_at timestamptz not null default now()
+);
+
+-- nome do arquivo -> updated_at/eTag/size no último run ok (src/pipeline.py)
+alter table public.pipeline_stage_state add column if not exists files jsonb;
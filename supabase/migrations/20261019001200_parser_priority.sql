@@ -0,0 +1,207 @@
+-- ======================================================
+-- Faixa prioritária da fila de parsing
+--
+-- all_data.parser_priority:
+--   2 = pedido de um boletim (route.ts / COMPOSITE_KEY)
+--   1 = recém-ingerido (trigger all_data_enqueue_parser)
+--   0 = backlog / backfill (backfill_mark_ready)
+-- claim_parser_rows serve a maior prioridade primeiro; p_min_priority
+-- restringe o claim à faixa prioritária (parser_worker). O
+-- ready_parser_profiles aceita o mesmo filtro. p_from/p_to restringem
+-- o claim à janela de bulletin_date (chunk do backfill).
+--
+-- parser_requested_at: quando a linha entrou na fila; com
+-- parser_parsed_at dá a latência ponta a ponta (parser_queue.mark_done).
+-- ======================================================
+
+alter table public.all_data
+  add column if not exists parser_priority smallint not null default 0,
+  add column if not exists parser_requested_at timestamptz;
+
+create index if not exists all_data_parser_queue_priority_idx
+  on public.all_data (parser_profile, parser_status, parser_priority desc, bulletin_date);
+
+
+drop function if exists public.claim_parser_rows(text, text, integer, integer, text, text, integer, integer, text);
+
+create or replace function public.claim_parser_rows(
+  p_profile text,
+  p_worker_id text,
+  p_limit integer default 200,
+  p_lease_seconds integer default 600,
+  p_type_pattern text default null,
+  p_composite_key text default null,
+  p_shard_index integer default 0,
+  p_shard_count integer default 1,
+  p_canonical_type text default null,
+  p_min_priority integer default null,
+  p_from date default null,
+  p_to date default null
+)
+returns table (id bigint, composite_key text)
+language sql
+as $$
+  with picked as (
+    select a.id
+    from public.all_data a
+    where a.parser_profile = p_profile
+      and (
+        a.parser_status = 'ready'
+        -- lease expirado (ou running legado sem lease) é reivindicado de novo
+        or (
+          a.parser_status = 'running'
+          and (a.parser_lease_expires_at is null or a.parser_lease_expires_at < now())
+        )
+      )
+      and (p_composite_key is null or a.composite_key = p_composite_key)
+      and (p_min_priority is null or a.parser_priority >= p_min_priority)
+      and (p_from is null or a.bulletin_date >= p_from)
+      and (p_to is null or a.bulletin_date <= p_to)
+      and (
+        coalesce(p_shard_count, 1) <= 1
+        or a.composite_key_hash % p_shard_count = p_shard_index
+      )
+      and (
+        (p_canonical_type is null and p_type_pattern is null)
+        -- classificado na ingestão: igualdade indexada
+        or (p_canonical_type is not null and p_canonical_type = any(a.canonical_types))
+        -- legado (sem classificação, ou classificado sem tipo: '{}'): ilike sobre a view
+        or (
+          (p_canonical_type is null or coalesce(cardinality(a.canonical_types), 0) = 0)
+          and p_type_pattern is not null
+          and exists (
+            select 1
+            from public.vw_bulletins_with_canonical v
+            where v.id = a.id
+              and v.canonical_type ilike p_type_pattern
+          )
+        )
+      )
+    -- faixa prioritária primeiro (single-key > recém-ingerido > backlog)
+    order by a.parser_priority desc, a.bulletin_date asc nulls last, a.id asc
+    limit greatest(p_limit, 1)
+    for update of a skip locked
+  )
+  update public.all_data a
+     set parser_status = 'running',
+         parser_worker_id = p_worker_id,
+         parser_lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+    from picked
+   where a.id = picked.id
+  returning a.id::bigint, a.composite_key;
+$$;
+
+
+drop function if exists public.ready_parser_profiles(text[]);
+
+create or replace function public.ready_parser_profiles(
+  p_profiles text[],
+  p_min_priority integer default null
+)
+returns setof text
+language sql
+stable
+as $$
+  select p.profile
+  from unnest(p_profiles) as p(profile)
+  where exists (
+    select 1
+    from public.all_data a
+    where a.parser_profile = p.profile
+      and (p_min_priority is null or a.parser_priority >= p_min_priority)
+      and (
+        a.parser_status = 'ready'
+        or (
+          a.parser_status = 'running'
+          and (a.parser_lease_expires_at is null or a.parser_lease_expires_at < now())
+        )
+      )
+  );
+$$;
+
+
+-- ingestão: recém-ingerido entra na faixa 1
+create or replace function public.all_data_enqueue_parser()
+returns trigger
+language plpgsql
+as $$
+begin
+  if new.canonical_parser_profile is null then
+    return new;
+  end if;
+  if tg_op = 'INSERT'
+     or old.body_text is distinct from new.body_text
+     or old.canonical_parser_profile is distinct from new.canonical_parser_profile then
+    -- running com lease válido: o worker dono termina; não muda de dono
+    if tg_op = 'UPDATE'
+       and old.parser_status = 'running'
+       and old.parser_lease_expires_at >= now() then
+      return new;
+    end if;
+    -- profile manual (ou de rota) é preservado; só segue o canônico quando
+    -- estava vazio ou ainda era o canônico anterior
+    if new.parser_profile is null
+       or (tg_op = 'UPDATE' and new.parser_profile is not distinct from old.canonical_parser_profile) then
+      new.parser_profile := new.canonical_parser_profile;
+    end if;
+    new.parser_status := 'ready';
+    new.parser_parsed_at := null;
+    new.parser_priority := greatest(coalesce(new.parser_priority, 0), 1);
+    new.parser_requested_at := now();
+  end if;
+  return new;
+end;
+$$;
+
+
+-- backfill: faixa 0 (não passa na frente de pedidos e ingestão nova;
+-- linha já pedida numa faixa maior fica nela)
+create or replace function public.backfill_mark_ready(
+  p_from date,
+  p_to date,
+  p_profiles text[]
+)
+returns table (profile text, marked integer)
+language sql
+as $$
+  with marked as (
+    update public.all_data a
+       set parser_profile = coalesce(a.parser_profile, a.canonical_parser_profile),
+           parser_status = 'ready',
+           parser_parsed_at = null,
+           parser_worker_id = null,
+           parser_lease_expires_at = null,
+           -- pedido pendente (faixa 1/2) mantém a prioridade e a hora do pedido
+           parser_priority = greatest(a.parser_priority, 0),
+           parser_requested_at = case
+             when a.parser_status = 'ready' then coalesce(a.parser_requested_at, now())
+             else now()
+           end
+     where a.bulletin_date between p_from and p_to
+       and coalesce(a.parser_profile, a.canonical_parser_profile) = any(p_profiles)
+       and not (
+         a.parser_status = 'running'
+         and a.parser_lease_expires_at is not null
+         and a.parser_lease_expires_at >= now()
+       )
+    returning a.parser_profile
+  )
+  select m.parser_profile, count(*)::integer
+  from marked m
+  group by 1;
+$$;
+
+
+-- single-key: nome exato (cpc_norm_company, índice de expressão) sem
+-- carregar o índice de nomes inteiro no cliente
+create or replace function public.cpc_birth_id_by_company(p_company text)
+returns uuid
+language sql
+stable
+as $$
+  select b.id
+  from public.cpc_birth b
+  where public.cpc_norm_company(b.company_name) = public.cpc_norm_company(p_company)
+  order by b.bulletin_date asc nulls last
+  limit 1;
+$$;
@@ -0,0 +1,26 @@
+-- ======================================================
+-- Vínculo evento -> cpc_birth por ticker, mesma regra nos dois lados
+--
+-- cpc_link_resolver.match_birth compara cada variante do ticker do
+-- evento (o próprio e a raiz sem .P) com as variantes de ticker e
+-- trading_symbol de cpc_birth. O resolvedor de pendentes e o índice
+-- em memória dos parsers usam build_birth_index; o run single-key
+-- (COMPOSITE_KEY) usa esta RPC, sem carregar o cpc_birth inteiro.
+-- ======================================================
+
+create index if not exists cpc_birth_ticker_variants_idx
+  on public.cpc_birth
+  using gin ((public.cpc_ticker_variants(ticker) || public.cpc_ticker_variants(trading_symbol)));
+
+create or replace function public.cpc_birth_id_by_ticker(p_ticker text)
+returns uuid
+language sql
+stable
+as $$
+  select b.id
+  from public.cpc_birth b
+  where (public.cpc_ticker_variants(b.ticker) || public.cpc_ticker_variants(b.trading_symbol))
+        @> array[upper(btrim(p_ticker))]
+  order by b.bulletin_date asc nulls last
+  limit 1;
+$$;
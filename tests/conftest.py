@@ -0,0 +1,10 @@
+import os
+import sys
+
+# os módulos de src/ se importam pelo nome (como nos workflows: python src/x.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# robot_depurar cria o client do Supabase na importação; os testes não
+# chamam a rede, só precisam das variáveis presentes
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.test")
@@ -0,0 +1,133 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("supabase")
+
+from robot_depurar import BLOCK_SPLITTER, block_spans, byte_ranges, parse_blocks, unify_newlines  # noqa: E402
+
+SEED = 44
+CASES = 30000
+
+# pedaços de boletim: texto, quebras (\n, \r\n, \r soltos) e os dois
+# separadores do BLOCK_SPLITTER, inteiros ou quase (que não devem casar)
+PIECES = [
+    "ABC Corp (\"ABC.P\")", "BULLETIN TYPE: Halt", "Effective at 9:00 a.m.", "é", "ß", "€", "x",
+    " ", "  ", "\t", "\n", "\r\n", "\r", "\n\n",
+    "\nTSX-X\n_____\n", "\r\nTSX-X\r\n____\r\n", "\ntsx-x  \n  __\n", "\nTSX-X\n\n",
+    "\n_____\n", "\r\n______\r\n", "\n____\n", "_____",
+]
+
+
+def baseline(txt):
+    """parse_blocks antes do índice de offsets (split + strip)."""
+    t = txt.replace("\r\n", "\n").replace("\r", "\n")
+    return [b.strip() for b in BLOCK_SPLITTER.split(t) if b.strip()]
+
+
+def random_text(rng: random.Random) -> str:
+    return "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 30)))
+
+
+def test_block_spans_match_old_splitter():
+    rng = random.Random(SEED)
+    for _ in range(CASES):
+        txt = random_text(rng)
+        spans = block_spans(txt)
+        assert [b for b, _, _ in spans] == baseline(txt), repr(txt)
+        assert parse_blocks(txt) == baseline(txt)
+        for b, start, stop in spans:
+            # intervalo no texto original (antes de \r\n -> \n)
+            assert unify_newlines(txt[start:stop]) == b, repr(txt)
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "cp1252", "latin-1"])
+def test_byte_ranges_point_at_each_block(encoding):
+    rng = random.Random(SEED + 1)
+    for _ in range(CASES // 10):
+        txt = random_text(rng)
+        try:
+            raw = txt.encode(encoding)
+        except UnicodeEncodeError:
+            continue
+        spans = block_spans(txt)
+        ranges = byte_ranges(raw, txt, encoding, spans)
+        assert ranges is not None
+        assert len(ranges) == len(spans)
+        for (b, _, _), (offset, size) in zip(spans, ranges):
+            assert unify_newlines(raw[offset:offset + size].decode(encoding)) == b, repr(txt)
+
+
+def test_byte_ranges_refuses_text_that_does_not_round_trip():
+    txt = "ABC\n_____\nDEF"
+    spans = block_spans(txt)
+    assert byte_ranges(b"\xffABC\n_____\nDEF", txt, "utf-8", spans) is None
+    # codec com BOM: offsets não batem com o arquivo
+    assert byte_ranges(txt.encode("utf-16"), txt, "utf-16", spans) is None
+    assert byte_ranges(txt.encode("utf-8"), txt, None, spans) is None
+
+
+class FakeRaw:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, n, decode_content=True):
+        assert decode_content is False
+        return self.data[:n]
+
+
+class FakeResponse:
+    def __init__(self, status_code, data, headers):
+        self.status_code = status_code
+        self.headers = headers
+        self.raw = FakeRaw(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def serve(monkeypatch, blob, respond):
+    import robot_depurar
+
+    class Bucket:
+        def get_public_url(self, name):
+            return f"https://storage/{name}"
+
+    monkeypatch.setattr(robot_depurar, "LOCAL_DIR", None)
+    monkeypatch.setattr(robot_depurar, "supabase", SimpleNamespace(storage=SimpleNamespace(from_=lambda bucket: Bucket())))
+    monkeypatch.setattr(robot_depurar, "range_get", lambda url, start, stop: respond(blob, start, stop))
+    return robot_depurar.read_block
+
+
+def test_read_block_http_range(monkeypatch):
+    blob = "cabeçalho\nBloco é único\nresto".encode("utf-8")
+    offset = blob.index("Bloco".encode("utf-8"))
+    size = len("Bloco é único".encode("utf-8"))
+
+    def partial(blob, start, stop):
+        return FakeResponse(206, blob[start:stop + 1], {"Content-Range": f"bytes {start}-{stop}/{len(blob)}"})
+
+    def whole(blob, start, stop):
+        return FakeResponse(200, blob, {})
+
+    assert serve(monkeypatch, blob, partial)("n.txt", offset, size, "utf-8") == "Bloco é único"
+    assert serve(monkeypatch, blob, whole)("n.txt", offset, size, "utf-8") == "Bloco é único"
+
+
+@pytest.mark.parametrize(
+    "status,headers",
+    [
+        (206, {"Content-Range": "bytes 0-12/40"}),
+        (206, {"Content-Range": "bytes 10-22/40", "Content-Encoding": "gzip"}),
+        (200, {"Content-Encoding": "gzip"}),
+    ],
+)
+def test_read_block_refuses_wrong_bytes(monkeypatch, status, headers):
+    read_block = serve(monkeypatch, b"x" * 40, lambda blob, start, stop: FakeResponse(status, blob, headers))
+    with pytest.raises(RuntimeError):
+        read_block("n.txt", 10, 13, "utf-8")
@@ -0,0 +1,24 @@
+import cpc_link_resolver
+from cpc_name_index import normalize_name
+
+
+def test_pending_selected_by_the_same_key_used_to_link(monkeypatch):
+    births = [{"id": "b1", "ticker": None, "trading_symbol": None, "company_name": "Açme Capital Corp.", "bulletin_date": "2008-01-30"}]
+    # company_key gravado pela fila (public.cpc_name_key) para "ACME CAPITAL, INC."
+    pending = [{"event_composite_key": "n20080201.txt-3", "company_norm": "ACME CAPITAL, INC.", "company_key": "ACME CAPITAL", "tickers": []}]
+    queried = []
+
+    def fetch_all(table, params):
+        queried.append(params)
+        if params.get("company_key") == 'in.("ACME CAPITAL")':
+            return pending
+        return []
+
+    linked = {}
+    monkeypatch.setattr(cpc_link_resolver, "fetch_all", fetch_all)
+    monkeypatch.setattr(cpc_link_resolver, "link_events", lambda bid, keys: linked.setdefault(bid, keys) and len(keys))
+    monkeypatch.setattr(cpc_link_resolver, "drop_pending", lambda keys: None)
+
+    assert cpc_link_resolver.resolve_for_births(births) == 1
+    assert linked == {"b1": ["n20080201.txt-3"]}
+    assert normalize_name("ACME CAPITAL, INC.") == normalize_name("Açme Capital Corp.") == "ACME CAPITAL"
@@ -0,0 +1,30 @@
+from cpc_name_index import MATCH_THRESHOLD, CompanyNameIndex
+
+BIRTHS = [
+    {"id": "westbridge", "company_name": "Westbridge Capital Ventures Ltd.", "bulletin_date": "2008-01-30"},
+    {"id": "northern", "company_name": "Northern Gold Capital Corp.", "bulletin_date": "2008-02-04"},
+    {"id": "redwood", "company_name": "Redwood Capital Corp.", "bulletin_date": "2008-03-11"},
+    {"id": "alpha2", "company_name": "Alpha Capital II Inc.", "bulletin_date": "2008-04-01"},
+]
+
+
+def test_default_threshold_links_near_matches_only():
+    index = CompanyNameIndex(BIRTHS)
+    assert 0.85 <= MATCH_THRESHOLD < 1.0
+    # exato após normalize_name
+    assert index.best("WESTBRIDGE CAPITAL VENTURES, INC.") == "westbridge"
+    # quase iguais: singular, erro de digitação, espaço a mais
+    assert index.best("Westbridge Capital Venture Corp") == "westbridge"
+    assert index.best("Westbrige Capital Ventures") == "westbridge"
+    assert index.best("West Bridge Capital Ventures") == "westbridge"
+    # outra empresa: uma palavra inteira diferente, ou série diferente
+    assert index.best("Southern Gold Capital Corp.") is None
+    assert index.best("Redwood Capital Partners Corp.") is None
+    assert index.best("Westbridge Resources Ltd.") is None
+    assert index.best("Alpha Capital III Inc.") is None
+
+
+def test_threshold_one_means_exact_only():
+    index = CompanyNameIndex(BIRTHS)
+    assert index.best("Westbrige Capital Ventures", threshold=1.0) is None
+    assert index.best("Westbridge Capital Ventures Corp", threshold=1.0) == "westbridge"
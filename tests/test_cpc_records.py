@@ -0,0 +1,81 @@
+import json
+import random
+import tracemalloc
+
+import pytest
+
+from cpc_records import BIRTH_FIELDS, EVENT_FIELDS, CpcBirthRow, CpcEventRow, iter_rows_json
+
+VALUES = [None, 0, 1, -7, 3.5, 1e21, True, False, "", "abc", 'aspas " e \\ barra', "ação — ñ ✓", "linha\nnova\t"]
+
+
+def random_values(rng: random.Random, fields: list) -> dict:
+    return {f: rng.choice(VALUES) for f in fields}
+
+
+@pytest.mark.parametrize("row_cls,fields", [(CpcBirthRow, BIRTH_FIELDS), (CpcEventRow, EVENT_FIELDS)])
+def test_item_access_and_get(row_cls, fields):
+    values = random_values(random.Random(31), fields)
+    row = row_cls(**values)
+    for f in fields:
+        assert row[f] == values[f]
+        assert row.get(f) == values.get(f)
+    assert row.get("nao_existe") is None
+    assert row.get("nao_existe", "x") == "x"
+    row[fields[0]] = "novo"
+    assert row[fields[0]] == "novo"
+    assert dict(row.items()) == {**values, fields[0]: "novo"}
+    assert list(row.to_payload()) == fields
+
+
+def test_missing_fields_default_to_none_and_unknown_fields_fail():
+    row = CpcEventRow(event_composite_key="n20080130.txt-9")
+    assert row.to_payload() == {f: ("n20080130.txt-9" if f == "event_composite_key" else None) for f in EVENT_FIELDS}
+    with pytest.raises(TypeError):
+        CpcEventRow(campo_extra=1)
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 64, 1 << 20])
+def test_iter_rows_json_matches_json_dumps(chunk_bytes):
+    rng = random.Random(310)
+    rows, dicts = [], []
+    for _ in range(200):
+        row_cls, fields = rng.choice([(CpcBirthRow, BIRTH_FIELDS), (CpcEventRow, EVENT_FIELDS)])
+        values = random_values(rng, fields)
+        rows.append(row_cls(**values))
+        dicts.append(values)
+
+    body = b"".join(iter_rows_json(rows, chunk_bytes=chunk_bytes))
+    # to_json monta o mesmo JSON compacto que json.dumps do dict equivalente
+    assert body == json.dumps(dicts, separators=(",", ":")).encode("utf-8")
+
+
+def test_iter_rows_json_accepts_dicts():
+    rng = random.Random(311)
+    dicts = [random_values(rng, EVENT_FIELDS) for _ in range(20)]
+    rows = [CpcEventRow(**d) if i % 2 else dict(d) for i, d in enumerate(dicts)]
+    assert json.loads(b"".join(iter_rows_json(rows, chunk_bytes=32))) == dicts
+
+
+def test_iter_rows_json_empty():
+    assert b"".join(iter_rows_json([])) == b"[]"
+
+
+def traced_bytes_per_row(make, n: int = 5000) -> float:
+    tracemalloc.start()
+    try:
+        rows = [make(i) for i in range(n)]
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(rows) == n
+    return current / n
+
+
+def test_slotted_birth_row_memory():
+    # mesmos objetos de valor nos dois lados: mede só o contêiner da linha
+    values = [{f: f"{f}-{i}" for f in BIRTH_FIELDS} for i in range(5000)]
+    as_dict = traced_bytes_per_row(lambda i: dict(values[i]))
+    slotted = traced_bytes_per_row(lambda i: CpcBirthRow(**values[i]))
+    # números do cabeçalho de cpc_records: ~840 B x ~330 B por linha
+    assert as_dict / slotted >= 2.0
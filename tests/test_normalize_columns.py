@@ -0,0 +1,93 @@
+import calendar
+import random
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("supabase")
+
+from robot_depurar import (  # noqa: E402
+    normalize_date,
+    normalize_dates,
+    normalize_tier,
+    normalize_tiers,
+    parse_block_rows,
+    parse_one_block,
+)
+
+SEED = 49
+CASES = 50000
+BATCH = 500
+
+MONTH_NAMES = [m for m in calendar.month_name if m] + [m for m in calendar.month_abbr if m] + ["Sept", "Jnauary"]
+SPACES = ["", " ", "  ", "\t", "\n"]
+
+
+def random_date(rng: random.Random):
+    kind = rng.random()
+    if kind < 0.05:
+        return rng.choice([None, "", " ", "n/a", "TBA", "30/30/2008"])
+    y = rng.choice([rng.randint(1990, 2030), 0, 9999, 202])
+    m = rng.randint(0, 13)
+    d = rng.choice([rng.randint(0, 32), "07", "7", "007", "٣"])
+    name = rng.choice(MONTH_NAMES)
+    if rng.random() < 0.3:
+        name = rng.choice([name.upper(), name.lower()])
+    fmts = [
+        f"{name} {d}, {y}",
+        f"{name} {d},{y}",
+        f"{name}  {d}, {y}",
+        f"{name} {d} {y}",
+        f"{y}-{m:02d}-{d}",
+        f"{d}-{m:02d}-{y}",
+        f"{y}/{m}/{d}",
+        f"{d}/{m}/{y}",
+        f"{d}-{name}-{y}",
+        f"{name} {d}, {y:04d}",
+    ]
+    return rng.choice(SPACES) + rng.choice(fmts) + rng.choice(SPACES)
+
+
+def random_tier(rng: random.Random):
+    return rng.choice([
+        None, "", " ", "TSX Venture Tier 1 Company", "TSX Venture Tier 2 Company", "NEX Company",
+        "tier 1", "TIER 2", "Tier 10", "nex tier 2", "Tier 2 / NEX", "  Other  ", "Tier\t1", "annex",
+    ])
+
+
+def series(values):
+    return pd.Series(values, dtype=object)
+
+
+def test_normalize_dates_matches_normalize_date():
+    rng = random.Random(SEED)
+    for _ in range(CASES // BATCH):
+        values = [random_date(rng) for _ in range(BATCH)]
+        got = normalize_dates(series(values)).tolist()
+        assert got == [normalize_date(v) for v in values]
+
+
+def test_normalize_tiers_matches_normalize_tier():
+    rng = random.Random(SEED + 1)
+    for _ in range(CASES // BATCH):
+        values = [random_tier(rng) for _ in range(BATCH)]
+        got = normalize_tiers(series(values)).tolist()
+        assert got == [normalize_tier(v) for v in values]
+
+
+def test_empty_and_all_missing_columns():
+    assert normalize_dates(series([])).tolist() == []
+    assert normalize_dates(series([None, None])).tolist() == [None, None]
+    assert normalize_tiers(series([None, ""])).tolist() == [None, None]
+
+
+def test_parse_block_rows_matches_parse_one_block():
+    rng = random.Random(SEED + 2)
+    bodies = [
+        f"ABC CORP. (\"ABC.P\")\nBULLETIN TYPE: Halt\nBULLETIN DATE: {random_date(rng)}\n"
+        f"TSX Venture {random_tier(rng) or ''}\nTexto do bloco {i}."
+        for i in range(200)
+    ]
+    for source_file in ("n20080130.txt", "arquivo-n20080131.txt"):
+        rows = parse_block_rows(bodies, source_file, start=3)
+        assert rows == [parse_one_block(b, source_file, i, normalized=True) for i, b in enumerate(bodies, start=3)]
@@ -0,0 +1,69 @@
+import random
+import re
+import unicodedata
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("supabase")
+
+import robot_depurar  # noqa: E402
+from robot_depurar import NFKC_SEP, normalize_blocks, normalize_text  # noqa: E402
+
+SEED = 43
+CASES = 20000
+
+# ASCII comum + caracteres que o NFKC muda, compõe ou decompõe: acentos
+# combinantes, largura total, ligaduras, jamo hangul (compõem entre si),
+# espaços de compatibilidade (viram " " e entram no colapso)
+ASCII = list("abcXYZ019 .,:-\"'()") + ["  ", "   ", "\t", "\n", "\r\n"]
+ALPHABET = (
+    ASCII
+    + ["\u00e9", "e\u0301", "\u0301", "\u0327", "\uff21", "\uff11", "\ufb01", "\u2460", "\u2122", "\u00bd", "\u212b", "\u2126"]
+    + ["\u1100", "\u1161", "\u11a8", "\uac00"]
+    + ["\u00a0", "\u3000", "\u2003"]
+)
+
+
+def baseline(s):
+    """normalize_text antes do fast path (NFKC sempre, regex de espaços)."""
+    if s is None:
+        return ""
+    s = unicodedata.normalize("NFKC", s)
+    s = re.sub(r"[ \t]+", " ", s)
+    return s.strip()
+
+
+def random_text(rng: random.Random, ascii_only: bool = False) -> str:
+    pool = ASCII if ascii_only else ALPHABET
+    return "".join(rng.choice(pool) for _ in range(rng.randint(0, 40)))
+
+
+def test_normalize_text_matches_nfkc():
+    rng = random.Random(SEED)
+    for _ in range(CASES):
+        s = random_text(rng, ascii_only=rng.random() < 0.3)
+        assert normalize_text(s) == baseline(s), repr(s)
+    assert normalize_text(None) == ""
+
+
+def test_normalize_blocks_matches_normalize_text():
+    rng = random.Random(SEED + 1)
+    for _ in range(CASES // 20):
+        blocks = [
+            None if rng.random() < 0.05 else random_text(rng, ascii_only=rng.random() < 0.5)
+            for _ in range(rng.randint(0, 20))
+        ]
+        assert normalize_blocks(blocks) == [baseline(b) for b in blocks], repr(blocks)
+
+
+def test_normalize_blocks_with_separator_in_text():
+    # bloco que já contém NFKC_SEP: cai no NFKC bloco a bloco
+    blocks = ["\ufb01" + NFKC_SEP + "x", "\u1100", "\u1161"]
+    assert normalize_blocks(blocks) == [baseline(b) for b in blocks]
+
+
+def test_separator_does_not_compose_with_neighbours():
+    # jamo L | jamo V: juntos compõem; separados por NFKC_SEP não
+    assert normalize_blocks(["ᄀ", "ᅡ"]) == ["ᄀ", "ᅡ"]
+    assert robot_depurar.normalize_text("가") == "가"
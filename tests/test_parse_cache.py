@@ -0,0 +1,44 @@
+import sqlite3
+
+import parse_cache
+from cpc_records import CpcEventRow
+from parse_cache import MISS, ParseCache
+
+
+def test_two_processes_share_one_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    a = ParseCache(path)
+    b = ParseCache(path)
+    a.put("k1", '{"x": 1}')
+    # sem transação pendurada em A, B escreve e enxerga o que A gravou
+    b.put("k2", None)
+    assert b.get("k1") == '{"x": 1}'
+    assert a.get("k2") is None
+    assert a.get("k3") is MISS
+
+
+def test_locked_file_never_fails_the_parse(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite")
+    monkeypatch.setattr(parse_cache, "BUSY_TIMEOUT_MS", 50)
+    cache = ParseCache(path)
+    cache.put("antiga", "{}")
+    monkeypatch.setattr(parse_cache, "get_cache", lambda: cache)
+
+    calls = []
+
+    def parse(rec):
+        calls.append(rec["id"])
+        return CpcEventRow(event_composite_key=rec["filename"])
+
+    wrapped = parse_cache.cached(parse, "p", "v1", CpcEventRow)
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    try:
+        assert cache.get("antiga") == "{}"  # leitura segue; o UPDATE do LRU é pulado
+        row = wrapped({"id": 1, "filename": "n20080130.txt-9"})
+        assert row["event_composite_key"] == "n20080130.txt-9"
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
+    assert calls == [1]
+    assert cache.errors >= 2
@@ -0,0 +1,19 @@
+from pipeline import changed_files, files_fingerprint
+
+
+def test_only_new_or_changed_files_are_selected():
+    last = {"files": {"a.txt": "t1\x00e1\x0010", "b.txt": "t1\x00e2\x0020", "gone.txt": "t0\x00e0\x005"}}
+    now = {"a.txt": "t1\x00e1\x0010", "b.txt": "t2\x00e3\x0021", "c.txt.gz": "t2\x00e4\x0030"}
+    assert changed_files(now, last) == ["b.txt", "c.txt.gz"]
+    assert changed_files(last["files"], last) == []
+
+
+def test_no_per_file_state_means_full_run():
+    assert changed_files({"a.txt": "x"}, {}) is None
+    assert changed_files({"a.txt": "x"}, {"fingerprint": "abc", "files": None}) is None
+
+
+def test_fingerprint_ignores_listing_order():
+    files = {"b.txt": "2", "a.txt": "1"}
+    assert files_fingerprint(files) == files_fingerprint(dict(sorted(files.items())))
+    assert files_fingerprint(files) != files_fingerprint({**files, "a.txt": "9"})